@@ -0,0 +1,197 @@
+"""
+ASGI serving mode for Resy Roulette
+Serves the same routes and templates as main.py, but awaits the backend instead
+of holding a waitress worker thread per spin, so one process keeps thousands of
+spins in flight. Spins beyond ASGI_MAX_INFLIGHT are turned away at once, which
+keeps memory bounded under overload. Run it with:
+
+    uvicorn asgi_app:app --host 0.0.0.0 --port 8000
+"""
+
+import os
+import secrets
+import logging
+import contextlib
+from urllib.parse import parse_qs
+from dotenv import load_dotenv
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.sessions import SessionMiddleware
+from starlette.responses import HTMLResponse, JSONResponse
+from starlette.routing import Route, Mount
+from starlette.staticfiles import StaticFiles
+from async_client import create_async_client, AsyncCoalescingClient
+from candidates import CandidateStore, query_key
+
+# Load environment variables from .env file
+load_dotenv()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+logger = logging.getLogger(__name__)
+
+# Same settings as main.py, plus the in-flight bound and connection pool of this mode
+config = dict(
+    RESY_BACKEND=os.environ.get('RESY_BACKEND', 'lambda'),
+    LAMBDA_API_URL=os.environ.get('LAMBDA_API_URL', 'http://localhost:3000'),
+    LAMBDA_CONNECT_TIMEOUT=float(os.environ.get('LAMBDA_CONNECT_TIMEOUT', 3.05)),
+    LAMBDA_READ_TIMEOUT=float(os.environ.get('LAMBDA_READ_TIMEOUT', 30)),
+    COALESCE_PICKS=int(os.environ.get('COALESCE_PICKS', 8)),
+    LOCAL_RESPINS=os.environ.get('LOCAL_RESPINS', 'true').lower() in ('1', 'true', 'yes'),
+    # Spins handled at once, further ones get a busy page instead of queueing without bound
+    ASGI_MAX_INFLIGHT=int(os.environ.get('ASGI_MAX_INFLIGHT', 4096)),
+    # Connections kept open to the Lambda API, spins beyond this many wait for one
+    LAMBDA_MAX_CONNECTIONS=int(os.environ.get('LAMBDA_MAX_CONNECTIONS', 512))
+)
+
+if config['RESY_BACKEND'] == 'lambda':
+    backend_client = create_async_client(
+        'lambda',
+        config['LAMBDA_API_URL'],
+        connect_timeout=config['LAMBDA_CONNECT_TIMEOUT'],
+        read_timeout=config['LAMBDA_READ_TIMEOUT'],
+        max_connections=config['LAMBDA_MAX_CONNECTIONS']
+    )
+else:
+    backend_client = create_async_client(config['RESY_BACKEND'], config['LAMBDA_API_URL'])
+if config['COALESCE_PICKS'] > 0:
+    backend_client = AsyncCoalescingClient(backend_client, picks=config['COALESCE_PICKS'])
+
+candidate_store = CandidateStore()
+
+
+def url_for(endpoint: str, **values) -> str:
+    """Flask's url_for for the static files the templates link, so they render unchanged"""
+    if endpoint != 'static':
+        raise ValueError(f"No route for {endpoint}")
+    return '/static/' + values['filename']
+
+
+# The Flask templates, rendered with the same autoescaping Flask applies to .html files
+templates = Environment(loader=FileSystemLoader(os.path.join(BASE_DIR, 'templates')),
+                        autoescape=select_autoescape(['html']))
+templates.globals['url_for'] = url_for
+
+
+def render_template(name: str, status_code: int = 200, **context) -> HTMLResponse:
+    return HTMLResponse(templates.get_template(name).render(**context), status_code=status_code)
+
+
+class InflightLimit:
+    """Counts spins in flight and turns new ones away at the limit. Only used on the event loop thread."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.inflight = 0
+        self.peak = 0
+        self.rejected = 0
+
+    def try_acquire(self) -> bool:
+        if self.inflight >= self.limit:
+            self.rejected += 1
+            return False
+        self.inflight += 1
+        self.peak = max(self.peak, self.inflight)
+        return True
+
+    def release(self):
+        self.inflight -= 1
+
+    def stats(self):
+        return {'inflight': self.inflight, 'peak': self.peak, 'rejected': self.rejected, 'limit': self.limit}
+
+
+spins = InflightLimit(config['ASGI_MAX_INFLIGHT'])
+
+
+async def index(request):
+    """Main page - accessible to everyone"""
+    return render_template('index.html')
+
+
+async def get_restaurant(request):
+    """Restaurant search - accessible to everyone"""
+    if not spins.try_acquire():
+        return render_template('retrieve.html', status_code=503, title="Restaurant",
+                               restaurant="The service is busy. Please try again.")
+    try:
+        # Form posts from index.html are URL encoded, parsed here without the multipart dependency
+        form = {key: values[0] for key, values in
+                parse_qs((await request.body()).decode(), keep_blank_values=True).items()}
+        date = form['date']
+        party_size = form['party_size']
+        time = form['time']
+        location_input = form['location']
+        cuisines_input = form['cuisines']
+
+        # Re-spins of a search this session already ran are drawn from its candidate set, without repeats
+        search = query_key(date, party_size, time, location_input, cuisines_input)
+        if config['LOCAL_RESPINS']:
+            session_id = request.session.setdefault('sid', secrets.token_urlsafe(16))
+            candidate = candidate_store.draw(session_id, search)
+            if candidate is not None:
+                return render_template('retrieve.html', title="Restaurant", restaurant=candidate[1])
+
+        # Call the configured backend, the Lambda API or the in-process pipeline
+        result = await backend_client.get_restaurant(
+            date=date,
+            party_size=party_size.strip(),
+            time=time,
+            location=location_input,
+            cuisines=cuisines_input,
+            candidates=config['LOCAL_RESPINS']
+        )
+
+        if result and result.get('success'):
+            if result.get('candidates'):
+                candidate_store.put(session_id, search, result['candidates'], result.get('candidate_index'))
+            restaurant_name = result['restaurant']['name']
+            return render_template('retrieve.html', title="Restaurant", restaurant=restaurant_name)
+        else:
+            error_message = result.get('message', 'No restaurants found.') if result else 'Failed to connect to restaurant service.'
+            return render_template('retrieve.html', title="Restaurant", restaurant=error_message)
+
+    except Exception as e:
+        logger.error(f"Error in get_restaurant: {str(e)}")
+        return render_template('retrieve.html', title="Restaurant", restaurant="An error occurred. Please try again.")
+    finally:
+        spins.release()
+
+
+async def health_check(request):
+    """Health check endpoint to verify backend connectivity, served even when spins are at the limit"""
+    lambda_healthy = await backend_client.health_check()
+    return JSONResponse({
+        'flask_app': 'healthy',
+        'server': 'asgi',
+        'backend': config['RESY_BACKEND'],
+        'lambda_api': 'healthy' if lambda_healthy else 'unhealthy',
+        'lambda_api_url': config['LAMBDA_API_URL'],
+        'lambda_client': backend_client.stats(),
+        'candidate_sets': candidate_store.stats(),
+        'spins': spins.stats()
+    })
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    yield
+    await backend_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route('/', index),
+        Route('/index', index),
+        Route('/retrieve', get_restaurant, methods=['POST']),
+        Route('/health', health_check),
+        Mount('/static', StaticFiles(directory=os.path.join(BASE_DIR, 'static')), name='static'),
+    ],
+    # Signs the session cookie, which only holds the id of the session's candidate sets
+    middleware=[Middleware(SessionMiddleware, secret_key=os.environ.get('FLASK_SECRET_KEY') or secrets.token_hex(32))],
+    lifespan=lifespan
+)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(app, host="0.0.0.0", port=8000, log_level="warning")
@@ -0,0 +1,383 @@
+"""
+Async backend clients for Resy Roulette
+Same interface as LambdaClient, LocalClient and CoalescingClient, with awaitable
+methods, for the ASGI serving mode. Waiting on the backend costs a coroutine
+instead of a worker thread, so one process keeps thousands of spins in flight.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, Any, List, Optional
+
+import aiohttp
+
+from lambda_client import CircuitBreaker, CircuitOpenError
+from coalescing_client import _PickPool
+from candidates import query_key, batch_results
+
+
+class AsyncLambdaClient:
+    """Client for the deployed Lambda function over a pooled aiohttp session"""
+
+    def __init__(self, api_gateway_url: str, connect_timeout: float = 3.05,
+                 read_timeout: float = 30, max_connections: int = 512,
+                 breaker: Optional[CircuitBreaker] = None):
+        """
+        Initialize the async Lambda client. Requests are not hedged, so the hedge
+        settings of LambdaClient do not apply.
+
+        Args:
+            api_gateway_url: The API Gateway URL where your Lambda is deployed
+            connect_timeout: Seconds to wait for a connection to API Gateway, and for a free pooled connection.
+                             Waiting out the pool is local congestion, not a backend failure, so it
+                             does not count against the circuit breaker.
+            read_timeout: Seconds to wait for the Lambda response once connected
+            max_connections: Connections kept open to API Gateway. Spins beyond this
+                             many wait for a free connection.
+            breaker: Circuit breaker guarding the backend, a default one if not given
+        """
+        self.api_url = api_gateway_url.rstrip('/')
+        self.logger = logging.getLogger(__name__)
+        self.breaker = breaker or CircuitBreaker()
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        # sock_connect bounds only opening the socket; aiohttp's connect timeout would also cover the pool wait
+        self.timeout = aiohttp.ClientTimeout(total=None, sock_connect=connect_timeout, sock_read=read_timeout)
+        # Created on first use, since an aiohttp session belongs to the running event loop
+        self.session = None
+        self._slots = None
+        self._latencies = deque(maxlen=200)
+        self._counters = {'requests': 0, 'failures': 0, 'pool_timeouts': 0}
+
+    def _session(self) -> aiohttp.ClientSession:
+        if self.session is None:
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections),
+                timeout=self.timeout
+            )
+            # Spins wait for a free connection here rather than inside the connector, so the wait has its own timeout
+            self._slots = asyncio.Semaphore(self.max_connections)
+        return self.session
+
+    async def _post(self, path: str, payload: Dict[str, Any]) -> tuple:
+        """
+        Send a request through the circuit breaker. Connection errors, timeouts
+        5xx responses and any other error while sending count as failures. Timing
+        out while waiting for a free pooled connection does not, since the request
+        never reached the backend, and neither does the caller being cancelled.
+
+        Returns:
+            The response status and body text
+
+        Raises:
+            CircuitOpenError: If the breaker is open
+            aiohttp.ClientError, asyncio.TimeoutError: If the request failed
+        """
+        session = self._session()
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.connect_timeout)
+        except asyncio.TimeoutError:
+            self._counters['pool_timeouts'] += 1
+            raise
+        try:
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"Circuit open, skipping request to {path}")
+            self._counters['requests'] += 1
+            started = time.monotonic()
+            try:
+                async with session.post(f"{self.api_url}{path}", json=payload) as response:
+                    status, text = response.status, await response.text()
+            except asyncio.CancelledError:
+                # The caller went away, which says nothing about the backend, but a half-open trial must not stay taken
+                self.breaker.release_trial()
+                raise
+            except BaseException:
+                self._counters['failures'] += 1
+                self.breaker.record_failure()
+                raise
+        finally:
+            self._slots.release()
+        if status >= 500:
+            self._counters['failures'] += 1
+            self.breaker.record_failure()
+        else:
+            self._latencies.append(time.monotonic() - started)
+            self.breaker.record_success()
+        return status, text
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request, breaker and latency counters"""
+        stats = dict(self._counters)
+        stats['breaker_state'] = self.breaker.state
+        stats['breaker_opens'] = self.breaker.opens
+        stats['breaker_rejections'] = self.breaker.rejections
+        latencies = sorted(self._latencies)
+        stats['p95_ms'] = round(latencies[int(len(latencies) * 0.95)] * 1000, 1) if latencies else None
+        return stats
+
+    async def get_restaurant(self, date: str, party_size: int, time: str,
+                             location: str, cuisines: str, candidates: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get restaurant recommendation from Lambda
+
+        Args:
+            date: Date in YYYY-MM-DD format
+            party_size: Number of people, or a range such as "2-4"
+            time: Time in HH:MM format, or a window HH:MM-HH:MM
+            location: Location string
+            cuisines: Comma-separated cuisine types
+            candidates: Also return the searched venues as a candidate set token, for local re-spins
+
+        Returns:
+            Dictionary with restaurant data or None if failed
+        """
+        payload = {
+            "date": date,
+            "party_size": party_size,
+            "time": time,
+            "location": location,
+            "cuisines": cuisines
+        }
+        if candidates:
+            payload["candidates"] = True
+        try:
+            status, text = await self._post("/restaurant", payload)
+            if status != 200:
+                self.logger.error(f"Lambda request failed with status {status}: {text}")
+                return None
+            body_data = self._unwrap(json.loads(text))
+            if body_data is None:
+                return None
+            if body_data.get('success'):
+                return body_data
+            self.logger.warning(f"Lambda returned success=False: {body_data}")
+            return None
+
+        except CircuitOpenError as e:
+            self.logger.warning(str(e))
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Request to Lambda failed: {e!r}")
+            return None
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Failed to parse Lambda response: {e}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Unexpected error in async Lambda client: {e}")
+            return None
+
+    async def get_restaurants_batch(self, spins: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get several restaurant recommendations from Lambda in one request, see
+        LambdaClient.get_restaurants_batch.
+
+        Returns:
+            List with one result per spin, in order, or None if the request failed
+        """
+        try:
+            status, text = await self._post("/restaurants/batch", {"spins": spins})
+            if status != 200:
+                self.logger.error(f"Lambda batch request failed with status {status}: {text}")
+                return None
+            body_data = self._unwrap(json.loads(text))
+            if body_data is None or 'results' not in body_data:
+                self.logger.warning(f"Lambda batch returned no results: {body_data}")
+                return None
+            return batch_results(body_data)
+
+        except CircuitOpenError as e:
+            self.logger.warning(str(e))
+            return None
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self.logger.error(f"Batch request to Lambda failed: {e!r}")
+            return None
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Failed to parse Lambda batch response: {e}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Unexpected error in async Lambda client: {e}")
+            return None
+
+    def _unwrap(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Unwrap an API Gateway style response or return a direct Lambda response as is"""
+        if 'body' in result:
+            try:
+                return json.loads(result['body'])
+            except json.JSONDecodeError:
+                self.logger.error(f"Failed to parse Lambda body: {result['body']}")
+                return None
+        return result
+
+    async def health_check(self) -> bool:
+        """Check if the Lambda API is accessible"""
+        try:
+            async with self._session().get(f"{self.api_url}/health", timeout=aiohttp.ClientTimeout(total=10)) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+    async def aclose(self):
+        """Close the pooled connections"""
+        if self.session is not None:
+            await self.session.close()
+
+
+class ThreadedClient:
+    """
+    Awaitable wrapper around a blocking client, such as LocalClient, whose calls
+    run in the event loop's default executor. The wrapped client keeps its own
+    limits on work in flight.
+    """
+
+    def __init__(self, client):
+        """
+        Args:
+            client: The blocking client to wrap
+        """
+        self.client = client
+
+    async def get_restaurant(self, **spin) -> Optional[Dict[str, Any]]:
+        """Get restaurant recommendation, see the wrapped client"""
+        return await asyncio.to_thread(lambda: self.client.get_restaurant(**spin))
+
+    async def get_restaurants_batch(self, spins: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Get several restaurant recommendations, see the wrapped client"""
+        return await asyncio.to_thread(self.client.get_restaurants_batch, spins)
+
+    async def health_check(self) -> bool:
+        """Check the wrapped client's backend"""
+        return await asyncio.to_thread(self.client.health_check)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the wrapped client's counters"""
+        return self.client.stats()
+
+    async def aclose(self):
+        pass
+
+
+class _Flight:
+    """One shared batch request, with a seat for each caller it hands a pick to"""
+
+    __slots__ = ('task', 'pool', 'seats')
+
+    def __init__(self, task: asyncio.Future, seats: int):
+        self.task = task
+        self.pool = None
+        self.seats = seats
+
+
+class AsyncCoalescingClient:
+    """Async counterpart of CoalescingClient: identical concurrent spins share one batch request"""
+
+    def __init__(self, client, picks: int = 8):
+        """
+        Args:
+            client: The async client to send requests through
+            picks: Independent picks requested per shared search. Callers beyond
+                   this many in one burst start the next shared search.
+        """
+        self.client = client
+        self.picks = max(1, picks)
+        self._inflight = {}
+        self._active = {}
+        self._calls = 0
+        self._shared = 0
+        self._solo = 0
+
+    async def get_restaurant(self, date: str, party_size: int, time: str,
+                             location: str, cuisines: str, candidates: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get restaurant recommendation, sharing the backend request with identical
+        spins already in flight. A spin arriving alone is sent on its own, see
+        CoalescingClient.get_restaurant.
+
+        Returns:
+            Dictionary with restaurant data or None if failed
+        """
+        payload = {
+            "date": date,
+            "party_size": party_size,
+            "time": time,
+            "location": location,
+            "cuisines": cuisines
+        }
+        if candidates:
+            payload["candidates"] = True
+        key = query_key(date, party_size, time, location, cuisines) + (candidates,)
+
+        # All callers run on the event loop thread, so the in-flight maps need no lock
+        alone = not self._active.get(key)
+        self._active[key] = self._active.get(key, 0) + 1
+        try:
+            if alone:
+                self._solo += 1
+                return await self.client.get_restaurant(**payload)
+
+            flight = self._inflight.get(key)
+            if flight is None or not flight.seats:
+                # No batch in flight, or every seat in it is taken: start the next one
+                self._calls += 1
+                flight = _Flight(asyncio.ensure_future(self.client.get_restaurants_batch([payload] * self.picks)),
+                                 self.picks)
+                self._inflight[key] = flight
+                flight.task.add_done_callback(
+                    lambda _, flight=flight: self._inflight.pop(key) if self._inflight.get(key) is flight else None)
+            else:
+                self._shared += 1
+            flight.seats -= 1
+            # Shielded so a caller that disconnects does not cancel the request its peers are waiting on
+            results = await asyncio.shield(flight.task)
+            if flight.pool is None:
+                flight.pool = _PickPool(results)
+
+            # Every caller holds a seat, so a pick is left for it unless the batch came back short
+            available, result = flight.pool.take()
+            if available and result and result.get('success'):
+                return result
+            return None
+        finally:
+            self._active[key] -= 1
+            if not self._active[key]:
+                del self._active[key]
+
+    async def get_restaurants_batch(self, spins: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Get several restaurant recommendations, see the wrapped client"""
+        return await self.client.get_restaurants_batch(spins)
+
+    async def health_check(self) -> bool:
+        """Check the wrapped client's backend"""
+        return await self.client.health_check()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the wrapped client's counters with coalescing counters added"""
+        stats = self.client.stats()
+        stats['coalescing'] = {"calls": self._calls, "shared": self._shared, "solo": self._solo,
+                               "inflight": len(self._inflight)}
+        return stats
+
+    async def aclose(self):
+        await self.client.aclose()
+
+
+def create_async_client(backend: str, api_gateway_url: str, **lambda_options):
+    """
+    Create the backend client for the ASGI app.
+
+    Args:
+        backend: "lambda" to call the deployed Lambda over HTTP, "local" to run in process
+        api_gateway_url: API Gateway URL, used by the lambda backend
+        lambda_options: Extra keyword arguments for AsyncLambdaClient
+
+    Returns:
+        AsyncLambdaClient, or a ThreadedClient around LocalClient
+    """
+    if backend == 'local':
+        from local_client import create_client
+        return ThreadedClient(create_client('local', api_gateway_url))
+    if backend == 'lambda':
+        return AsyncLambdaClient(api_gateway_url, **lambda_options)
+    raise ValueError(f"Unknown backend {backend}, expected 'lambda' or 'local'")
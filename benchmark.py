@@ -0,0 +1,323 @@
+"""Offline benchmark suite for Resy Roulette. Runs a seeded workload of spins against the retrieval pipeline
+(ResyRetriever.get_restaurants), the Lambda handler and the Flask /retrieve route, with the Resy api and GeoNames
+replaced by the fakes in fake_resy, and reports throughput, latency percentiles, upstream calls and allocations.
+The parse target decodes venue search pages built from the fixtures, with json.loads and with the streaming decoder
+in venuesearch, and reports parse time and peak memory per page; use --detail or recorded fixtures for full size hits.
+
+Results are written as JSON with the commit, interpreter and settings they were measured with, so runs on different
+commits can be compared:
+
+    python benchmark.py --targets retriever,handler,flask --concurrency 8 --output before.json
+    python benchmark.py --targets retriever,handler,flask --concurrency 8 --compare before.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import platform
+import argparse
+import subprocess
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+TARGETS = ("retriever", "handler", "flask", "parse")
+
+LOCATIONS = ("New York City, New York", "Brooklyn, NY", "Chicago, IL", "San Francisco, CA", "Hoboken, NJ",
+             "Jersey City, NJ")
+TIMES = ("", "18:00", "19:00", "20:30")
+
+def _prepare_environment(args):
+    """Sets the environment the app modules read at import time. Called before any of them is imported."""
+    for name in ("AUTHORIZATION", "XRESYAUTHTOKEN", "XRESYUNIVERSALAUTH"):
+        os.environ.setdefault(name, "benchmark")
+    os.environ["RESY_SEARCH_CACHE"] = args.cache
+    os.environ["RESY_RATE_LIMIT"] = str(args.rate_limit)
+    os.environ["RESY_BACKEND"] = "local"
+    os.environ.setdefault("RESY_LOG_FILE", os.devnull)
+
+def build_workload(count:int, seed:int, cuisines) -> list[dict]:
+    """Builds a reproducible list of spin requests.
+
+    :param int count: number of spins
+    :param int seed: seed for the workload, the same seed gives the same spins
+    :param Sequence[str] cuisines: cuisines to draw from
+    :return list[dict]: spin requests with date, time, party_size, location and cuisines
+    """
+    rng = random.Random(seed)
+    spins = []
+    for _ in range(count):
+        spins.append({
+            "date": f"2025-06-{rng.randint(1, 28):02d}",
+            "time": rng.choice(TIMES),
+            "party_size": rng.randint(1, 6),
+            "location": rng.choice(LOCATIONS),
+            "cuisines": ",".join(rng.sample(list(cuisines), rng.randint(1, 4))),
+        })
+    return spins
+
+def _retriever_target():
+    from retrieve import ResyRetriever
+
+    def run(spin:dict) -> bool:
+        retriever = ResyRetriever(date=spin["date"], time=spin["time"], party_size=spin["party_size"],
+                                  location=ResyRetriever.get_location(spin["location"]),
+                                  cuisine_list=spin["cuisines"].split(","))
+        retriever.randomize_restaurants(retriever.get_restaurants())
+        return True
+    return run
+
+def _handler_target():
+    from lambda_function import lambda_handler
+
+    def run(spin:dict) -> bool:
+        response = lambda_handler({"httpMethod": "POST", "path": "/restaurant", "body": json.dumps(spin)}, None)
+        return response["statusCode"] == 200 and json.loads(response["body"]).get("success", False)
+    return run
+
+def _flask_target():
+    import threading
+    from main import app
+
+    local = threading.local()
+
+    def run(spin:dict) -> bool:
+        # Flask test clients are not shared between threads
+        client = getattr(local, "client", None)
+        if client is None:
+            client = local.client = app.test_client()
+        response = client.post("/retrieve", data=spin)
+        return response.status_code == 200 and b"An error occurred" not in response.data
+    return run
+
+def percentile(sorted_values:list, fraction:float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values) + 0.5)) - 1))
+    return sorted_values[rank]
+
+def measure(run, spins:list, concurrency:int) -> dict:
+    """Runs the spins at the given concurrency and measures each one.
+
+    :param Callable[[dict], bool] run: target under test, returns whether the spin succeeded
+    :param list[dict] spins: spin requests
+    :param int concurrency: spins in flight at once
+    :return dict: throughput, latency percentiles and failure count
+    """
+    def timed(spin):
+        started = time.perf_counter()
+        try:
+            ok = run(spin)
+        except Exception:
+            ok = False
+        return time.perf_counter() - started, ok
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        outcomes = list(executor.map(timed, spins))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    return {
+        "requests": len(spins),
+        "failures": sum(1 for _, ok in outcomes if not ok),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(spins) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+    }
+
+def measure_allocations(run, spins:list) -> dict:
+    """Runs the spins one at a time under tracemalloc. Kept apart from the latency pass, which tracing would slow.
+
+    :param Callable[[dict], bool] run: target under test
+    :param list[dict] spins: spin requests
+    :return dict: mean and max peak allocation per spin, and memory retained per spin, in KiB
+    """
+    tracemalloc.start()
+    try:
+        peaks = []
+        baseline = tracemalloc.get_traced_memory()[0]
+        for spin in spins:
+            before = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+            try:
+                run(spin)
+            except Exception:
+                pass
+            peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        retained = tracemalloc.get_traced_memory()[0] - baseline
+    finally:
+        tracemalloc.stop()
+    return {
+        "alloc_peak_kib_mean": round(sum(peaks) / len(peaks) / 1024, 1) if peaks else 0.0,
+        "alloc_peak_kib_max": round(max(peaks) / 1024, 1) if peaks else 0.0,
+        "retained_kib_per_request": round(retained / max(1, len(spins)) / 1024, 2),
+    }
+
+def measure_parse(fixtures:dict, per_page:int, repeat:int) -> dict:
+    """Decodes venue search pages built from the fixtures, as whole documents with json.loads and as streams with
+    venuesearch.parse_venuesearch, each reduced to venue rows.
+
+    :param dict fixtures: fixtures with cuisines
+    :param int per_page: hits per page
+    :param int repeat: times each page is decoded for the timings
+    :return dict: for "parse_json" and "parse_stream", parse time percentiles per page and peak allocation per page
+    """
+    from venue import venue_row
+    from venuesearch import CHUNK_SIZE, parse_venuesearch
+
+    pages = []
+    for hits in fixtures["cuisines"].values():
+        for start in range(0, len(hits), per_page):
+            body = json.dumps({"search": {"hits": hits[start:start + per_page], "nbHits": len(hits)},
+                               "meta": {"total": len(hits)}}).encode()
+            pages.append([body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)])
+
+    def whole(chunks):
+        payload = json.loads(b"".join(chunks))
+        return [venue_row(hit) for hit in payload["search"]["hits"]]
+
+    results = {}
+    for name, decode in (("parse_json", whole), ("parse_stream", parse_venuesearch)):
+        timings = []
+        for chunks in pages:
+            for _ in range(repeat):
+                started = time.perf_counter()
+                decode(chunks)
+                timings.append((time.perf_counter() - started) * 1000)
+        peaks = []
+        tracemalloc.start()
+        try:
+            for chunks in pages:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                decode(chunks)
+                peaks.append(tracemalloc.get_traced_memory()[1] - before)
+        finally:
+            tracemalloc.stop()
+        timings.sort()
+        results[name] = {
+            "requests": len(pages),
+            "page_kib_mean": round(sum(sum(len(chunk) for chunk in chunks) for chunks in pages) / len(pages) / 1024, 1),
+            "p50_ms": round(percentile(timings, 0.50), 3),
+            "p95_ms": round(percentile(timings, 0.95), 3),
+            "p99_ms": round(percentile(timings, 0.99), 3),
+            "alloc_peak_kib_mean": round(sum(peaks) / len(peaks) / 1024, 1),
+            "alloc_peak_kib_max": round(max(peaks) / 1024, 1),
+        }
+    return results
+
+def _commit() -> str:
+    """Returns the checked out commit, marked dirty if the tree has changes, or None outside a git checkout."""
+    directory = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=directory, capture_output=True,
+                                text=True, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"], cwd=directory,
+                               capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+def compare(current:dict, baseline:dict):
+    """Prints each target's change against a baseline run."""
+    if current["config"] != baseline["config"]:
+        print("Warning: baseline was measured with different settings, deltas are not like for like")
+    print(f"\nCompared with {baseline.get('commit')}:")
+    for target, result in current["results"].items():
+        before = baseline["results"].get(target)
+        if before is None:
+            continue
+        deltas = []
+        for metric in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "alloc_peak_kib_mean", "upstream_calls_per_request"):
+            if before.get(metric) and metric in result:
+                change = (result[metric] - before[metric]) / before[metric] * 100
+                deltas.append(f"{metric} {before[metric]} -> {result[metric]} ({change:+.1f}%)")
+        print(f"  {target}: " + ", ".join(deltas))
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Resy Roulette offline against a fake Resy api")
+    parser.add_argument("--targets", default=",".join(TARGETS), help="comma separated subset of " + ", ".join(TARGETS))
+    parser.add_argument("--requests", type=int, default=200, help="spins measured per target")
+    parser.add_argument("--concurrency", type=int, default=8, help="spins in flight at once")
+    parser.add_argument("--warmup", type=int, default=10, help="spins run before measuring")
+    parser.add_argument("--alloc-requests", type=int, default=20, help="spins run under tracemalloc, 0 to skip")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the workload, fixtures and injected errors")
+    parser.add_argument("--fixtures", help="fixture file recorded with fake_resy.py, defaults to synthetic fixtures")
+    parser.add_argument("--detail", action="store_true", help="generate full size synthetic hits, as the live api returns")
+    parser.add_argument("--per-page", type=int, default=20, help="hits per venue search page of the parse target")
+    parser.add_argument("--latency-ms", type=float, default=40, help="base latency of each fake Resy response")
+    parser.add_argument("--jitter-ms", type=float, default=20, help="extra random latency of each fake Resy response")
+    parser.add_argument("--geocode-latency-ms", type=float, default=150, help="latency of each fake GeoNames call")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of Resy requests answered with a 500")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of Resy requests answered with a 429")
+    parser.add_argument("--geo-filter", action="store_true",
+                        help="serve only hits inside each query's circle, nearest first, e.g. to measure tiled search")
+    parser.add_argument("--cache", default="off", help="RESY_SEARCH_CACHE setting: off, memory or sqlite:<path>")
+    parser.add_argument("--rate-limit", type=float, default=0, help="RESY_RATE_LIMIT for the upstream scheduler, 0 for none")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--compare", help="results file of an earlier run to compare against")
+    args = parser.parse_args(argv)
+
+    targets = [target.strip() for target in args.targets.split(",") if target.strip()]
+    for target in targets:
+        if target not in TARGETS:
+            parser.error(f"unknown target {target}")
+
+    _prepare_environment(args)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import fake_resy
+    from retrieve import ResyRetriever
+
+    cuisines = ResyRetriever.applicable_cuisine_list
+    fixtures = (fake_resy.load_fixtures(args.fixtures) if args.fixtures
+                else fake_resy.synthetic_fixtures(cuisines, args.seed, detail=args.detail))
+    adapter = fake_resy.install(fixtures, geocode_latency_ms=args.geocode_latency_ms, latency_ms=args.latency_ms,
+                                jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+                                throttle_rate=args.throttle_rate, seed=args.seed, geo_filter=args.geo_filter)
+
+    factories = {"retriever": _retriever_target, "handler": _handler_target, "flask": _flask_target}
+    config = {key: value for key, value in vars(args).items() if key not in ("targets", "output", "compare")}
+    report = {"commit": _commit(), "python": platform.python_version(), "platform": platform.platform(),
+              "config": config, "results": {}}
+
+    for target in targets:
+        if target == "parse":
+            for name, result in measure_parse(fixtures, args.per_page, max(1, args.requests // 20)).items():
+                report["results"][name] = result
+                print(f"{name:>12}: {result['page_kib_mean']}KiB pages  p50 {result['p50_ms']:.2f}ms  "
+                      f"p99 {result['p99_ms']:.2f}ms  alloc peak {result['alloc_peak_kib_mean']}KiB "
+                      f"(max {result['alloc_peak_kib_max']}KiB)")
+            continue
+        run = factories[target]()
+        spins = build_workload(args.warmup + args.requests + args.alloc_requests, args.seed, fixtures["cuisines"])
+        for spin in spins[:args.warmup]:
+            run(spin)
+
+        calls_before = adapter.stats["requests"]
+        result = measure(run, spins[args.warmup:args.warmup + args.requests], args.concurrency)
+        result["upstream_calls_per_request"] = round((adapter.stats["requests"] - calls_before) / args.requests, 2)
+        if args.alloc_requests:
+            result.update(measure_allocations(run, spins[args.warmup + args.requests:]))
+        report["results"][target] = result
+
+        print(f"{target:>9}: {result['throughput_rps']:>8.1f} req/s  p50 {result['p50_ms']:.1f}ms  "
+              f"p95 {result['p95_ms']:.1f}ms  p99 {result['p99_ms']:.1f}ms  failures {result['failures']}  "
+              f"upstream/req {result['upstream_calls_per_request']}"
+              + (f"  alloc peak {result['alloc_peak_kib_mean']}KiB" if args.alloc_requests else ""))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+    return report
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""Candidate sets: the full list of venues behind a spin, shipped back with the pick so the Flask tier can serve
+re-spins of the same search without another backend request.
+
+The Lambda encodes the search's venue rows as a compact token (zlib compressed JSON, base64url encoded) with an
+expiry matching the search cache TTL. The Flask tier keeps decoded sets per browser session in a CandidateStore and
+draws from them without repeats, in O(1) per draw, until the set is used up or expires."""
+
+import os
+import json
+import time
+import zlib
+import base64
+import random
+import threading
+from collections import OrderedDict
+
+DEFAULT_TTL = float(os.environ.get("RESY_CANDIDATE_TTL", 300))
+DEFAULT_MAX_SETS = int(os.environ.get("RESY_CANDIDATE_MAX_SETS", 4096))
+# Largest decoded token accepted, in bytes, so a corrupt or hostile token cannot inflate without bound
+MAX_TOKEN_BYTES = int(os.environ.get("RESY_CANDIDATE_MAX_TOKEN_BYTES", 8 << 20))
+
+TOKEN_VERSION = 1
+
+def encode_candidates(rows:list, ttl:float = DEFAULT_TTL) -> str:
+    """Encodes venue rows as a candidate set token.
+
+    :param list[list] rows: venue rows, see venue.venue_row
+    :param float ttl: seconds the set stays valid
+    :return str: base64url token
+    """
+    document = {"v": TOKEN_VERSION, "exp": int(time.time() + ttl), "rows": rows}
+    data = json.dumps(document, separators=(",", ":"), ensure_ascii=False).encode()
+    return base64.urlsafe_b64encode(zlib.compress(data, 6)).decode("ascii")
+
+def decode_candidates(token:str) -> tuple[list, float]:
+    """Decodes a candidate set token.
+
+    :param str token: token from encode_candidates
+    :raises ValueError: if the token is malformed, too large, of another version, or expired
+    :return tuple[list[list], float]: venue rows, and the epoch time the set expires at
+    """
+    if len(token) > MAX_TOKEN_BYTES:
+        raise ValueError("Candidate set token is too large")
+    decompressor = zlib.decompressobj()
+    try:
+        data = decompressor.decompress(base64.urlsafe_b64decode(token.encode("ascii")), MAX_TOKEN_BYTES)
+    except (ValueError, zlib.error) as e:
+        raise ValueError(f"Malformed candidate set token: {e}") from e
+    if decompressor.unconsumed_tail:
+        raise ValueError("Candidate set token is too large")
+    try:
+        if not decompressor.eof:
+            raise ValueError("truncated data")
+        document = json.loads(data)
+        version, expires_at, rows = document["v"], float(document["exp"]), document["rows"]
+    except (ValueError, TypeError, KeyError) as e:
+        raise ValueError(f"Malformed candidate set token: {e}") from e
+    if not isinstance(rows, list):
+        raise ValueError("Malformed candidate set token: rows are not a list")
+    if version != TOKEN_VERSION:
+        raise ValueError(f"Unsupported candidate set token version {version}")
+    if expires_at <= time.time():
+        raise ValueError("Candidate set token has expired")
+    return rows, expires_at
+
+def query_key(date:str, party_size, time:str, location:str, cuisines:str) -> tuple:
+    """Normalizes a spin's parameters, so the same search typed slightly differently shares a key.
+
+    :return tuple: date, party size or range, time or time window, location and cuisines, normalized
+    """
+    return (date.strip(), ''.join(str(party_size).split()), ''.join(time.split()), ' '.join(location.lower().split()),
+            ','.join(cuisine.strip() for cuisine in cuisines.split(',')))
+
+def batch_results(body:dict) -> list:
+    """Returns the results of a batch response with their candidate set tokens in place. A batch sends each
+    search's token once, and the results drawn from it refer to it by position, see lambda_function.run_batch.
+
+    :param dict body: batch response with results and candidate_sets
+    :return list[dict]: one result per spin, with candidates set on those that asked for them
+    """
+    candidate_sets = body.get("candidate_sets") or []
+    for result in body["results"]:
+        if result.get("candidate_set") is not None:
+            result["candidates"] = candidate_sets[result.pop("candidate_set")]
+    return body["results"]
+
+class CandidateSet(object):
+    """Venue rows of one search, drawn at random without repeats. Once every row has been drawn, the next draw
+    starts over."""
+
+    __slots__ = ("rows", "expires_at", "_remaining")
+
+    def __init__(self, rows:list, expires_at:float):
+        self.rows = rows
+        self.expires_at = expires_at
+        self._remaining = list(range(len(rows)))
+
+    def discard(self, index:int):
+        """Removes a row that was already shown, e.g. the backend's own pick."""
+        if index in self._remaining:
+            self._remaining.remove(index)
+
+    def draw(self) -> list:
+        """Returns a random row not drawn since the last start over.
+
+        :return list | None: venue row, or None if the set is empty
+        """
+        if not self.rows:
+            return None
+        if not self._remaining:
+            self._remaining = list(range(len(self.rows)))
+        # Swap the drawn index with the last one so removal is O(1)
+        position = random.randrange(len(self._remaining))
+        self._remaining[position], self._remaining[-1] = self._remaining[-1], self._remaining[position]
+        return self.rows[self._remaining.pop()]
+
+class CandidateStore(object):
+    """Per-session candidate sets held by the Flask tier, bounded in number and expired with their tokens.
+
+    Attributes:
+        max_sets (int): Most sets held before the least recently used is dropped.
+    """
+
+    def __init__(self, max_sets:int = DEFAULT_MAX_SETS):
+        self.max_sets = max_sets
+        self._sets = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {"stored": 0, "local_draws": 0, "misses": 0, "expired": 0, "rejected_tokens": 0}
+
+    def put(self, session_id:str, key:tuple, token:str, shown:int = None) -> bool:
+        """Stores the candidate set of a search for a session.
+
+        :param str session_id: browser session
+        :param tuple key: query key from query_key
+        :param str token: candidate set token returned by the backend
+        :param int shown: index of the row already shown to the user, excluded from the next draws
+        :return bool: whether the token was valid and stored
+        """
+        try:
+            rows, expires_at = decode_candidates(token)
+        except ValueError:
+            with self._lock:
+                self._counters["rejected_tokens"] += 1
+            return False
+        candidate_set = CandidateSet(rows, expires_at)
+        if shown is not None:
+            candidate_set.discard(shown)
+        with self._lock:
+            self._sets[(session_id, key)] = candidate_set
+            self._sets.move_to_end((session_id, key))
+            self._counters["stored"] += 1
+            while len(self._sets) > self.max_sets:
+                self._sets.popitem(last=False)
+        return True
+
+    def draw(self, session_id:str, key:tuple) -> list:
+        """Draws the next venue for a re-spin of a search, if the session holds a live set for it.
+
+        :param str session_id: browser session
+        :param tuple key: query key from query_key
+        :return list | None: venue row, or None if the backend has to be asked
+        """
+        with self._lock:
+            candidate_set = self._sets.get((session_id, key))
+            if candidate_set is None:
+                self._counters["misses"] += 1
+                return None
+            if candidate_set.expires_at <= time.time():
+                del self._sets[(session_id, key)]
+                self._counters["expired"] += 1
+                return None
+            self._sets.move_to_end((session_id, key))
+            row = candidate_set.draw()
+            if row is not None:
+                self._counters["local_draws"] += 1
+            return row
+
+    def stats(self) -> dict:
+        """Reports how many re-spins were served locally.
+
+        :return dict: sets stored, local draws, misses, expired sets, rejected tokens and sets held
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["sets"] = len(self._sets)
+        return stats
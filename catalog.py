@@ -0,0 +1,264 @@
+"""Local catalog of Resy venues. A venue's name, cuisine and position barely change from day to day, only its
+availability does, so every venue search page is also written here, and spins in an area the catalog covers pick their
+candidates locally instead of searching Resy. Only the venue finally picked is checked upstream for availability.
+
+The catalog is a SQLite database with an R-tree over venue positions and an index of the cuisines each venue was
+found under. Where SQLite is built without the R-tree module, a plain index on latitude and longitude is used instead.
+An area counts as covered for a cuisine, date and party size once a full search of it completed within
+RESY_CATALOG_COVERAGE_TTL seconds, with areas quantized like search cache keys. Searches only return venues with
+availability, so coverage of one date or party size says nothing about the venues free for another. Venues not seen in
+a search for RESY_CATALOG_MAX_AGE seconds are no longer served. The shared catalog is configured through RESY_CATALOG,
+e.g. "off", "memory" or "sqlite:/tmp/resy_catalog.db"."""
+
+import os
+import math
+import time
+import sqlite3
+import threading
+import logging
+import geocode
+from search_cache import quantize_geo
+from venue import Venue
+
+DEFAULT_CATALOG = os.environ.get("RESY_CATALOG", "off")
+DEFAULT_COVERAGE_TTL = float(os.environ.get("RESY_CATALOG_COVERAGE_TTL", 24 * 3600))
+DEFAULT_MAX_AGE = float(os.environ.get("RESY_CATALOG_MAX_AGE", 30 * 24 * 3600))
+
+METERS_PER_DEGREE = 111320
+
+class VenueCatalog(object):
+    """Venues seen in Resy searches, indexed by position and cuisine. Thread-safe.
+
+    Attributes:
+        path (str): Database file, or ":memory:" for a catalog private to the process.
+        coverage_ttl (float): Seconds a completed search keeps its area and cuisine covered.
+        max_age (float): Seconds a venue is served after it was last seen in a search.
+        rtree (bool): Whether positions are indexed with an R-tree rather than a plain index.
+    """
+
+    def __init__(self, path:str = ":memory:", coverage_ttl:float = DEFAULT_COVERAGE_TTL,
+                 max_age:float = DEFAULT_MAX_AGE):
+        """Constructor Method
+
+        Args:
+            path (str, optional): Database file. Defaults to an in-memory catalog.
+            coverage_ttl (float, optional): Seconds an area stays covered after a full search. Defaults to a day.
+            max_age (float, optional): Seconds a venue is served after it was last seen. Defaults to 30 days.
+        """
+        self.path = path
+        self.coverage_ttl = coverage_ttl
+        self.max_age = max_age
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._counters = {"venues_written": 0, "lookups": 0, "covered": 0, "uncovered": 0, "write_errors": 0}
+
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        if path != ":memory:":
+            self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS venues (rowid INTEGER PRIMARY KEY, key TEXT UNIQUE NOT NULL, "
+                                 "id, name TEXT, cuisine TEXT, latitude REAL, longitude REAL, seen_at REAL NOT NULL)")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS venue_cuisines (cuisine TEXT NOT NULL, venue INTEGER NOT NULL, "
+                                 "PRIMARY KEY (cuisine, venue)) WITHOUT ROWID")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS search_coverage "
+                                 "(area TEXT NOT NULL, cuisine TEXT NOT NULL, day TEXT NOT NULL, party_size INTEGER NOT NULL, "
+                                 "searched_at REAL NOT NULL, PRIMARY KEY (area, cuisine, day, party_size)) WITHOUT ROWID")
+        try:
+            self._connection.execute("CREATE VIRTUAL TABLE IF NOT EXISTS venue_positions "
+                                     "USING rtree(id, min_lat, max_lat, min_lng, max_lng)")
+            self.rtree = True
+        except sqlite3.OperationalError:
+            self._connection.execute("CREATE INDEX IF NOT EXISTS venues_position ON venues (latitude, longitude)")
+            self.rtree = False
+
+    def _count(self, name:str, amount:int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def add(self, rows:list, cuisine:str, seen_at:float = None):
+        """Records the venues of one search page, inserting new ones and refreshing known ones. Venues without a
+        position cannot be looked up and are skipped. Failed writes are logged, so they never fail a search.
+
+        :param list[list] rows: venue rows, see venue.venue_row
+        :param str cuisine: cuisine the page was searched for
+        :param float seen_at: time the venues were seen, defaults to now
+        """
+        seen_at = time.time() if seen_at is None else seen_at
+        cuisine = cuisine.lower()
+        written = 0
+        try:
+            with self._lock:
+                self._connection.execute("BEGIN")
+                try:
+                    for row in rows:
+                        venue = Venue.from_row(row[:5])
+                        if venue.latitude is None or venue.longitude is None:
+                            continue
+                        key = str(venue.key())
+                        self._connection.execute(
+                            "INSERT INTO venues (key, id, name, cuisine, latitude, longitude, seen_at) "
+                            "VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (key) DO UPDATE SET name = excluded.name, "
+                            "cuisine = excluded.cuisine, latitude = excluded.latitude, "
+                            "longitude = excluded.longitude, seen_at = excluded.seen_at",
+                            (key, venue.id, venue.name, venue.cuisine, venue.latitude, venue.longitude, seen_at))
+                        rowid = self._connection.execute("SELECT rowid FROM venues WHERE key = ?", (key,)).fetchone()[0]
+                        self._connection.execute("INSERT OR IGNORE INTO venue_cuisines VALUES (?, ?)", (cuisine, rowid))
+                        if self.rtree:
+                            self._connection.execute("INSERT OR REPLACE INTO venue_positions VALUES (?, ?, ?, ?, ?)",
+                                                     (rowid, venue.latitude, venue.latitude,
+                                                      venue.longitude, venue.longitude))
+                        written += 1
+                    self._connection.execute("COMMIT")
+                except BaseException:
+                    self._connection.execute("ROLLBACK")
+                    raise
+                self._counters["venues_written"] += written
+        except sqlite3.Error as e:
+            self._count("write_errors")
+            self.logger.error("Writing %d venues to the catalog failed: %s", len(rows), str(e))
+
+    def cover(self, location:dict, cuisine:str, day:str, party_size:int, searched_at:float = None):
+        """Marks an area as covered for a cuisine, date and party size after a full search of it completed.
+
+        :param dict location: searched location with latitude, longitude and radius
+        :param str cuisine: cuisine searched for
+        :param str day: date searched for, YYYY-MM-DD
+        :param int party_size: party size searched for
+        :param float searched_at: time of the search, defaults to now
+        """
+        searched_at = time.time() if searched_at is None else searched_at
+        try:
+            with self._lock:
+                self._connection.execute("INSERT OR REPLACE INTO search_coverage VALUES (?, ?, ?, ?, ?)",
+                                         (quantize_geo(location), cuisine.lower(), day, int(party_size), searched_at))
+        except sqlite3.Error as e:
+            self._count("write_errors")
+            self.logger.error("Recording catalog coverage failed: %s", str(e))
+
+    def covers(self, locations:list, cuisines:list, day:str, party_size:int) -> bool:
+        """Checks whether every cuisine was searched recently in every area for the date and party size, so the
+        catalog can stand in for the searches.
+
+        :param list[dict] locations: areas a search would cover, with latitude, longitude and radius
+        :param list[str] cuisines: cuisines a search would cover
+        :param str day: date of the search, YYYY-MM-DD
+        :param int party_size: party size of the search
+        :return bool: True if the catalog covers all of them
+        """
+        oldest = time.time() - self.coverage_ttl
+        areas = {quantize_geo(location) for location in locations}
+        wanted = {cuisine.lower() for cuisine in cuisines}
+        with self._lock:
+            found = 0
+            for area in areas:
+                found += self._connection.execute(
+                    "SELECT COUNT(*) FROM search_coverage WHERE area = ? AND day = ? AND party_size = ? "
+                    f"AND searched_at >= ? AND cuisine IN ({', '.join('?' * len(wanted))})",
+                    (area, day, int(party_size), oldest, *wanted)).fetchone()[0]
+        covered = found == len(areas) * len(wanted)
+        self._count("covered" if covered else "uncovered")
+        return covered
+
+    def candidates(self, location:dict, cuisines:list) -> list[list[Venue]]:
+        """Looks up the venues of each cuisine within the location's circle.
+
+        :param dict location: location with latitude, longitude and radius
+        :param list[str] cuisines: cuisines to look up
+        :return list[list[Venue]]: venues per cuisine, in the order of cuisines, each nearest first
+        """
+        latitude, longitude = location["latitude"], location["longitude"]
+        radius = location.get("radius", geocode.DEFAULT_RADIUS)
+        # Bounding box of the circle, refined to the circle below
+        lat_span = radius / METERS_PER_DEGREE
+        lng_span = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+        box = (latitude - lat_span, latitude + lat_span, longitude - lng_span, longitude + lng_span)
+        if self.rtree:
+            query = ("SELECT v.id, v.name, v.cuisine, v.latitude, v.longitude FROM venue_positions p "
+                     "JOIN venues v ON v.rowid = p.id JOIN venue_cuisines c ON c.venue = v.rowid "
+                     "WHERE p.min_lat >= ? AND p.max_lat <= ? AND p.min_lng >= ? AND p.max_lng <= ? "
+                     "AND c.cuisine = ? AND v.seen_at >= ?")
+        else:
+            query = ("SELECT v.id, v.name, v.cuisine, v.latitude, v.longitude FROM venues v "
+                     "JOIN venue_cuisines c ON c.venue = v.rowid "
+                     "WHERE v.latitude BETWEEN ? AND ? AND v.longitude BETWEEN ? AND ? "
+                     "AND c.cuisine = ? AND v.seen_at >= ?")
+        oldest = time.time() - self.max_age
+
+        found = []
+        with self._lock:
+            self._counters["lookups"] += 1
+            for cuisine in cuisines:
+                rows = self._connection.execute(query, (*box, cuisine.lower(), oldest)).fetchall()
+                located = [(geocode.distance_meters(latitude, longitude, row[3], row[4]), row) for row in rows]
+                found.append([Venue.from_row(row) for distance, row in sorted(located, key=lambda entry: entry[0])
+                              if distance <= radius])
+        return found
+
+    def prune(self) -> int:
+        """Deletes venues that are no longer served, see max_age.
+
+        :return int: number of venues deleted
+        """
+        oldest = time.time() - self.max_age
+        with self._lock:
+            self._connection.execute("BEGIN")
+            try:
+                stale = "SELECT rowid FROM venues WHERE seen_at < ?"
+                self._connection.execute(f"DELETE FROM venue_cuisines WHERE venue IN ({stale})", (oldest,))
+                if self.rtree:
+                    self._connection.execute(f"DELETE FROM venue_positions WHERE id IN ({stale})", (oldest,))
+                deleted = self._connection.execute("DELETE FROM venues WHERE seen_at < ?", (oldest,)).rowcount
+                self._connection.execute("COMMIT")
+            except BaseException:
+                self._connection.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM venues").fetchone()[0]
+
+    def stats(self) -> dict:
+        """Reports catalog size and use.
+
+        :return dict: venue and covered area counts, coverage hits and misses, lookups and venues written
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats["venues"] = self._connection.execute("SELECT COUNT(*) FROM venues").fetchone()[0]
+            stats["covered_searches"] = self._connection.execute(
+                "SELECT COUNT(*) FROM search_coverage WHERE searched_at >= ?",
+                (time.time() - self.coverage_ttl,)).fetchone()[0]
+        stats["spatial_index"] = "rtree" if self.rtree else "btree"
+        return stats
+
+def from_spec(spec:str):
+    """Builds a catalog from a spec: "memory", "sqlite:<path>", or "off"/"" for no catalog.
+
+    :param str spec: catalog spec
+    :return VenueCatalog | None: the catalog, or None if it is disabled
+    """
+    spec = spec.strip()
+    if spec.lower() in ("", "off", "none", "0"):
+        return None
+    if spec.lower() == "memory":
+        return VenueCatalog(":memory:")
+    if spec.lower().startswith("sqlite:"):
+        return VenueCatalog(spec[len("sqlite:"):])
+    raise ValueError(f"Unknown venue catalog: {spec}")
+
+_catalog = None
+_catalog_lock = threading.Lock()
+_configured = False
+
+def get_catalog():
+    """Returns the process-wide venue catalog configured by RESY_CATALOG, or None if it is disabled.
+
+    :return VenueCatalog | None: the shared catalog
+    """
+    global _catalog, _configured
+    if not _configured:
+        with _catalog_lock:
+            if not _configured:
+                _catalog = from_spec(DEFAULT_CATALOG)
+                _configured = True
+    return _catalog
@@ -0,0 +1,158 @@
+"""
+Coalescing client for Resy Roulette
+Wraps a LambdaClient or LocalClient so that identical spins arriving at the
+same time share one backend request, while each caller still gets its own pick.
+A spin with no identical spin in flight is sent on its own, so it keeps the
+backend's spin mode and the client's hedging. Spins joining it share batch
+requests of `picks` picks each, so a burst of N identical spins costs about
+N / picks backend requests.
+"""
+
+import logging
+import threading
+from typing import Dict, Any, List, Optional
+from candidates import query_key
+
+
+class _PickPool:
+    """Independent picks from one shared search, handed out one per caller"""
+
+    def __init__(self, results: Optional[List[Dict[str, Any]]]):
+        self.results = results
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def take(self):
+        """
+        Returns:
+            (True, result) with the next unused pick, (True, None) if the shared
+            request failed, or (False, None) once every pick has been handed out
+        """
+        if self.results is None:
+            return True, None
+        with self._lock:
+            if self._next >= len(self.results):
+                return False, None
+            result = self.results[self._next]
+            self._next += 1
+        return True, result
+
+
+class _BatchFlight:
+    """One shared batch request, with a seat for each caller it hands a pick to"""
+
+    def __init__(self, seats: int):
+        self.seats = seats
+        self.pool = None
+        self.done = threading.Event()
+
+
+class CoalescingClient:
+    """Client wrapper that coalesces identical concurrent spins into one batch request"""
+
+    def __init__(self, client, picks: int = 8):
+        """
+        Initialize the coalescing client
+
+        Args:
+            client: The LambdaClient or LocalClient to send requests through
+            picks: Independent picks requested per shared search. Callers beyond
+                   this many in one burst start the next shared search.
+        """
+        self.client = client
+        self.picks = max(1, picks)
+        self.logger = logging.getLogger(__name__)
+        self._flights = {}
+        self._active = {}
+        self._calls = 0
+        self._shared = 0
+        self._solo = 0
+        self._lock = threading.Lock()
+
+    def get_restaurant(self, date: str, party_size: int, time: str,
+                       location: str, cuisines: str, candidates: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get restaurant recommendation, sharing the backend request with identical
+        spins already in flight. A spin arriving alone is sent as a single spin;
+        spins joining one in flight take a seat in a shared batch of independent
+        picks from one search, so every caller gets its own random restaurant.
+        Once a batch's seats are taken, the next caller starts another batch.
+
+        Args:
+            date: Date in YYYY-MM-DD format
+            party_size: Number of people, or a range such as "2-4"
+            time: Time in HH:MM format, or a window HH:MM-HH:MM
+            location: Location string
+            cuisines: Comma-separated cuisine types
+            candidates: Also return the searched venues as a candidate set token, for local re-spins
+
+        Returns:
+            Dictionary with restaurant data or None if failed
+        """
+        payload = {
+            "date": date,
+            "party_size": party_size,
+            "time": time,
+            "location": location,
+            "cuisines": cuisines
+        }
+        if candidates:
+            payload["candidates"] = True
+        key = query_key(date, party_size, time, location, cuisines) + (candidates,)
+
+        with self._lock:
+            alone = not self._active.get(key)
+            self._active[key] = self._active.get(key, 0) + 1
+            if alone:
+                self._solo += 1
+            else:
+                flight = self._flights.get(key)
+                leader = flight is None or not flight.seats
+                if leader:
+                    flight = _BatchFlight(self.picks)
+                    self._flights[key] = flight
+                    self._calls += 1
+                else:
+                    self._shared += 1
+                flight.seats -= 1
+        try:
+            if alone:
+                return self.client.get_restaurant(**payload)
+            if leader:
+                results = None
+                try:
+                    results = self.client.get_restaurants_batch([payload] * self.picks)
+                finally:
+                    flight.pool = _PickPool(results)
+                    with self._lock:
+                        if self._flights.get(key) is flight:
+                            del self._flights[key]
+                    flight.done.set()
+            else:
+                flight.done.wait()
+            # Every caller holds a seat, so a pick is left for it unless the batch came back short
+            available, result = flight.pool.take()
+            if available and result and result.get('success'):
+                return result
+            return None
+        finally:
+            with self._lock:
+                self._active[key] -= 1
+                if not self._active[key]:
+                    del self._active[key]
+
+    def get_restaurants_batch(self, spins: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """Get several restaurant recommendations, see the wrapped client"""
+        return self.client.get_restaurants_batch(spins)
+
+    def health_check(self) -> bool:
+        """Check the wrapped client's backend"""
+        return self.client.health_check()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the wrapped client's counters with coalescing counters added"""
+        stats = self.client.stats()
+        with self._lock:
+            stats['coalescing'] = {"calls": self._calls, "shared": self._shared, "solo": self._solo,
+                                   "inflight": len(self._flights)}
+        return stats
@@ -0,0 +1,35 @@
+"""Shared fixtures for tests that run spins against the fake Resy api of fake_resy."""
+
+import os
+import pytest
+import catalog
+import context
+import fake_resy
+import geocode
+import resy_session
+import scheduler
+import search_cache
+from credentials import CREDENTIAL_HEADERS, Credential, CredentialPool
+
+@pytest.fixture
+def resy(monkeypatch):
+    """Routes Resy and geocoder calls to fake_resy for the test, with process-wide state of its own: a fresh session,
+    geocoder, search cache and unlimited scheduler, no venue catalog, and one credential set without a rate limit.
+
+    :return Callable[..., fake_resy.FakeResy]: installs fixtures, taking the arguments of fake_resy.install
+    """
+    for variable, _ in CREDENTIAL_HEADERS:
+        monkeypatch.setenv(variable, "test")
+    monkeypatch.setenv("RESY_LOG_FILE", os.devnull)
+    monkeypatch.setattr(resy_session, "_session", None)
+    monkeypatch.setattr(resy_session, "_adapter", None)
+    monkeypatch.setattr(geocode, "_geocoder", None)
+    monkeypatch.setattr(search_cache, "_cache", search_cache.SearchCache())
+    monkeypatch.setattr(search_cache, "_configured", True)
+    monkeypatch.setattr(catalog, "_catalog", None)
+    monkeypatch.setattr(catalog, "_configured", True)
+    monkeypatch.setattr(scheduler, "_scheduler", scheduler.UpstreamScheduler(rate=0))
+    monkeypatch.setattr(context, "_context", None)
+    process = context.get_context()
+    monkeypatch.setattr(process, "credentials", CredentialPool([Credential("test", process.header, rate=0)]))
+    return fake_resy.install
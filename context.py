@@ -0,0 +1,148 @@
+"""Process-wide context shared by every invocation handled by one container. Configuration, credentials, logging and
+the HTTP, geocoding and search cache clients are set up once, on first use, and reused by later warm invocations.
+
+The context also keeps a startup report with the time spent importing modules and initializing the context, so cold
+start costs are visible next to the per-invocation timings."""
+
+import os
+import time
+import logging
+import importlib
+import threading
+from credentials import CREDENTIAL_HEADERS, CredentialPool, load_credentials
+
+_import_seconds = {}
+
+def timed_import(name:str):
+    """Imports a module and records how long the import took for the startup report. Modules already imported
+    cost nothing and are not recorded again.
+
+    :param str name: module name
+    :return module: the imported module
+    """
+    started = time.perf_counter()
+    module = importlib.import_module(name)
+    _import_seconds.setdefault(name, time.perf_counter() - started)
+    return module
+
+class ProcessContext(object):
+    """Configuration and clients loaded once per process.
+
+    Attributes:
+        credentials (CredentialPool): Resy credential sets configured in the environment, see the credentials module.
+        header (dict): Resy request headers of the first credential set, empty if none is configured.
+        missing_credentials (list[str]): Credential environment variables that are not set, empty if any credential
+            set is configured.
+        invocations (int): Number of invocations that have used this context.
+    """
+
+    def __init__(self):
+        """Constructor Method. Loads the .env file if present, configures logging, reads the credentials and
+        creates the shared clients, timing the whole setup."""
+        started = time.perf_counter()
+        self.logger = logging.getLogger(__name__)
+        self.invocations = 0
+        self._lock = threading.Lock()
+
+        self._load_environment()
+        self._configure_logging()
+        self._load_credentials()
+        self._create_clients()
+
+        self.init_seconds = time.perf_counter() - started
+        self.logger.info("Process context ready in %.1f ms", self.init_seconds * 1000)
+
+    def _load_environment(self):
+        """Loads a local .env file. Deployed containers get their configuration from the environment, so
+        python-dotenv is only imported when a credential is missing."""
+        if all(name in os.environ for name, _ in CREDENTIAL_HEADERS) or "RESY_CREDENTIALS" in os.environ:
+            return
+        try:
+            from dotenv import load_dotenv
+        except ImportError:
+            return
+        load_dotenv()
+
+    def _configure_logging(self):
+        """Configures file logging once, unless the runtime (e.g. Lambda) already installed a handler."""
+        if not logging.getLogger().handlers:
+            logging.basicConfig(filename=os.environ.get("RESY_LOG_FILE", "myapp.log"), level=logging.INFO)
+
+    def _load_credentials(self):
+        """Builds the pool of Resy credential sets from the environment."""
+        credentials, missing = load_credentials()
+        self.credentials = CredentialPool(credentials)
+        self.header = dict(credentials[0].header) if credentials else {}
+        self.missing_credentials = [] if credentials else missing
+
+        self.logger.info("Credential pool constructed with %d credential sets: %s", len(credentials),
+                         [credential.name for credential in credentials])
+        if self.missing_credentials:
+            self.logger.error("Missing Resy credentials: %s", self.missing_credentials)
+
+    def _create_clients(self):
+        """Creates the shared HTTP session, geocoder, search cache and venue catalog so the first invocation does not
+        pay for them."""
+        import resy_session
+        import geocode
+        import search_cache
+        import catalog
+        resy_session.get_session()
+        geocode.get_geocoder()
+        search_cache.get_search_cache()
+        catalog.get_catalog()
+
+    def credential_pool(self) -> CredentialPool:
+        """Returns the pool of Resy credential sets that venue searches are spread across.
+
+        :raises KeyError: if no credential set is configured
+        :return CredentialPool: the shared pool
+        """
+        if self.missing_credentials:
+            raise KeyError(self.missing_credentials[0])
+        return self.credentials
+
+    def resy_header(self) -> dict:
+        """Returns a copy of the first credential set's Resy request headers.
+
+        :raises KeyError: if a credential environment variable is not set
+        :return dict: headers sent with every Resy request
+        """
+        if self.missing_credentials:
+            raise KeyError(self.missing_credentials[0])
+        return dict(self.header)
+
+    def begin_invocation(self) -> bool:
+        """Counts an invocation.
+
+        :return bool: True for the first invocation of this process, i.e. a cold start
+        """
+        with self._lock:
+            self.invocations += 1
+            return self.invocations == 1
+
+    def startup_report(self) -> dict:
+        """Reports cold start costs.
+
+        :return dict: import time per module and context init time in milliseconds, and invocations served
+        """
+        return {
+            "imports_ms": {name: round(seconds * 1000, 2) for name, seconds in _import_seconds.items()},
+            "init_ms": round(self.init_seconds * 1000, 2),
+            "invocations": self.invocations,
+        }
+
+_context = None
+_context_lock = threading.Lock()
+
+def get_context() -> ProcessContext:
+    """Returns the process context, creating it on first use.
+
+    :return ProcessContext: the shared context
+    """
+    global _context
+    if _context is None:
+        with _context_lock:
+            if _context is None:
+                _context = ProcessContext()
+    return _context
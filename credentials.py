@@ -0,0 +1,198 @@
+"""Pool of Resy credential sets, so upstream throughput grows with the number of accounts provisioned rather than
+being capped by one account's rate limit.
+
+Credential sets are read from the environment:
+
+- the unsuffixed AUTHORIZATION, XRESYAUTHTOKEN and XRESYUNIVERSALAUTH variables, as before,
+- numbered sets with the same names and a suffix, e.g. AUTHORIZATION_2, XRESYAUTHTOKEN_2, XRESYUNIVERSALAUTH_2,
+- RESY_CREDENTIALS, a JSON list (or the path of a JSON file holding one) of objects with the same three keys and
+  an optional "name".
+
+Each call takes the healthy credential with the most rate budget left, so calls spread evenly, and waits for budget
+rather than overdrawing a credential. A credential answered with 401, 403 or 419, which Resy sends for an expired
+auth token, is benched for RESY_CREDENTIAL_UNAUTHORIZED_BENCH seconds, one answered with 429 for its Retry-After or
+RESY_CREDENTIAL_THROTTLED_BENCH seconds. The last usable credential is never benched: with nothing to rotate to, the
+upstream scheduler's pause and retry handle the rejection instead of every search failing for the bench. A throttled
+credential only steers calls to the others, and is used again if every other one is benched."""
+
+import os
+import re
+import json
+import time
+import threading
+import logging
+from scheduler import DEFAULT_RATE, DEFAULT_BURST, TokenBucket
+
+# Environment variables holding a credential set, mapped to the header each one is sent as
+CREDENTIAL_HEADERS = (
+    ("AUTHORIZATION", "Authorization"),
+    ("XRESYAUTHTOKEN", "X-Resy-Auth-Token"),
+    ("XRESYUNIVERSALAUTH", "X-Resy-Universal-Auth"),
+)
+
+# Statuses Resy rejects a credential set with: 419 is its answer to an expired auth token
+UNAUTHORIZED_STATUSES = (401, 403, 419)
+UNAUTHORIZED_BENCH = float(os.environ.get("RESY_CREDENTIAL_UNAUTHORIZED_BENCH", 300))
+THROTTLED_BENCH = float(os.environ.get("RESY_CREDENTIAL_THROTTLED_BENCH", 30))
+
+class NoCredentialError(Exception):
+    """Raised when every credential in the pool is benched."""
+
+class Credential(object):
+    """One credential set with its rate budget, bench and counters. Only the name is ever reported.
+
+    Attributes:
+        name (str): Label used in logs and health reports.
+        header (dict): Resy request headers of the credential set.
+        benched_until (float): Monotonic time the credential is benched until, 0 if healthy.
+        bench_reason (str): "throttled" or "unauthorized" for the last bench, None if never benched.
+    """
+
+    def __init__(self, name:str, header:dict, rate:float = DEFAULT_RATE, burst:float = DEFAULT_BURST):
+        self.name = name
+        self.header = header
+        self.benched_until = 0.0
+        self.bench_reason = None
+        self.bucket = TokenBucket(rate, burst)
+        self.counters = {"requests": 0, "throttled": 0, "unauthorized": 0, "benched": 0}
+
+class CredentialPool(object):
+    """Spreads Resy calls across credential sets and benches the ones Resy rejects. Thread-safe."""
+
+    def __init__(self, credentials:list):
+        """Constructor Method
+
+        Args:
+            credentials (list[Credential]): Credential sets in the pool, may be empty.
+        """
+        self.credentials = list(credentials)
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.credentials)
+
+    def healthy(self) -> int:
+        """Returns the number of credentials that are not benched."""
+        with self._lock:
+            now = time.monotonic()
+            return sum(1 for credential in self.credentials if credential.benched_until <= now)
+
+    def acquire(self) -> Credential:
+        """Takes the healthy credential with the most rate budget left for one call, waiting for budget if every
+        healthy credential has spent its own.
+
+        :raises NoCredentialError: if the pool is empty or every credential is benched
+        :return Credential: credential to send the call with
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                healthy = [credential for credential in self.credentials if credential.benched_until <= now]
+                if not healthy:
+                    # The scheduler already paused for the throttling, so a throttled credential is better than none
+                    healthy = [credential for credential in self.credentials if credential.bench_reason == "throttled"]
+                if not healthy:
+                    raise NoCredentialError("Every Resy credential is benched" if self.credentials
+                                            else "No Resy credentials are configured")
+                credential = min(healthy, key=lambda credential: credential.bucket.wait_time(now))
+                wait = credential.bucket.wait_time(now)
+                if wait <= 0:
+                    credential.bucket.take(now)
+                    credential.counters["requests"] += 1
+                    return credential
+            time.sleep(wait)
+
+    def report(self, credential:Credential, status:int, retry_after:float = None) -> bool:
+        """Records the outcome of a call, benching the credential if Resy rejected it.
+
+        :param Credential credential: credential the call was sent with
+        :param int status: response status
+        :param float retry_after: Retry-After of a 429 response, in seconds
+        :return bool: True if the credential was benched and the call may be retried with another one
+        """
+        if status in UNAUTHORIZED_STATUSES:
+            bench, counter = UNAUTHORIZED_BENCH, "unauthorized"
+        elif status == 429:
+            bench, counter = (retry_after if retry_after is not None else THROTTLED_BENCH), "throttled"
+        else:
+            return False
+        with self._lock:
+            credential.counters[counter] += 1
+            now = time.monotonic()
+            others = [other for other in self.credentials if other is not credential
+                      and (other.benched_until <= now or other.bench_reason == "throttled")]
+            if not others:
+                # Benching the last usable credential would fail every search until the bench ends
+                return False
+            credential.counters["benched"] += 1
+            credential.benched_until = max(credential.benched_until, now + bench)
+            credential.bench_reason = counter
+        self.logger.warning("Resy credential %s answered %d, benched for %.0fs", credential.name, status, bench)
+        return True
+
+    def stats(self) -> dict:
+        """Reports pool health without exposing any credential.
+
+        :return dict: credential count, healthy count, and per credential its state, counters and bench time left
+        """
+        with self._lock:
+            now = time.monotonic()
+            credentials = {}
+            for credential in self.credentials:
+                benched_for = max(0.0, credential.benched_until - now)
+                credentials[credential.name] = dict(credential.counters, state="benched" if benched_for else "healthy",
+                                                    benched_for_ms=round(benched_for * 1000))
+        return {"credentials": len(self.credentials),
+                "healthy": sum(1 for stats in credentials.values() if stats["state"] == "healthy"),
+                "pool": credentials}
+
+def _header(values:dict, suffix:str = "") -> dict:
+    """Builds a header set from variables named like CREDENTIAL_HEADERS plus a suffix, None if any is missing."""
+    header = {}
+    for variable, name in CREDENTIAL_HEADERS:
+        value = values.get(variable + suffix)
+        if not value:
+            return None
+        header[name] = value
+    return header
+
+def load_credentials(environ = None) -> tuple[list, list]:
+    """Reads every credential set configured in the environment, see the module docstring.
+
+    :param Mapping environ: environment to read, defaults to os.environ
+    :raises ValueError: if RESY_CREDENTIALS is not valid JSON
+    :return tuple[list[Credential], list[str]]: credential sets without duplicates, and the unsuffixed variables
+        that are missing
+    """
+    environ = os.environ if environ is None else environ
+    credentials = []
+    seen = set()
+
+    def add(name, header):
+        identity = tuple(sorted(header.items()))
+        if identity not in seen:
+            seen.add(identity)
+            credentials.append(Credential(name, header))
+
+    missing = [variable for variable, _ in CREDENTIAL_HEADERS if not environ.get(variable)]
+    if not missing:
+        add("default", _header(environ))
+
+    suffixes = sorted({match.group(1) for variable in environ
+                       for match in [re.fullmatch(r"AUTHORIZATION(_\w+)", variable)] if match})
+    for suffix in suffixes:
+        header = _header(environ, suffix)
+        if header is not None:
+            add(suffix.lstrip("_").lower(), header)
+
+    spec = environ.get("RESY_CREDENTIALS", "").strip()
+    if spec:
+        if not spec.startswith("["):
+            with open(spec) as f:
+                spec = f.read()
+        for index, values in enumerate(json.loads(spec)):
+            header = _header(values)
+            if header is not None:
+                add(str(values.get("name") or f"set{index + 1}"), header)
+    return credentials, missing
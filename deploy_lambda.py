@@ -36,6 +36,20 @@ def copy_source_files():
     files_to_copy = [
         'lambda_function.py',
         'retrieve.py',
+        'context.py',
+        'credentials.py',
+        'timing.py',
+        'venue.py',
+        'venuesearch.py',
+        'singleflight.py',
+        'scheduler.py',
+        'warmer.py',
+        'candidates.py',
+        'selection.py',
+        'resy_session.py',
+        'geocode.py',
+        'search_cache.py',
+        'catalog.py',
         '__init__.py'
     ]
     
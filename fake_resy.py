@@ -0,0 +1,389 @@
+"""Offline stand-ins for the Resy venue search and availability api, the GeoNames geocoder and the Lambda API, used by
+the benchmarks. FakeResy is a requests transport adapter mounted on the shared Resy session, so the retrieval code runs
+unchanged down to the HTTP call. Responses are served from fixtures, either recorded from the real api or generated from a seed, with
+configurable latency and injected 5xx and 429 errors.
+
+Fixture files are JSON of the form {"cuisines": {"<cuisine>": [<venuesearch hit>, ...]}, "geocodes": {"<address>":
+[lat, lng]}}. To record one from the live api (credentials are read from the environment as usual):
+
+    python fake_resy.py record fixtures.json --location "New York City, New York"
+
+FakeLambda stands in for the deployed Lambda behind API Gateway, answering spins from fixtures after a fixed latency,
+for benchmarking the web tier on its own:
+
+    python fake_resy.py lambda --port 3000 --latency-ms 200
+"""
+
+import io
+import json
+import time
+import random
+import threading
+import argparse
+import requests
+from urllib.parse import parse_qs, urlsplit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from requests.adapters import BaseAdapter, HTTPAdapter
+
+RESY_PREFIX = "https://api.resy.com/"
+
+# Addresses outside the bundled gazetteer, answered by the fake geocoder so the network layer is exercised too
+SYNTHETIC_GEOCODES = {
+    "hoboken, nj": (40.74399, -74.03236),
+    "jersey city, nj": (40.72816, -74.07764),
+    "long island city, ny": (40.74482, -73.94875),
+    "evanston, il": (42.04114, -87.69006),
+    "pasadena, ca": (34.14778, -118.14452),
+}
+
+def _details(rng:random.Random, venue_id:int, name:str, cuisine:str) -> dict:
+    """Fields a real hit carries besides those a spin reads: ids, images, copy, collections and bookable slots,
+    which make up most of a venue search page."""
+    slug = name.lower().replace(" ", "-").replace("&", "and").replace(".", "")
+    slots = []
+    for minutes in range(17 * 60, 22 * 60 + 1, 15):
+        if rng.random() < 0.6:
+            start = f"{minutes // 60:02d}:{minutes % 60:02d}:00"
+            slots.append({"config": {"id": rng.randint(10 ** 6, 10 ** 7), "type": rng.choice(["Dining Room", "Bar", "Patio"]),
+                                     "token": f"rgs://resy/{venue_id}/{rng.randint(10 ** 6, 10 ** 7)}/2/2025-06-01/2025-06-01/{start}/2/{rng.choice(['Dining Room', 'Bar'])}"},
+                          "date": {"start": f"2025-06-01 {start}", "end": f"2025-06-01 {start}"},
+                          "size": {"min": 1, "max": rng.randint(2, 8)},
+                          "payment": {"is_paid": False, "cancellation_fee": None, "deposit_fee": None,
+                                      "service_charge": None, "secs_cancel_cut_off": None}})
+    return {
+        "type": "venue",
+        "url_slug": slug,
+        "locality": "New York",
+        "region": "NY",
+        "location": {"time_zone": "EST5EDT", "neighborhood": "Downtown", "code": "ny", "name": "New York",
+                     "url_slug": "new-york-ny"},
+        "images": [f"https://image.resy.com/3/003/2/{venue_id}/{rng.getrandbits(64):016x}.jpg?width=1000&height=667"
+                   for _ in range(rng.randint(2, 6))],
+        "content": [{"name": "about", "body": f"{name} serves {cuisine} food in a relaxed room. " * rng.randint(3, 8)}],
+        "collections": [{"id": rng.randint(1, 500), "name": "Climbing", "type": "dynamic"}],
+        "inventory": {"type": {"id": 1}},
+        "availability": {"slots": slots},
+        "notifies": {"enabled": rng.random() < 0.5},
+        "is_gdc": 0,
+        "is_global_dining_access": False,
+    }
+
+def synthetic_fixtures(cuisines, seed:int = 0, center:tuple = (40.71427, -74.00597), min_hits:int = 3,
+                       max_hits:int = 80, detail:bool = False) -> dict:
+    """Generates venue search fixtures shaped like real Resy hits.
+
+    :param Iterable[str] cuisines: cuisines to generate hits for
+    :param int seed: seed for hit counts and coordinates, the same seed gives the same fixtures
+    :param tuple[float, float] center: latitude and longitude the venues are scattered around
+    :param int min_hits: fewest hits per cuisine
+    :param int max_hits: most hits per cuisine
+    :param bool detail: also generate the fields real hits carry but spins do not read, for full size pages
+    :return dict: fixtures with cuisines and geocodes
+    """
+    rng = random.Random(seed)
+    fixtures = {"cuisines": {}, "geocodes": {address: list(coordinates) for address, coordinates in SYNTHETIC_GEOCODES.items()}}
+    venue_id = 1000
+    for cuisine in cuisines:
+        hits = []
+        for i in range(rng.randint(min_hits, max_hits)):
+            venue_id += 1
+            name = f"{cuisine} Kitchen & Bar No. {i + 1}"
+            hits.append({
+                "id": {"resy": venue_id},
+                "name": name,
+                "cuisine": [cuisine],
+                "_geoloc": {"lat": round(center[0] + rng.uniform(-0.2, 0.2), 5),
+                            "lng": round(center[1] + rng.uniform(-0.2, 0.2), 5)},
+                "_highlightResult": {"name": {"value": name.replace("&", "&amp;"), "matchLevel": "none"},
+                                     "cuisine": [{"value": cuisine, "matchLevel": "none"}]},
+                "neighborhood": "Downtown",
+                "price_range_id": rng.randint(1, 4),
+                "rating": {"average": round(rng.uniform(3.5, 5), 2), "count": rng.randint(10, 5000)},
+            })
+            if detail:
+                hits[-1].update(_details(rng, venue_id, name, cuisine))
+        fixtures["cuisines"][cuisine] = hits
+    return fixtures
+
+def load_fixtures(path:str) -> dict:
+    """Reads a fixture file.
+
+    :param str path: path to a JSON fixture file
+    :return dict: fixtures with cuisines and geocodes
+    """
+    with open(path) as f:
+        fixtures = json.load(f)
+    fixtures.setdefault("cuisines", {})
+    fixtures.setdefault("geocodes", {})
+    return fixtures
+
+class FakeResy(BaseAdapter):
+    """Transport adapter answering venue search and single venue availability requests from fixtures.
+
+    Attributes:
+        latency_ms (float): Base latency of every response.
+        jitter_ms (float): Extra latency drawn uniformly between 0 and this per response.
+        error_rate (float): Fraction of requests answered with a 500.
+        throttle_rate (float): Fraction of requests answered with a 429.
+        retry_after (str): Retry-After header sent with 429s.
+        geo_filter (bool): Only serve hits inside the query's circle, nearest first, as a dense city would.
+        stats (dict): Requests served, errors and throttles injected.
+    """
+
+    def __init__(self, fixtures:dict, latency_ms:float = 0, jitter_ms:float = 0, error_rate:float = 0,
+                 throttle_rate:float = 0, retry_after:str = "0", seed:int = 0, geo_filter:bool = False):
+        super().__init__()
+        self.fixtures = fixtures
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.geo_filter = geo_filter
+        self.stats = {"requests": 0, "errors": 0, "throttled": 0}
+        self._venues = None
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self) -> tuple[float, float]:
+        """Draws the latency and the error roll of one response."""
+        with self._lock:
+            self.stats["requests"] += 1
+            return self.latency_ms + self._rng.uniform(0, self.jitter_ms), self._rng.random()
+
+    def _count(self, name:str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _build(self, request, status:int, payload:dict, headers:dict = None) -> requests.Response:
+        response = requests.Response()
+        response.status_code = status
+        response.headers.update({"Content-Type": "application/json", **(headers or {})})
+        response.raw = io.BytesIO(json.dumps(payload).encode())
+        response.encoding = "utf-8"
+        response.url = request.url
+        response.request = request
+        response.reason = "OK" if status == 200 else "Error"
+        return response
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        latency, roll = self._draw()
+        if latency > 0:
+            time.sleep(latency / 1000)
+
+        if roll < self.throttle_rate:
+            self._count("throttled")
+            return self._build(request, 429, {"message": "Too Many Requests"}, {"Retry-After": self.retry_after})
+        if roll < self.throttle_rate + self.error_rate:
+            self._count("errors")
+            return self._build(request, 500, {"message": "Internal Server Error"})
+
+        if request.url.startswith(RESY_PREFIX + "4/find"):
+            return self._find(request)
+        if not request.url.startswith(RESY_PREFIX + "3/venuesearch/search"):
+            return self._build(request, 404, {"message": "Not Found"})
+        query = json.loads(request.body)
+        cuisine = (query.get("venue_filter") or {}).get("cuisine")
+        hits = self.fixtures["cuisines"].get(cuisine, [])
+        if self.geo_filter and query.get("geo"):
+            from geocode import distance_meters
+            geo = query["geo"]
+            located = [(distance_meters(geo["latitude"], geo["longitude"], hit["_geoloc"]["lat"], hit["_geoloc"]["lng"]), i)
+                       for i, hit in enumerate(hits)]
+            hits = [hits[i] for distance, i in sorted(located) if distance <= geo.get("radius", 0)]
+        page, per_page = int(query.get("page", 1)), int(query.get("per_page", 20))
+        page_hits = hits[(page - 1) * per_page:page * per_page]
+        return self._build(request, 200, {"search": {"hits": page_hits, "nbHits": len(hits)},
+                                          "meta": {"total": len(hits)}})
+
+    def _find(self, request) -> requests.Response:
+        """Answers a single venue availability request with the venue's slots from its fixture hit. Hits generated
+        without details get an evening of slots on the requested day."""
+        if self._venues is None:
+            self._venues = {(hit.get("id") or {}).get("resy"): hit
+                            for hits in self.fixtures["cuisines"].values() for hit in hits}
+        params = parse_qs(urlsplit(request.url).query)
+        day = params.get("day", [""])[0]
+        hit = self._venues.get(int(params.get("venue_id", ["0"])[0]))
+        if hit is None or not self._near(params, hit):
+            return self._build(request, 200, {"results": {"venues": []}})
+        slots = (hit.get("availability") or {}).get("slots")
+        if slots is None:
+            slots = [{"date": {"start": f"{day} {hour}:00:00"}, "size": {"min": 1, "max": 8}}
+                     for hour in ("18:00", "19:00", "20:00", "21:00")]
+        return self._build(request, 200, {"results": {"venues": [{"venue": {"id": hit["id"], "name": hit["name"]},
+                                                                   "slots": slots}]}})
+
+    @staticmethod
+    def _near(params:dict, hit:dict) -> bool:
+        """Whether an availability request's position is close to the venue, which Resy needs to find it."""
+        from geocode import distance_meters
+        try:
+            latitude, longitude = float(params["lat"][0]), float(params["long"][0])
+        except (KeyError, ValueError):
+            return False
+        return distance_meters(latitude, longitude, hit["_geoloc"]["lat"], hit["_geoloc"]["lng"]) <= 1000
+
+    def close(self):
+        pass
+
+class _Location(object):
+    __slots__ = ("latitude", "longitude")
+
+    def __init__(self, latitude:float, longitude:float):
+        self.latitude = latitude
+        self.longitude = longitude
+
+class FakeGeoNames(object):
+    """Stands in for geopy's GeoNames client, answering from the fixture geocodes after a fixed latency."""
+
+    def __init__(self, geocodes:dict, latency_ms:float = 0):
+        self.geocodes = {key.lower(): value for key, value in geocodes.items()}
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def geocode(self, address:str):
+        self.calls += 1
+        if self.latency_ms > 0:
+            time.sleep(self.latency_ms / 1000)
+        coordinates = self.geocodes.get(" ".join(address.lower().split()))
+        return _Location(*coordinates) if coordinates else None
+
+def install(fixtures:dict, geocode_latency_ms:float = 0, **options) -> FakeResy:
+    """Routes the shared Resy session and geocoder to the fakes.
+
+    :param dict fixtures: fixtures to serve
+    :param float geocode_latency_ms: latency of each fake geocoder call
+    :param options: FakeResy settings, latency_ms, jitter_ms, error_rate, throttle_rate, retry_after and seed
+    :return FakeResy: the mounted adapter, for its stats
+    """
+    import resy_session
+    import geocode
+
+    adapter = FakeResy(fixtures, **options)
+    resy_session.get_session().mount(RESY_PREFIX, adapter)
+    geocode.get_geocoder()._client = FakeGeoNames(fixtures.get("geocodes", {}), geocode_latency_ms)
+    return adapter
+
+class FakeLambda(ThreadingHTTPServer):
+    """HTTP server answering /restaurant, /restaurants/batch and /health like the Lambda API, from fixture venue
+    names, after latency_ms per request. Every request gets its own thread, so slow answers do not queue."""
+
+    daemon_threads = True
+    request_queue_size = 1024
+
+    def __init__(self, address:tuple, fixtures:dict, latency_ms:float = 0, seed:int = 0):
+        super().__init__(address, _FakeLambdaHandler)
+        self.names = [hit["name"] for hits in fixtures["cuisines"].values() for hit in hits] or ["Fake Restaurant"]
+        self.latency_ms = latency_ms
+        self.requests = 0
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def handle_error(self, request, client_address):
+        # Servers under test drop keep-alive connections when they shut down, which is not worth a traceback
+        pass
+
+    def pick(self) -> dict:
+        with self._lock:
+            self.requests += 1
+            name = self._rng.choice(self.names)
+        return {"success": True, "restaurant": {"name": name}, "total_restaurants": len(self.names)}
+
+class _FakeLambdaHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes, which Nagle's algorithm would hold back for a delayed ACK
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _answer(self, status:int, payload:dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._answer(200, {"status": "healthy"})
+        else:
+            self._answer(404, {"message": "Not Found"})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if self.server.latency_ms > 0:
+            time.sleep(self.server.latency_ms / 1000)
+        if self.path == "/restaurant":
+            self._answer(200, self.server.pick())
+        elif self.path == "/restaurants/batch":
+            self._answer(200, {"success": True, "results": [self.server.pick() for _ in body.get("spins", [])]})
+        else:
+            self._answer(404, {"message": "Not Found"})
+
+class _RecordingAdapter(HTTPAdapter):
+    """Passes requests through to Resy and keeps every venue search hit, by cuisine."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cuisines = {}
+
+    def send(self, request, **kwargs):
+        response = super().send(request, **kwargs)
+        if response.status_code == 200 and "venuesearch" in request.url:
+            cuisine = json.loads(request.body)["venue_filter"]["cuisine"]
+            self.cuisines.setdefault(cuisine, []).extend(response.json()["search"]["hits"])
+        return response
+
+def record(path:str, location:str, date:str = None, party_size:int = 2):
+    """Records fixtures from the live api, one full search of every cuisine at the location.
+
+    :param str path: fixture file to write
+    :param str location: address to search around
+    :param str date: date to search, defaults to today
+    :param int party_size: party size to search for
+    """
+    import resy_session
+    from retrieve import ResyRetriever
+
+    adapter = _RecordingAdapter()
+    resy_session.get_session().mount(RESY_PREFIX, adapter)
+    coordinates = ResyRetriever.get_location(location)
+    ResyRetriever(date=date, location=coordinates, party_size=party_size, search_cache=None).get_restaurants()
+    fixtures = {"cuisines": adapter.cuisines,
+                "geocodes": {location: [coordinates["latitude"], coordinates["longitude"]]}}
+    with open(path, "w") as f:
+        json.dump(fixtures, f)
+    print(f"Recorded {sum(len(hits) for hits in adapter.cuisines.values())} hits for {len(adapter.cuisines)} cuisines to {path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Record or generate venue search fixtures for the benchmark suite")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="record fixtures from the live Resy api")
+    record_parser.add_argument("path")
+    record_parser.add_argument("--location", default="New York City, New York")
+    record_parser.add_argument("--date")
+    record_parser.add_argument("--party-size", type=int, default=2)
+    generate_parser = subparsers.add_parser("generate", help="write seeded synthetic fixtures")
+    generate_parser.add_argument("path")
+    generate_parser.add_argument("--seed", type=int, default=0)
+    generate_parser.add_argument("--detail", action="store_true", help="full size hits, as recorded from the live api")
+    lambda_parser = subparsers.add_parser("lambda", help="serve a fake Lambda API")
+    lambda_parser.add_argument("--port", type=int, default=3000)
+    lambda_parser.add_argument("--latency-ms", type=float, default=200)
+    lambda_parser.add_argument("--fixtures", help="fixture file, defaults to synthetic fixtures")
+    lambda_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "record":
+        record(args.path, args.location, args.date, args.party_size)
+    elif args.command == "lambda":
+        from retrieve import ResyRetriever
+        fixtures = load_fixtures(args.fixtures) if args.fixtures else synthetic_fixtures(ResyRetriever.applicable_cuisine_list, args.seed)
+        FakeLambda(("127.0.0.1", args.port), fixtures, args.latency_ms, args.seed).serve_forever()
+    else:
+        from retrieve import ResyRetriever
+        with open(args.path, "w") as f:
+            json.dump(synthetic_fixtures(ResyRetriever.applicable_cuisine_list, args.seed, detail=args.detail), f)
@@ -0,0 +1,311 @@
+"""This module resolves user entered addresses to coordinates for venue searches. Lookups go through three layers
+before the GeoNames web service is called: an in-process LRU, a bundled gazetteer of popular metros, and an
+optional on-disk cache with a TTL. geopy is only imported when a lookup misses all of them."""
+
+import os
+import re
+import math
+import json
+import time
+import threading
+import logging
+from collections import OrderedDict
+from singleflight import SingleFlight
+
+# Search radius in meters sent with every location
+DEFAULT_RADIUS = 35420
+
+# Layer settings, overridable through the environment. The disk cache is disabled unless a path is given.
+DEFAULT_LRU_SIZE = int(os.environ.get("RESY_GEOCODE_LRU_SIZE", 512))
+DEFAULT_DISK_CACHE_PATH = os.environ.get("RESY_GEOCODE_CACHE", "")
+DEFAULT_DISK_TTL = float(os.environ.get("RESY_GEOCODE_TTL", 30 * 24 * 3600))
+GEONAMES_USERNAME = os.environ.get("GEONAMES_USERNAME", "yunjun505")
+
+DEFAULT_ADDRESS = "New York City, New York"
+
+EARTH_RADIUS_METERS = 6371008.8
+METERS_PER_DEGREE = 111320.0
+
+# Precomputed coordinates for the metros Resy serves most, as (names, state, state abbreviation, lat, lng).
+# Names listed first are also matched without a state; ambiguous names must be qualified.
+_METROS = (
+    (("new york city", "new york", "nyc", "manhattan"), "new york", "ny", 40.71427, -74.00597),
+    (("brooklyn",), "new york", "ny", 40.6501, -73.94958),
+    (("los angeles", "la"), "california", "ca", 34.05223, -118.24368),
+    (("san francisco", "sf"), "california", "ca", 37.77493, -122.41942),
+    (("san diego",), "california", "ca", 32.71571, -117.16472),
+    (("oakland",), "california", "ca", 37.80437, -122.2708),
+    (("chicago",), "illinois", "il", 41.85003, -87.65005),
+    (("washington", "washington dc", "dc"), "district of columbia", "dc", 38.89511, -77.03637),
+    (("boston",), "massachusetts", "ma", 42.35843, -71.05977),
+    (("philadelphia",), "pennsylvania", "pa", 39.95233, -75.16379),
+    (("miami",), "florida", "fl", 25.77427, -80.19366),
+    (("miami beach",), "florida", "fl", 25.79065, -80.13005),
+    (("atlanta",), "georgia", "ga", 33.749, -84.38798),
+    (("nashville",), "tennessee", "tn", 36.16589, -86.78444),
+    (("new orleans",), "louisiana", "la", 29.95465, -90.07507),
+    (("austin",), "texas", "tx", 30.26715, -97.74306),
+    (("houston",), "texas", "tx", 29.76328, -95.36327),
+    (("dallas",), "texas", "tx", 32.78306, -96.80667),
+    (("denver",), "colorado", "co", 39.73915, -104.9847),
+    (("seattle",), "washington", "wa", 47.60621, -122.33207),
+    (("las vegas",), "nevada", "nv", 36.17497, -115.13722),
+    (("charleston",), "south carolina", "sc", 32.77657, -79.93092),
+    (("minneapolis",), "minnesota", "mn", 44.97997, -93.26384),
+    (("detroit",), "michigan", "mi", 42.33143, -83.04575),
+    (("phoenix",), "arizona", "az", 33.44838, -112.07404),
+    (("honolulu",), "hawaii", "hi", 21.30694, -157.85833),
+)
+
+# Metros whose name is ambiguous on its own, only matched together with their state
+_QUALIFIED_METROS = (
+    (("portland",), "oregon", "or", 45.52345, -122.67621),
+    (("portland",), "maine", "me", 43.66147, -70.25533),
+)
+
+def normalize(address:str) -> str:
+    """Normalizes an address for cache and gazetteer lookups: lowercased, punctuation other than commas removed,
+    and whitespace collapsed.
+
+    :param str address: user entered address
+    :return str: normalized address
+    """
+    address = re.sub(r"[^\w\s,]", "", address.lower())
+    parts = [" ".join(part.split()) for part in address.split(",")]
+    return ", ".join(part for part in parts if part)
+
+def _build_gazetteer() -> dict:
+    """Expands _METROS into every accepted spelling, e.g. "nyc", "new york, ny" and "new york city, new york, usa".
+
+    :return dict: normalized address to (latitude, longitude)
+    """
+    gazetteer = {}
+    metros = [(metro, True) for metro in _METROS] + [(metro, False) for metro in _QUALIFIED_METROS]
+    for (names, state, abbreviation, latitude, longitude), bare in metros:
+        for name in names:
+            spellings = [f"{name}, {state}", f"{name}, {abbreviation}"]
+            if bare:
+                spellings.append(name)
+            for spelling in spellings:
+                for suffix in ("", ", usa", ", us", ", united states"):
+                    gazetteer.setdefault(spelling + suffix, (latitude, longitude))
+    return gazetteer
+
+GAZETTEER = _build_gazetteer()
+
+class Geocoder(object):
+    """Layered geocoder. Resolved coordinates are kept in an LRU; misses check the gazetteer, then the disk cache,
+    and only then the GeoNames web service, with concurrent lookups of the same address coalesced.
+
+    Attributes:
+        lru_size (int): Maximum number of addresses kept in the in-process cache.
+        disk_cache_path (str): Path to the JSON disk cache, empty to disable it.
+        disk_ttl (float): Seconds a disk cache entry stays valid.
+        stats (dict): Number of lookups resolved by each layer.
+    """
+
+    def __init__(self,
+                 lru_size:int = DEFAULT_LRU_SIZE,
+                 disk_cache_path:str = DEFAULT_DISK_CACHE_PATH,
+                 disk_ttl:float = DEFAULT_DISK_TTL,
+                 username:str = GEONAMES_USERNAME):
+        """Constructor Method
+
+        Args:
+            lru_size (int, optional): Maximum number of addresses kept in memory. Defaults to 512.
+            disk_cache_path (str, optional): Path to the JSON disk cache, empty to disable. Defaults to RESY_GEOCODE_CACHE.
+            disk_ttl (float, optional): Seconds a disk cache entry stays valid. Defaults to 30 days.
+            username (str, optional): GeoNames account used for web service lookups.
+        """
+        self.lru_size = lru_size
+        self.disk_cache_path = disk_cache_path
+        self.disk_ttl = disk_ttl
+        self.username = username
+        self.stats = {"lru": 0, "gazetteer": 0, "disk": 0, "network": 0, "failed": 0}
+        self.logger = logging.getLogger(__name__)
+
+        self._lru = OrderedDict()
+        self._disk = None
+        self._lock = threading.Lock()
+        self._client = None
+        self._flight = SingleFlight()
+
+    def lookup(self, address:str):
+        """Resolves an address to coordinates.
+
+        :param str address: user entered address
+        :return tuple[float, float] | None: latitude and longitude, or None if the address could not be resolved
+        """
+        key = normalize(address)
+        with self._lock:
+            coordinates = self._lru.get(key)
+            if coordinates is not None:
+                self._lru.move_to_end(key)
+                self.stats["lru"] += 1
+                return coordinates
+
+        coordinates = GAZETTEER.get(key)
+        if coordinates is not None:
+            self._remember(key, coordinates, "gazetteer")
+            return coordinates
+
+        coordinates = self._disk_get(key)
+        if coordinates is not None:
+            self._remember(key, coordinates, "disk")
+            return coordinates
+
+        # Concurrent lookups of the same new address share one web service call
+        coordinates = self._flight.do(key, lambda: self._geonames(address))
+        if coordinates is None:
+            with self._lock:
+                self.stats["failed"] += 1
+            return None
+        self._remember(key, coordinates, "network")
+        self._disk_put(key, coordinates)
+        return coordinates
+
+    def _remember(self, key:str, coordinates:tuple, layer:str):
+        """Stores resolved coordinates in the LRU and counts the layer that resolved them."""
+        with self._lock:
+            self.stats[layer] += 1
+            self._lru[key] = coordinates
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.lru_size:
+                self._lru.popitem(last=False)
+
+    def _geonames(self, address:str):
+        """Looks an address up through the GeoNames web service.
+
+        :param str address: user entered address
+        :return tuple[float, float] | None: latitude and longitude, or None on failure
+        """
+        try:
+            if self._client is None:
+                from geopy import geocoders
+                self._client = geocoders.GeoNames(username=self.username)
+            location = self._client.geocode(address)
+        except Exception as e:
+            self.logger.info("Geocoding %s failed: %s", address, e)
+            return None
+        if location is None:
+            return None
+        return (location.latitude, location.longitude)
+
+    def _load_disk(self) -> dict:
+        """Loads the disk cache on first use. A missing or corrupt file is treated as empty."""
+        if self._disk is None:
+            self._disk = {}
+            if self.disk_cache_path and os.path.exists(self.disk_cache_path):
+                try:
+                    with open(self.disk_cache_path) as cache_file:
+                        self._disk = json.load(cache_file)
+                except (OSError, ValueError) as e:
+                    self.logger.info("Ignoring unreadable geocode cache %s: %s", self.disk_cache_path, e)
+        return self._disk
+
+    def _disk_get(self, key:str):
+        """Returns unexpired coordinates from the disk cache, if enabled."""
+        if not self.disk_cache_path:
+            return None
+        with self._lock:
+            entry = self._load_disk().get(key)
+        if entry is None or time.time() - entry[2] > self.disk_ttl:
+            return None
+        return (entry[0], entry[1])
+
+    def _disk_put(self, key:str, coordinates:tuple):
+        """Writes coordinates to the disk cache, if enabled. The file is replaced atomically so concurrent readers
+        never see a partial write."""
+        if not self.disk_cache_path:
+            return
+        with self._lock:
+            disk = self._load_disk()
+            disk[key] = [coordinates[0], coordinates[1], time.time()]
+            temp_path = f"{self.disk_cache_path}.{os.getpid()}.tmp"
+            try:
+                with open(temp_path, "w") as cache_file:
+                    json.dump(disk, cache_file)
+                os.replace(temp_path, self.disk_cache_path)
+            except OSError as e:
+                self.logger.info("Could not write geocode cache %s: %s", self.disk_cache_path, e)
+
+_geocoder = None
+_geocoder_lock = threading.Lock()
+
+def get_geocoder() -> Geocoder:
+    """Returns the process-wide geocoder, so its caches survive across warm invocations.
+
+    :return Geocoder: the shared geocoder
+    """
+    global _geocoder
+    if _geocoder is None:
+        with _geocoder_lock:
+            if _geocoder is None:
+                _geocoder = Geocoder()
+    return _geocoder
+
+def get_location(address:str) -> dict:
+    """Returns the search location for an address, defaulting to NYC if the address cannot be resolved.
+
+    :param str address: user entered address
+    :return dict: dictionary of location's latitude, longitude, and search radius
+    """
+    coordinates = get_geocoder().lookup(address)
+    if coordinates is None:
+        logging.getLogger(__name__).info("Error, defaulting to NYC")
+        coordinates = GAZETTEER[normalize(DEFAULT_ADDRESS)]
+    return {"latitude":coordinates[0],"longitude":coordinates[1],"radius":DEFAULT_RADIUS}
+
+def distance_meters(latitude1:float, longitude1:float, latitude2:float, longitude2:float) -> float:
+    """Great-circle (haversine) distance between two points.
+
+    :return float: distance in meters
+    """
+    phi1, phi2 = math.radians(latitude1), math.radians(latitude2)
+    dphi = phi2 - phi1
+    dlambda = math.radians(longitude2 - longitude1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(a)))
+
+def _cells(location:dict, tile_meters:float) -> list[dict]:
+    """Lists the grid cells of the given size that overlap the location's circle."""
+    latitude, longitude = location["latitude"], location["longitude"]
+    radius = location.get("radius", DEFAULT_RADIUS)
+    lat_step = tile_meters / METERS_PER_DEGREE
+    lat_reach = radius / METERS_PER_DEGREE
+    cells = []
+    for row in range(math.floor((latitude - lat_reach) / lat_step), math.floor((latitude + lat_reach) / lat_step) + 1):
+        south, north = row * lat_step, (row + 1) * lat_step
+        # Columns are tile_meters wide at the row's middle latitude, so every search on the grid sees the same cells
+        lng_step = lat_step / max(0.01, math.cos(math.radians((south + north) / 2)))
+        lng_reach = lat_reach / max(0.01, math.cos(math.radians(max(abs(south), abs(north)))))
+        for column in range(math.floor((longitude - lng_reach) / lng_step), math.floor((longitude + lng_reach) / lng_step) + 1):
+            west, east = column * lng_step, (column + 1) * lng_step
+            nearest = distance_meters(latitude, longitude, min(max(latitude, south), north), min(max(longitude, west), east))
+            if nearest > radius:
+                continue
+            center = ((south + north) / 2, (west + east) / 2)
+            cells.append({"latitude": round(center[0], 6), "longitude": round(center[1], 6),
+                          # Circle through the cell's corners, so the cell is fully covered
+                          "radius": int(math.ceil(tile_meters * math.sqrt(2) / 2)),
+                          "distance": distance_meters(latitude, longitude, *center)})
+    return cells
+
+def tiles(location:dict, tile_meters:float, max_tiles:int) -> list[dict]:
+    """Splits a search location into grid cells, each searched as its own smaller circle. Cells sit on a fixed
+    global grid, so overlapping searches share cells and their cached results. The cell size is doubled until the
+    area fits in max_tiles cells.
+
+    :param dict location: location with latitude, longitude and radius
+    :param float tile_meters: width of a cell in meters
+    :param int max_tiles: most cells returned
+    :return list[dict]: cell locations with latitude, longitude and radius, nearest to the center first
+    """
+    if tile_meters <= 0:
+        return [location]
+    cells = _cells(location, tile_meters)
+    while len(cells) > max(1, max_tiles):
+        tile_meters *= 2
+        cells = _cells(location, tile_meters)
+    cells.sort(key=lambda cell: cell["distance"])
+    return [{"latitude": cell["latitude"], "longitude": cell["longitude"], "radius": cell["radius"]} for cell in cells]
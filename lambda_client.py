@@ -5,33 +5,232 @@ Handles communication with the deployed AWS Lambda function
 
 import requests
 import json
+import time
 import logging
-from typing import Dict, Any, Optional
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Optional
+
+from candidates import batch_results
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker for the Lambda backend. After failure_threshold consecutive
+    failures the breaker opens and calls fail fast for reset_timeout seconds. It
+    then lets a single trial call through (half-open): success closes the
+    breaker, failure opens it again.
+    """
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+    
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        """
+        Args:
+            failure_threshold: Consecutive failures that open the breaker
+            reset_timeout: Seconds the breaker stays open before a trial call
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opens = 0
+        self.rejections = 0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+    
+    def allow(self) -> bool:
+        """Return whether a call may proceed, counting it as rejected if not"""
+        with self._lock:
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._trial_in_flight = False
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            self.rejections += 1
+            return False
+    
+    def record_success(self):
+        """Record a successful call, closing the breaker"""
+        with self._lock:
+            self.failures = 0
+            self.state = self.CLOSED
+            self._trial_in_flight = False
+    
+    def release_trial(self):
+        """Let another trial call through after one that ended without an outcome, such as a cancelled call"""
+        with self._lock:
+            self._trial_in_flight = False
+    
+    def record_failure(self):
+        """Record a failed call, opening the breaker at the threshold or after a failed trial"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opens += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+                self._trial_in_flight = False
+
 
 class LambdaClient:
     """Client for communicating with the deployed Lambda function"""
     
-    def __init__(self, api_gateway_url: str):
+    # Recent latencies kept for the hedge delay, and samples needed before it is used
+    LATENCY_WINDOW = 200
+    MIN_LATENCY_SAMPLES = 20
+    
+    def __init__(self, api_gateway_url: str, connect_timeout: float = 3.05,
+                 read_timeout: float = 30, pool_size: int = 20, hedge: bool = False,
+                 hedge_quantile: float = 0.95, initial_hedge_delay: float = 2.0,
+                 breaker: Optional[CircuitBreaker] = None):
         """
         Initialize the Lambda client
         
         Args:
             api_gateway_url: The API Gateway URL where your Lambda is deployed
+            connect_timeout: Seconds to wait for a connection to API Gateway
+            read_timeout: Seconds to wait for the Lambda response once connected
+            pool_size: Keep-alive connections kept to API Gateway
+            hedge: Send a duplicate spin request when the first one is slow
+            hedge_quantile: Latency quantile of recent calls after which to hedge
+            initial_hedge_delay: Hedge delay in seconds until enough latencies are recorded
+            breaker: Circuit breaker guarding the backend, a default one if not given
         """
         self.api_url = api_gateway_url.rstrip('/')
         self.logger = logging.getLogger(__name__)
+        self.timeout = (connect_timeout, read_timeout)
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.initial_hedge_delay = initial_hedge_delay
+        self.breaker = breaker or CircuitBreaker()
+        
+        # Pooled keep-alive session shared by all requests from this client
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+        
+        self._executor = ThreadPoolExecutor(max_workers=pool_size, thread_name_prefix='lambda-hedge') if hedge else None
+        self._latencies = deque(maxlen=self.LATENCY_WINDOW)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'failures': 0, 'hedges_sent': 0, 'hedge_wins': 0}
+    
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+    
+    def _hedge_delay(self) -> float:
+        """Seconds to wait for the first request before hedging: the configured quantile of recent latencies"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.MIN_LATENCY_SAMPLES:
+            return self.initial_hedge_delay
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_quantile))]
+    
+    def _send(self, path: str, payload: Dict[str, Any]) -> requests.Response:
+        """Send one POST request, recording its latency if it succeeds"""
+        started = time.monotonic()
+        response = self.session.post(f"{self.api_url}{path}", json=payload, timeout=self.timeout)
+        if response.status_code < 500:
+            with self._lock:
+                self._latencies.append(time.monotonic() - started)
+        return response
+    
+    def _send_hedged(self, path: str, payload: Dict[str, Any]) -> requests.Response:
+        """
+        Send a request and, if it has not answered within the hedge delay, a
+        duplicate. The first successful response wins; the other request is left
+        to finish in the background.
+        """
+        primary = self._executor.submit(self._send, path, payload)
+        done, _ = wait([primary], timeout=self._hedge_delay())
+        if done:
+            return primary.result()
+        
+        self._count('hedges_sent')
+        backup = self._executor.submit(self._send, path, payload)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    response = future.result()
+                except requests.exceptions.RequestException as e:
+                    error = e
+                    continue
+                if response.status_code >= 500 and pending:
+                    continue
+                if future is backup:
+                    self._count('hedge_wins')
+                return response
+        raise error
+    
+    def _post(self, path: str, payload: Dict[str, Any], hedge: bool = False) -> requests.Response:
+        """
+        Send a request through the circuit breaker. Connection errors, timeouts,
+        5xx responses and any other exception raised while sending count as
+        failures, so a half-open trial always ends with an outcome recorded.
+        
+        Raises:
+            CircuitOpenError: If the breaker is open
+            requests.exceptions.RequestException: If the request failed
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit open, skipping request to {path}")
+        self._count('requests')
+        succeeded = False
+        try:
+            if hedge and self._executor is not None:
+                response = self._send_hedged(path, payload)
+            else:
+                response = self._send(path, payload)
+            succeeded = response.status_code < 500
+            return response
+        finally:
+            if succeeded:
+                self.breaker.record_success()
+            else:
+                self._count('failures')
+                self.breaker.record_failure()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Return request, breaker and hedging counters"""
+        with self._lock:
+            stats = dict(self._counters)
+        stats['breaker_state'] = self.breaker.state
+        stats['breaker_opens'] = self.breaker.opens
+        stats['breaker_rejections'] = self.breaker.rejections
+        stats['hedge_delay_ms'] = round(self._hedge_delay() * 1000, 1)
+        return stats
     
     def get_restaurant(self, date: str, party_size: int, time: str, 
-                       location: str, cuisines: str) -> Optional[Dict[str, Any]]:
+                       location: str, cuisines: str, candidates: bool = False) -> Optional[Dict[str, Any]]:
         """
         Get restaurant recommendation from Lambda
         
         Args:
             date: Date in YYYY-MM-DD format
-            party_size: Number of people
-            time: Time in HH:MM format
+            party_size: Number of people, or a range such as "2-4"
+            time: Time in HH:MM format, or a window HH:MM-HH:MM
             location: Location string
             cuisines: Comma-separated cuisine types
+            candidates: Also return the searched venues as a candidate set token, for local re-spins
             
         Returns:
             Dictionary with restaurant data or None if failed
@@ -45,45 +244,31 @@ class LambdaClient:
                 "location": location,
                 "cuisines": cuisines
             }
+            if candidates:
+                payload["candidates"] = True
             
             self.logger.info(f"Sending request to Lambda: {payload}")
             
             # Make the request to Lambda
-            response = requests.post(
-                f"{self.api_url}/restaurant",
-                json=payload,
-                headers={'Content-Type': 'application/json'},
-                timeout=30
-            )
+            response = self._post("/restaurant", payload, hedge=self.hedge)
             
             if response.status_code == 200:
                 result = response.json()
                 self.logger.info(f"Lambda response: {result}")
-                
-                # Handle API Gateway response structure
-                if 'body' in result:
-                    # API Gateway response - parse the body
-                    try:
-                        body_data = json.loads(result['body'])
-                        if body_data.get('success'):
-                            return body_data
-                        else:
-                            self.logger.warning(f"Lambda body returned success=False: {body_data}")
-                            return None
-                    except json.JSONDecodeError:
-                        self.logger.error(f"Failed to parse Lambda body: {result['body']}")
-                        return None
-                else:
-                    # Direct Lambda response
-                    if result.get('success'):
-                        return result
-                    else:
-                        self.logger.warning(f"Lambda returned success=False: {result}")
-                        return None
+                body_data = self._unwrap(result)
+                if body_data is None:
+                    return None
+                if body_data.get('success'):
+                    return body_data
+                self.logger.warning(f"Lambda returned success=False: {body_data}")
+                return None
             else:
                 self.logger.error(f"Lambda request failed with status {response.status_code}: {response.text}")
                 return None
                 
+        except CircuitOpenError as e:
+            self.logger.warning(str(e))
+            return None
         except requests.exceptions.RequestException as e:
             self.logger.error(f"Request to Lambda failed: {e}")
             return None
@@ -94,10 +279,70 @@ class LambdaClient:
             self.logger.error(f"Unexpected error in Lambda client: {e}")
             return None
     
+    def get_restaurants_batch(self, spins: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get several restaurant recommendations from Lambda in one request. Spins that
+        share a location, date, time, party size and cuisines share one search.
+        Hedged like get_restaurant when hedging is enabled.
+        
+        Args:
+            spins: List of spin requests, each with the keys accepted by get_restaurant
+                   (date, party_size, time, location, cuisines)
+            
+        Returns:
+            List with one result per spin, in order, or None if the request failed.
+            Each result has success=True and a restaurant, or success=False and a message.
+        """
+        try:
+            self.logger.info(f"Sending batch of {len(spins)} spins to Lambda")
+            
+            response = self._post("/restaurants/batch", {"spins": spins}, hedge=self.hedge)
+            
+            if response.status_code != 200:
+                self.logger.error(f"Lambda batch request failed with status {response.status_code}: {response.text}")
+                return None
+            
+            body_data = self._unwrap(response.json())
+            if body_data is None or 'results' not in body_data:
+                self.logger.warning(f"Lambda batch returned no results: {body_data}")
+                return None
+            return batch_results(body_data)
+                
+        except CircuitOpenError as e:
+            self.logger.warning(str(e))
+            return None
+        except requests.exceptions.RequestException as e:
+            self.logger.error(f"Batch request to Lambda failed: {e}")
+            return None
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Failed to parse Lambda batch response: {e}")
+            return None
+        except Exception as e:
+            self.logger.error(f"Unexpected error in Lambda client: {e}")
+            return None
+    
+    def _unwrap(self, result: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Unwrap an API Gateway style response (whose JSON body is a string under
+        'body') or return a direct Lambda response as is.
+        
+        Returns:
+            The response payload, or None if the body could not be parsed
+        """
+        if 'body' in result:
+            # API Gateway response - parse the body
+            try:
+                return json.loads(result['body'])
+            except json.JSONDecodeError:
+                self.logger.error(f"Failed to parse Lambda body: {result['body']}")
+                return None
+        # Direct Lambda response
+        return result
+    
     def health_check(self) -> bool:
         """Check if the Lambda API is accessible"""
         try:
-            response = requests.get(f"{self.api_url}/health", timeout=10)
+            response = self.session.get(f"{self.api_url}/health", timeout=(self.timeout[0], 10))
             return response.status_code == 200
         except:
             return False
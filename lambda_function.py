@@ -3,12 +3,58 @@
 import json
 import os
 import logging
-from retrieve import ResyRetriever
+from concurrent.futures import ThreadPoolExecutor
+from context import get_context, timed_import
+
+# Imports are timed so the startup report shows what a cold start spends loading dependencies
+timed_import("requests")
+resy_session = timed_import("resy_session")
+get_search_cache = timed_import("search_cache").get_search_cache
+get_catalog = timed_import("catalog").get_catalog
+geocode = timed_import("geocode")
+retrieve = timed_import("retrieve")
+ResyRetriever = retrieve.ResyRetriever
+from scheduler import get_scheduler
+import warmer
+from candidates import encode_candidates
+from timing import start_timer
 
 # Configure logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+# Set up the process context during the Lambda init phase so warm invocations reuse it
+get_context()
+
+# Default spin mode: "eager" searches every cuisine, "lazy" and "lazy-uniform" fetch only the page holding the pick
+ROULETTE_MODE = os.environ.get("RESY_ROULETTE_MODE", "eager")
+ROULETTE_MODES = ("eager", "lazy", "lazy-uniform")
+
+# Batch spins: most spins accepted per request, and how many distinct searches run at once
+MAX_BATCH_SIZE = int(os.environ.get("RESY_MAX_BATCH_SIZE", 50))
+BATCH_WORKERS = int(os.environ.get("RESY_BATCH_WORKERS", 4))
+
+# Log stage timings as CloudWatch Embedded Metric Format records when enabled
+EMIT_METRICS = os.environ.get("RESY_METRICS_EMF", "") not in ("", "0", "false")
+
+class InvalidSpin(ValueError):
+    """Raised when a spin request has a malformed parameter, answered with a 400."""
+
+def _response(status_code:int, payload:dict, headers:dict = None) -> dict:
+    """Builds an API Gateway style response with a JSON body."""
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    if headers:
+        response_headers.update(headers)
+    return {
+        'statusCode': status_code,
+        'headers': response_headers,
+        'body': json.dumps(payload)
+    }
+
+
 def lambda_handler(event, context):
     """
     AWS Lambda handler function
@@ -19,117 +65,289 @@ def lambda_handler(event, context):
         "time": "19:00",
         "party_size": 2,
         "location": "New York City, New York",
-        "cuisines": "Japanese, Korean, American"
+        "cuisines": "Japanese, Korean, American",
+        "mode": "lazy"  (optional, one of ROULETTE_MODES, defaults to RESY_ROULETTE_MODE)
+        "candidates": true  (optional, also return the searched venues as a candidate set token)
+        "radius": 50000  (optional, search radius in meters, defaults to geocode.DEFAULT_RADIUS)
+        "tile_meters": 8000  (optional, search the area as a grid of cells this wide, defaults to RESY_TILE_METERS)
+        "max_distance": 5000  (optional, only pick restaurants within this many meters)
+        "half_distance": 2000  (optional, weight picks by proximity, see selection.SelectionEngine)
     }
+
+    Batch requests (POST /restaurants/batch, or a direct invocation with a "spins" key) take
+    {"spins": [<spin request>, ...]} and return one result per spin, in order.
+
+    Scheduled events (source "aws.events") and direct invocations with a "warm" key run the cache warmer, see the
+    warmer module. {"warm": {"budget": 100, "locations": [...]}} overrides the configured matrix and budget.
+
+    Spin responses include a "timing" section and a Server-Timing header with per-stage latencies for sampled
+    invocations (RESY_TIMING_SAMPLE_RATE).
     """
     try:
+        process_context = get_context()
+        if process_context.begin_invocation():
+            logger.info("Cold start: %s", process_context.startup_report())
+
         # Handle different event types (API Gateway, direct invocation, etc.)
         if 'httpMethod' in event:
             # API Gateway event
             if event['httpMethod'] == 'GET' and event['path'] == '/health':
-                return {
-                    'statusCode': 200,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({
-                        'status': 'healthy',
-                        'service': 'resy-roulette-lambda'
-                    })
-                }
+                return _response(200, {
+                    'status': 'healthy',
+                    'service': 'resy-roulette-lambda',
+                    'connection_pool': resy_session.pool_stats(),
+                    'search_cache': get_search_cache().stats() if get_search_cache() else None,
+                    'venue_catalog': get_catalog().stats() if get_catalog() else None,
+                    'upstream_scheduler': get_scheduler().stats(),
+                    'credentials': process_context.credentials.stats(),
+                    'startup': process_context.startup_report()
+                })
             elif event['httpMethod'] == 'POST' and event['path'] == '/restaurant':
-                # Parse body from API Gateway
-                if 'body' in event:
-                    body = event['body']
-                    if isinstance(body, str):
-                        body = json.loads(body)
-                else:
-                    body = event
+                body = _request_body(event)
+                endpoint = 'restaurant'
+            elif event['httpMethod'] == 'POST' and event['path'] == '/restaurants/batch':
+                body = _request_body(event)
+                endpoint = 'batch'
             else:
-                return {
-                    'statusCode': 404,
-                    'headers': {
-                        'Content-Type': 'application/json',
-                        'Access-Control-Allow-Origin': '*'
-                    },
-                    'body': json.dumps({'error': 'Endpoint not found'})
-                }
+                return _response(404, {'error': 'Endpoint not found'})
         else:
-            # Direct Lambda invocation
+            # Direct Lambda invocation, or a scheduled cache warm run
             body = event
-        
-        # Extract parameters with defaults
-        date = body.get('date', '')
-        time = body.get('time', '')
-        party_size = int(body.get('party_size', 2))
-        location_input = body.get('location', 'New York City, New York')
-        cuisines_input = body.get('cuisines', '')
-        
-        # Parse cuisines
-        if cuisines_input:
-            cuisines_list = [cuisine.strip() for cuisine in cuisines_input.split(',')]
-        else:
-            cuisines_list = []
-        
-        # Get location coordinates
-        location = ResyRetriever.get_location(location_input)
-        
-        # Create ResyRetriever object
-        retriever = ResyRetriever(
-            date=date,
-            party_size=party_size,
-            time=time,
-            location=location,
-            cuisine_list=cuisines_list
-        )
-        
-        # Get restaurants and randomize
-        restaurants = retriever.get_restaurants()
-        
-        if restaurants:
-            randomized_restaurant = retriever.randomize_restaurants(restaurants)
-            
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': True,
-                    'restaurant': {
-                        'name': str(randomized_restaurant['name']),
-                        'cuisine': randomized_restaurant['cuisine'],
-                        'location': randomized_restaurant['location']
-                    },
-                    'total_restaurants_found': len(restaurants)
-                })
-            }
+            if 'spins' in event:
+                endpoint = 'batch'
+            elif 'warm' in event or event.get('source') == 'aws.events':
+                endpoint = 'warm'
+            else:
+                endpoint = 'restaurant'
+
+        timer = start_timer()
+        if endpoint == 'batch':
+            spins = body.get('spins')
+            if not isinstance(spins, list) or not spins:
+                return _response(400, {'success': False, 'error': 'Expected a non-empty "spins" list'})
+            if len(spins) > MAX_BATCH_SIZE:
+                return _response(400, {'success': False,
+                                       'error': f'At most {MAX_BATCH_SIZE} spins are accepted per batch'})
+            payload = run_batch(spins, timer)
+        elif endpoint == 'warm':
+            # Scheduled events carry no settings, manual runs may override the matrix and budget under "warm"
+            payload = warmer.warm(body.get('warm') if isinstance(body.get('warm'), dict) else None)
         else:
-            return {
-                'statusCode': 200,
-                'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                },
-                'body': json.dumps({
-                    'success': False,
-                    'message': 'No restaurants found for the given criteria',
-                    'total_restaurants_found': 0
-                })
-            }
-            
+            payload = run_spin(body, timer)
+
+        headers = None
+        if timer.enabled:
+            payload['timing'] = timer.report()
+            headers = {'Server-Timing': timer.server_timing()}
+            if EMIT_METRICS:
+                print(json.dumps(timer.emf({'Endpoint': endpoint})))
+        return _response(200, payload, headers)
+
+    except InvalidSpin as e:
+        return _response(400, {
+            'success': False,
+            'error': str(e)
+        })
     except Exception as e:
         logger.error(f"Error in lambda_handler: {str(e)}")
+        return _response(500, {
+            'success': False,
+            'error': str(e)
+        })
+
+def _request_body(event:dict) -> dict:
+    """Returns the JSON body of an API Gateway event, or the event itself if it has none."""
+    if 'body' in event:
+        body = event['body']
+        if isinstance(body, str):
+            body = json.loads(body)
+        return body
+    return event
+
+def _parse_spin(body:dict) -> dict:
+    """Extracts a spin request's parameters, applying defaults.
+
+    :param dict body: spin request with date, time, party_size, location, cuisines and optional mode, candidates,
+        radius, tile_meters, max_distance and half_distance
+    :raises InvalidSpin: if a parameter is malformed, e.g. a time that is not HH:MM
+    :return dict: date, time, party_size, location, cuisines (list), mode, candidates, radius, tile_meters,
+        max_distance and half_distance. time is "", HH:MM or a window HH:MM-HH:MM and party_size may be a range
+        "low-high".
+    """
+    # Malformed parameters are rejected here, so a single spin gets a 400 and a batch fails only the spin that sent them
+    try:
+        cuisines_input = body.get('cuisines', '')
+        mode = body.get('mode') or ROULETTE_MODE
+        if mode not in ROULETTE_MODES:
+            raise ValueError(f"Unknown mode {mode}, expected one of {ROULETTE_MODES}")
+
         return {
-            'statusCode': 500,
-            'headers': {
-                'Content-Type': 'application/json',
-                'Access-Control-Allow-Origin': '*'
-            },
-            'body': json.dumps({
-                'success': False,
-                'error': str(e)
-            })
+            'date': body.get('date', ''),
+            'time': retrieve.normalize_time(body.get('time', '')),
+            'party_size': retrieve.normalize_party_size(body.get('party_size', 2)),
+            'location': body.get('location', 'New York City, New York'),
+            # Parse cuisines
+            'cuisines': [cuisine.strip() for cuisine in cuisines_input.split(',')] if cuisines_input else [],
+            'mode': mode,
+            'candidates': bool(body.get('candidates', False)),
+            'radius': int(body['radius']) if body.get('radius') else None,
+            'tile_meters': float(body['tile_meters']) if body.get('tile_meters') is not None else None,
+            'max_distance': float(body['max_distance']) if body.get('max_distance') else None,
+            'half_distance': float(body['half_distance']) if body.get('half_distance') else None
+        }
+    except (ValueError, TypeError, AttributeError) as e:
+        raise InvalidSpin(str(e)) from e
+
+def _retriever(spin:dict, timer, location:dict = None) -> ResyRetriever:
+    """Creates the ResyRetriever for a parsed spin, geocoding its location unless already resolved."""
+    # Get location coordinates
+    if location is None:
+        with timer.stage("get_location"):
+            location = ResyRetriever.get_location(spin['location'])
+    if spin['radius']:
+        location = dict(location, radius=spin['radius'])
+
+    options = {} if spin['tile_meters'] is None else {'tile_meters': spin['tile_meters']}
+    return ResyRetriever(
+        date=spin['date'],
+        party_size=spin['party_size'],
+        time=spin['time'],
+        location=location,
+        cuisine_list=spin['cuisines'],
+        timer=timer,
+        max_distance=spin['max_distance'],
+        half_distance=spin['half_distance'],
+        **options
+    )
+
+def _pick(retriever:ResyRetriever, restaurants:list, candidates:str = None) -> dict:
+    """Builds the response payload for one random pick from a search's restaurants, with the candidate set token
+    and the pick's position in it if one is given."""
+    randomized_restaurant = retriever.randomize_restaurants(restaurants) if restaurants else None
+    if randomized_restaurant is not None:
+        eligible = retriever.selection(restaurants).venues
+        payload = {
+            'success': True,
+            'restaurant': randomized_restaurant.to_dict(),
+            'total_restaurants_found': len(eligible)
         }
+        if candidates is not None:
+            payload['candidates'] = candidates
+            payload['candidate_index'] = eligible.index(randomized_restaurant)
+        return payload
+    return {
+        'success': False,
+        'message': 'No restaurants found for the given criteria',
+        'total_restaurants_found': 0
+    }
+
+def run_spin(body:dict, timer) -> dict:
+    """Runs one spin: geocodes the location, searches the requested cuisines and picks a random restaurant.
+
+    :param dict body: spin request with date, time, party_size, location, cuisines and optional mode
+    :param StageTimer timer: collects per-stage latencies for the invocation
+    :return dict: response payload
+    """
+    spin = _parse_spin(body)
+    retriever = _retriever(spin, timer)
+
+    # Lazy spins fetch only the page holding the pick, falling back to a full search if that page fails or every draw
+    # was rejected, see ResyRetriever.lazy_randomize. Spins asking for the candidate set or filtering and weighting by
+    # distance need the full list, tiled spins search every cell and time window or party size range spins match every
+    # venue's slots, so these always search eagerly.
+    # Spins the venue catalog covers look their candidates up locally, which is cheaper than a lazy spin's counts.
+    full_list = (spin['candidates'] or spin['max_distance'] or spin['half_distance'] or retriever.tile_meters
+                 or retriever.windowed or retriever.catalog_ready())
+    if spin['mode'] != 'eager' and not full_list:
+        weighting = 'uniform' if spin['mode'] == 'lazy-uniform' else 'count'
+        randomized_restaurant, total = retriever.lazy_randomize(weighting)
+        if randomized_restaurant is not None:
+            return {
+                'success': True,
+                'restaurant': randomized_restaurant.to_dict(),
+                'total_restaurants_found': total
+            }
+        if not total:
+            return _pick(retriever, [])
+
+    # Get restaurants and randomize
+    restaurants = retriever.get_restaurants()
+    logger.debug("Resy connection pool: %s", resy_session.pool_stats())
+    candidates = _candidates(retriever.candidate_venues(restaurants), timer) if spin['candidates'] else None
+    return _pick(retriever, restaurants, candidates)
+
+def _candidates(restaurants:list, timer) -> str:
+    """Encodes a search's restaurants as a candidate set token, see the candidates module. Returns None if there
+    are none, e.g. for restaurants drawn from the venue catalog, see ResyRetriever.candidate_venues."""
+    if not restaurants:
+        return None
+    with timer.stage("encode_candidates"):
+        return encode_candidates([venue.to_row() for venue in restaurants])
+
+def run_batch(spins:list, timer) -> dict:
+    """Runs many spins in one invocation. Each distinct location is geocoded once, and spins are grouped by the
+    search they need (coordinates, date, time, party size and cuisines). Each distinct search runs once, concurrently
+    with the others, and every spin in its group gets its own random pick from the shared results. Batch spins always
+    search eagerly, since several picks come from the same list. A search's candidate set token is sent once, in
+    candidate_sets, and the results of spins that asked for it refer to it by position as candidate_set.
+
+    :param list[dict] spins: spin requests, in the format accepted by run_spin
+    :param StageTimer timer: collects per-stage latencies for the invocation
+    :return dict: response payload with one result per spin, in request order, and the candidate set tokens
+    """
+    results = [None] * len(spins)
+    locations = {}
+    groups = {}
+    for index, body in enumerate(spins):
+        try:
+            spin = _parse_spin(body)
+        except InvalidSpin as e:
+            results[index] = {'success': False, 'error': str(e)}
+            continue
+
+        address = geocode.normalize(spin['location'])
+        if address not in locations:
+            with timer.stage("get_location"):
+                locations[address] = ResyRetriever.get_location(spin['location'])
+        location = locations[address]
+
+        key = (location['latitude'], location['longitude'], location['radius'], spin['date'], spin['time'],
+               spin['party_size'], tuple(spin['cuisines']), spin['radius'], spin['tile_meters'], spin['max_distance'],
+               spin['half_distance'])
+        groups.setdefault(key, (spin, location, []))[2].append((index, spin['candidates']))
+    timer.count("batch_spins", len(spins))
+    timer.count("batch_searches", len(groups))
+
+    def search(group):
+        spin, location, members = group
+        try:
+            retriever = _retriever(spin, timer, location)
+            restaurants = retriever.get_restaurants()
+            # The token is encoded once per search and shared by the spins in the group that asked for it
+            candidates = None
+            if any(wants_candidates for _, wants_candidates in members):
+                candidates = _candidates(retriever.candidate_venues(restaurants), timer)
+            return candidates, [(index, _pick(retriever, restaurants, candidates if wants_candidates else None))
+                                for index, wants_candidates in members]
+        except Exception as e:
+            logger.error(f"Error in batch search: {str(e)}")
+            return None, [(index, {'success': False, 'error': str(e)}) for index, _ in members]
+
+    candidate_sets = []
+    if groups:
+        with ThreadPoolExecutor(max_workers=max(1, min(BATCH_WORKERS, len(groups)))) as executor:
+            for candidates, group_results in executor.map(search, groups.values()):
+                if candidates is not None:
+                    candidate_sets.append(candidates)
+                for index, payload in group_results:
+                    # Picks from one search refer to its token rather than each carrying a copy
+                    if payload.pop('candidates', None) is not None:
+                        payload['candidate_set'] = len(candidate_sets) - 1
+                    results[index] = payload
+
+    return {
+        'success': any(result.get('success') for result in results),
+        'results': results,
+        'candidate_sets': candidate_sets,
+        'distinct_searches': len(groups)
+    }
@@ -0,0 +1,156 @@
+"""
+In-process client for Resy Roulette
+Runs the retrieval pipeline inside the Flask process, behind the same interface
+as LambdaClient, for single-node deployments without the Lambda HTTP hop
+"""
+
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+from typing import Dict, Any, List, Optional
+
+from candidates import batch_results
+
+class LocalClient:
+    """Client that runs spins in a bounded worker pool in this process"""
+
+    def __init__(self, max_workers: int = 8, max_queue: int = 32, timeout: float = 30):
+        """
+        Initialize the local client. The retrieval modules are imported here, so
+        Flask deployments using LambdaClient never load them.
+
+        Args:
+            max_workers: Spins run concurrently
+            max_queue: Spins allowed to wait for a worker before new ones are rejected
+            timeout: Seconds a caller waits for its spin before giving up
+        """
+        import lambda_function
+        from timing import start_timer
+
+        self._lambda_function = lambda_function
+        self._start_timer = start_timer
+        self.timeout = timeout
+        self.logger = logging.getLogger(__name__)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='local-spin')
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self._counters = {'requests': 0, 'failures': 0, 'rejected': 0, 'timeouts': 0}
+
+    def _count(self, name: str, amount: int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def _run(self, function, *args) -> Optional[Dict[str, Any]]:
+        """
+        Run a pipeline function on the worker pool and wait for its payload.
+
+        Returns:
+            The payload, or None if the pool is full, the spin timed out or failed
+        """
+        if not self._slots.acquire(blocking=False):
+            self._count('rejected')
+            self.logger.warning("Local worker pool is full, rejecting spin")
+            return None
+        self._count('requests')
+
+        def task():
+            try:
+                timer = self._start_timer()
+                payload = function(*args, timer)
+                if timer.enabled:
+                    payload['timing'] = timer.report()
+                return payload
+            finally:
+                self._slots.release()
+
+        try:
+            return self._executor.submit(task).result(timeout=self.timeout)
+        except TimeoutError:
+            self._count('timeouts')
+            self.logger.error(f"Local spin timed out after {self.timeout}s")
+            return None
+        except Exception as e:
+            self._count('failures')
+            self.logger.error(f"Local spin failed: {e}")
+            return None
+
+    def get_restaurant(self, date: str, party_size: int, time: str,
+                       location: str, cuisines: str, candidates: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        Get restaurant recommendation from the in-process pipeline
+
+        Args:
+            date: Date in YYYY-MM-DD format
+            party_size: Number of people, or a range such as "2-4"
+            time: Time in HH:MM format, or a window HH:MM-HH:MM
+            location: Location string
+            cuisines: Comma-separated cuisine types
+            candidates: Also return the searched venues as a candidate set token, for local re-spins
+
+        Returns:
+            Dictionary with restaurant data or None if failed
+        """
+        payload = {
+            "date": date,
+            "party_size": party_size,
+            "time": time,
+            "location": location,
+            "cuisines": cuisines
+        }
+        if candidates:
+            payload["candidates"] = True
+        result = self._run(self._lambda_function.run_spin, payload)
+        if result and result.get('success'):
+            return result
+        if result is not None:
+            self.logger.warning(f"Local spin returned success=False: {result}")
+        return None
+
+    def get_restaurants_batch(self, spins: List[Dict[str, Any]]) -> Optional[List[Dict[str, Any]]]:
+        """
+        Get several restaurant recommendations in one call, sharing searches
+        between spins as the Lambda batch endpoint does.
+
+        Args:
+            spins: List of spin requests, each with the keys accepted by get_restaurant
+
+        Returns:
+            List with one result per spin, in order, or None if the batch failed
+        """
+        if not spins or len(spins) > self._lambda_function.MAX_BATCH_SIZE:
+            self.logger.error(f"Batch must hold 1 to {self._lambda_function.MAX_BATCH_SIZE} spins")
+            return None
+        result = self._run(self._lambda_function.run_batch, spins)
+        return batch_results(result) if result else None
+
+    def health_check(self) -> bool:
+        """The pipeline runs in this process, so it is healthy while the pool accepts work"""
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        """Return request, failure, rejection and timeout counters"""
+        with self._lock:
+            return dict(self._counters)
+
+
+def create_client(backend: str, api_gateway_url: str, **lambda_options):
+    """
+    Create the backend client for the Flask app.
+
+    Args:
+        backend: "lambda" to call the deployed Lambda over HTTP, "local" to run in process
+        api_gateway_url: API Gateway URL, used by the lambda backend
+        lambda_options: Extra keyword arguments for LambdaClient
+
+    Returns:
+        LambdaClient or LocalClient
+    """
+    if backend == 'local':
+        return LocalClient(max_workers=int(os.environ.get('LOCAL_MAX_WORKERS', 8)),
+                           max_queue=int(os.environ.get('LOCAL_MAX_QUEUE', 32)),
+                           timeout=float(os.environ.get('LOCAL_TIMEOUT', 30)))
+    if backend == 'lambda':
+        from lambda_client import LambdaClient
+        return LambdaClient(api_gateway_url, **lambda_options)
+    raise ValueError(f"Unknown backend {backend}, expected 'lambda' or 'local'")
@@ -1,21 +1,46 @@
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, session
 from waitress import serve
 import os
+import secrets
 from dotenv import load_dotenv
-from lambda_client import LambdaClient
+from local_client import create_client
+from coalescing_client import CoalescingClient
+from candidates import CandidateStore, query_key
 
 # Load environment variables from .env file
 load_dotenv()
 
 app = Flask(__name__)
+# Signs the session cookie, which only holds the id of the session's candidate sets
+app.secret_key = os.environ.get('FLASK_SECRET_KEY') or secrets.token_bytes(32)
 
 # Load configuration from environment variables
 app.config.update(
-    LAMBDA_API_URL=os.environ.get('LAMBDA_API_URL', 'http://localhost:3000')
+    # "lambda" calls the deployed Lambda over HTTP, "local" runs the retrieval pipeline in this process
+    RESY_BACKEND=os.environ.get('RESY_BACKEND', 'lambda'),
+    LAMBDA_API_URL=os.environ.get('LAMBDA_API_URL', 'http://localhost:3000'),
+    LAMBDA_CONNECT_TIMEOUT=float(os.environ.get('LAMBDA_CONNECT_TIMEOUT', 3.05)),
+    LAMBDA_READ_TIMEOUT=float(os.environ.get('LAMBDA_READ_TIMEOUT', 30)),
+    LAMBDA_HEDGE=os.environ.get('LAMBDA_HEDGE', '').lower() in ('1', 'true', 'yes'),
+    # Identical concurrent spins share one backend request with this many picks, 0 disables coalescing
+    COALESCE_PICKS=int(os.environ.get('COALESCE_PICKS', 8)),
+    # Keep each search's candidate set per session and serve re-spins of the same search from it
+    # Asking for the candidate set makes the backend search eagerly, so lazy roulette modes only apply when this is off
+    LOCAL_RESPINS=os.environ.get('LOCAL_RESPINS', 'true').lower() in ('1', 'true', 'yes')
 )
 
-# Initialize Lambda client
-lambda_client = LambdaClient(app.config['LAMBDA_API_URL'])
+# Initialize backend client, LambdaClient or LocalClient depending on RESY_BACKEND
+backend_client = create_client(
+    app.config['RESY_BACKEND'],
+    app.config['LAMBDA_API_URL'],
+    connect_timeout=app.config['LAMBDA_CONNECT_TIMEOUT'],
+    read_timeout=app.config['LAMBDA_READ_TIMEOUT'],
+    hedge=app.config['LAMBDA_HEDGE']
+)
+if app.config['COALESCE_PICKS'] > 0:
+    backend_client = CoalescingClient(backend_client, picks=app.config['COALESCE_PICKS'])
+
+candidate_store = CandidateStore()
 
 @app.route('/')
 @app.route('/index')
@@ -33,16 +58,27 @@ def get_restaurant():
         location_input = request.form['location']
         cuisines_input = request.form['cuisines']
         
-        # Call Lambda API instead of local ResyRetriever
-        result = lambda_client.get_restaurant(
+        # Re-spins of a search this session already ran are drawn from its candidate set, without repeats
+        search = query_key(date, party_size, time, location_input, cuisines_input)
+        if app.config['LOCAL_RESPINS']:
+            session_id = session.setdefault('sid', secrets.token_urlsafe(16))
+            candidate = candidate_store.draw(session_id, search)
+            if candidate is not None:
+                return render_template('retrieve.html', title="Restaurant", restaurant=candidate[1])
+        
+        # Call the configured backend, the Lambda API or the in-process pipeline
+        result = backend_client.get_restaurant(
             date=date,
-            party_size=int(party_size),
+            party_size=party_size.strip(),
             time=time,
             location=location_input,
-            cuisines=cuisines_input
+            cuisines=cuisines_input,
+            candidates=app.config['LOCAL_RESPINS']
         )
         
         if result and result.get('success'):
+            if result.get('candidates'):
+                candidate_store.put(session_id, search, result['candidates'], result.get('candidate_index'))
             restaurant_name = result['restaurant']['name']
             return render_template('retrieve.html', title="Restaurant", restaurant=restaurant_name)
         else:
@@ -55,12 +91,15 @@ def get_restaurant():
 
 @app.route('/health')
 def health_check():
-    """Health check endpoint to verify Lambda connectivity"""
-    lambda_healthy = lambda_client.health_check()
+    """Health check endpoint to verify backend connectivity"""
+    lambda_healthy = backend_client.health_check()
     return jsonify({
         'flask_app': 'healthy',
+        'backend': app.config['RESY_BACKEND'],
         'lambda_api': 'healthy' if lambda_healthy else 'unhealthy',
-        'lambda_api_url': app.config['LAMBDA_API_URL']
+        'lambda_api_url': app.config['LAMBDA_API_URL'],
+        'lambda_client': backend_client.stats(),
+        'candidate_sets': candidate_store.stats()
     })
 
 if __name__ == "__main__":
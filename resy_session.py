@@ -0,0 +1,93 @@
+"""Shared, connection-pooled HTTP session for calls to the Resy api. The session lives at module scope so every
+ResyRetriever in the process, including those built by later warm Lambda invocations, reuses the same keep-alive
+connections instead of paying a fresh TCP and TLS handshake per request."""
+
+import os
+import threading
+import logging
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection pool and retry settings, overridable through the environment
+DEFAULT_POOL_SIZE = int(os.environ.get("RESY_POOL_SIZE", 16))
+DEFAULT_MAX_RETRIES = int(os.environ.get("RESY_MAX_RETRIES", 2))
+DEFAULT_BACKOFF_FACTOR = float(os.environ.get("RESY_BACKOFF_FACTOR", 0.2))
+
+_session = None
+_adapter = None
+_lock = threading.Lock()
+logger = logging.getLogger(__name__)
+
+def _build_session(pool_size:int, max_retries:int, backoff_factor:float) -> tuple[requests.Session, HTTPAdapter]:
+    """Builds a session whose https adapter keeps up to pool_size connections alive per host and retries
+    connection errors with exponential backoff. Read errors and error statuses are not retried, since venue
+    searches are POSTs and the caller decides how to handle a failed response.
+
+    :param int pool_size: number of keep-alive connections kept per host
+    :param int max_retries: number of retries for connection errors
+    :param float backoff_factor: backoff factor between retries, in seconds
+    :return tuple[requests.Session, HTTPAdapter]: the session and its https adapter
+    """
+    retry = Retry(total=max_retries, connect=max_retries, read=0, status=0,
+                  backoff_factor=backoff_factor, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size, max_retries=retry, pool_block=False)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session, adapter
+
+def configure(pool_size:int = DEFAULT_POOL_SIZE,
+              max_retries:int = DEFAULT_MAX_RETRIES,
+              backoff_factor:float = DEFAULT_BACKOFF_FACTOR) -> requests.Session:
+    """Replaces the shared session with one using the given pool settings. Existing connections are closed.
+
+    :param int pool_size: number of keep-alive connections kept per host
+    :param int max_retries: number of retries for connection errors
+    :param float backoff_factor: backoff factor between retries, in seconds
+    :return requests.Session: the new shared session
+    """
+    global _session, _adapter
+    with _lock:
+        if _session is not None:
+            _session.close()
+        _session, _adapter = _build_session(pool_size, max_retries, backoff_factor)
+        logger.info("Resy session configured: pool_size=%d, max_retries=%d", pool_size, max_retries)
+        return _session
+
+def get_session() -> requests.Session:
+    """Returns the process-wide session, creating it with the default settings on first use.
+
+    :return requests.Session: the shared session
+    """
+    global _session, _adapter
+    if _session is None:
+        with _lock:
+            if _session is None:
+                _session, _adapter = _build_session(DEFAULT_POOL_SIZE, DEFAULT_MAX_RETRIES, DEFAULT_BACKOFF_FACTOR)
+    return _session
+
+def pool_stats() -> dict:
+    """Reports connection reuse for the shared session. Connections opened is the number of handshakes paid, so
+    requests minus connections opened is the number of handshakes saved by keep-alive.
+
+    :return dict: per-host and total counts of requests, connections opened, and idle pooled connections
+    """
+    stats = {"pool_size": DEFAULT_POOL_SIZE, "requests": 0, "connections_opened": 0, "handshakes_saved": 0, "hosts": {}}
+    if _adapter is None:
+        return stats
+
+    stats["pool_size"] = _adapter._pool_maxsize
+    pools = _adapter.poolmanager.pools
+    for key in list(pools.keys()):
+        pool = pools.get(key)
+        if pool is None:
+            continue
+        host_stats = {"requests": pool.num_requests,
+                      "connections_opened": pool.num_connections,
+                      "idle": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool is not None else 0}
+        stats["hosts"][f"{pool.scheme}://{pool.host}:{pool.port}"] = host_stats
+        stats["requests"] += pool.num_requests
+        stats["connections_opened"] += pool.num_connections
+    stats["handshakes_saved"] = max(0, stats["requests"] - stats["connections_opened"])
+    return stats
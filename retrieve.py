@@ -2,23 +2,188 @@
 that takes in user preferences and filters restaurants based on those preferences."""
 
 import requests
+import resy_session
+from context import get_context
+from timing import NULL_TIMER
+from venue import Venue, dedupe, parse_slots
+from venuesearch import CHUNK_SIZE, parse_venuesearch
+import geocode
+from search_cache import SearchCache, get_search_cache, search_key
+from catalog import VenueCatalog, get_catalog
+from singleflight import SingleFlight
+from selection import SelectionEngine
+from scheduler import INTERACTIVE, BACKGROUND, QueueTimeout, get_scheduler, retry_after_seconds
+from credentials import NoCredentialError
 import os
+import copy
 import random
-from bs4 import BeautifulSoup
-from geopy import geocoders
-from dotenv import load_dotenv
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from typing import Optional
 import logging
 
+# Upper bound on concurrent per-cuisine searches and per-request timeout (seconds) for Resy calls
+DEFAULT_MAX_WORKERS = int(os.environ.get("RESY_MAX_WORKERS", 8))
+DEFAULT_REQUEST_TIMEOUT = float(os.environ.get("RESY_REQUEST_TIMEOUT", 10))
+
+VENUESEARCH_URL = "https://api.resy.com/3/venuesearch/search"
+# Availability of a single venue, used to confirm picks made from the venue catalog
+FIND_URL = "https://api.resy.com/4/find"
+
+# Venue search page size and the most pages fetched per cuisine
+DEFAULT_PER_PAGE = int(os.environ.get("RESY_PER_PAGE", 20))
+DEFAULT_MAX_PAGES = int(os.environ.get("RESY_MAX_PAGES", 5))
+
+# Tiled search: grid cell width in meters (0 searches the whole area as one circle) and most cells per search
+DEFAULT_TILE_METERS = float(os.environ.get("RESY_TILE_METERS", 0))
+DEFAULT_MAX_TILES = int(os.environ.get("RESY_MAX_TILES", 16))
+
+# Cuisine weighting for lazy spins: "count" weights cuisines by their hits, "uniform" picks every cuisine equally often
+LAZY_WEIGHTINGS = ("count", "uniform")
+# Draws a "count" weighted lazy spin makes, each rejecting venues found under another cuisine, before searching eagerly
+LAZY_DRAWS = int(os.environ.get("RESY_LAZY_DRAWS", 8))
+
+# Time window searches: minutes of slots one venue search returns around its time filter, and the grid in minutes
+# its time filters are aligned to, so overlapping windows share searches and cached pages
+DEFAULT_SLOT_SPAN = int(os.environ.get("RESY_SLOT_SPAN_MINUTES", 120))
+SLOT_GRID = int(os.environ.get("RESY_SLOT_GRID_MINUTES", 30))
+# Most party sizes in a party size range, each is searched on its own
+MAX_PARTY_SIZES = int(os.environ.get("RESY_MAX_PARTY_SIZES", 8))
+
+# Picks from the venue catalog checked for availability before a spin falls back to searching Resy
+CONFIRM_ATTEMPTS = int(os.environ.get("RESY_CATALOG_CONFIRM_ATTEMPTS", 5))
+
+# Identical searches in flight at the same time, e.g. from concurrent spins for the same city, share one upstream fetch
+search_flight = SingleFlight()
+
+class UpstreamError(Exception):
+    """Raised when a Resy venue search request fails or returns an unusable response."""
+
+def _minutes(clock:str) -> int:
+    """Converts an HH:MM or HH:MM:SS time to minutes after midnight, dropping the seconds."""
+    parts = clock.strip().split(":")
+    if (len(parts) not in (2, 3) or not all(part.isdigit() for part in parts)
+            or not 0 <= int(parts[0]) < 24 or not all(int(part) < 60 for part in parts[1:])):
+        raise ValueError(f"Invalid time {clock!r}, expected HH:MM")
+    return int(parts[0]) * 60 + int(parts[1])
+
+def _clock(minutes:int) -> str:
+    """Converts minutes after midnight to an HH:MM time."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def parse_time_window(time:str) -> Optional[tuple[int, int]]:
+    """Parses a time window such as "18:30-21:00".
+
+    :param str time: reservation time, a single HH:MM time or a window HH:MM-HH:MM
+    :raises ValueError: if the window is malformed or ends before it starts
+    :return tuple[int, int] | None: start and end of the window in minutes after midnight, None for a single time
+    """
+    if "-" not in (time or ""):
+        return None
+    start, _, end = time.partition("-")
+    window = (_minutes(start), _minutes(end))
+    if window[1] < window[0]:
+        raise ValueError(f"Time window {time!r} ends before it starts")
+    return window
+
+def normalize_time(time:str) -> str:
+    """Validates a reservation time and brings it to the form searches and cache keys use, so "19:00:00" and
+    "19:00" are the same search.
+
+    :param str time: reservation time, empty for any time, a single time or a window HH:MM-HH:MM
+    :raises ValueError: if the time or window is malformed
+    :return str: "", HH:MM or HH:MM-HH:MM
+    """
+    if not (time or "").strip():
+        return ""
+    window = parse_time_window(time)
+    if window is not None:
+        return f"{_clock(window[0])}-{_clock(window[1])}"
+    return _clock(_minutes(time))
+
+def parse_party_sizes(party_size) -> list[int]:
+    """Parses a party size or a party size range such as "2-4".
+
+    :param int | str party_size: one party size, or a range of them
+    :raises ValueError: if the range is malformed, empty or wider than MAX_PARTY_SIZES
+    :return list[int]: every party size in the range
+    """
+    low, _, high = str(party_size).partition("-")
+    low = int(low)
+    high = int(high) if high.strip() else low
+    if low < 1 or high < low:
+        raise ValueError(f"Invalid party size {party_size!r}")
+    if high - low >= MAX_PARTY_SIZES:
+        raise ValueError(f"Party size range {party_size!r} spans more than {MAX_PARTY_SIZES} sizes")
+    return list(range(low, high + 1))
+
+def normalize_party_size(party_size):
+    """Normalizes a party size or range as sent in spin requests.
+
+    :param int | str party_size: one party size, or a range of them
+    :raises ValueError: if the party size is invalid, see parse_party_sizes
+    :return int | str: the party size, or the range as "low-high"
+    """
+    sizes = parse_party_sizes(party_size)
+    return sizes[0] if len(sizes) == 1 else f"{sizes[0]}-{sizes[-1]}"
+
+def slot_anchors(start:int, end:int, span:int = DEFAULT_SLOT_SPAN, grid:int = SLOT_GRID) -> list[int]:
+    """Plans the time filters that cover a time window. Each search returns the slots within span/2 minutes of its
+    time filter, so a window needs one search per span rather than one per slot. Time filters are placed on a fixed
+    grid, so windows that overlap land on the same filters and share their searches.
+
+    :param int start: window start in minutes after midnight
+    :param int end: window end in minutes after midnight
+    :param int span: minutes of slots one search covers
+    :param int grid: minutes between possible time filters
+    :return list[int]: time filters in minutes after midnight, earliest first
+    """
+    grid = max(1, grid)
+    span = max(span, 2 * grid)
+    half = span / 2
+    latest = (24 * 60 - 1) // grid * grid
+    anchors = []
+    covered = start
+    while True:
+        # The latest filter on the grid whose slots still reach back to the first minute not covered yet
+        anchor = int((covered + half) // grid * grid)
+        if end - covered <= span:
+            # The rest fits one search, whose filter is snapped to a multiple of the span where one fits, so short
+            # windows around the same time share it
+            aligned = int((covered + half) // span * span)
+            if aligned + half >= end:
+                anchor = aligned
+        anchor = min(anchor, latest)
+        anchors.append(anchor)
+        covered = anchor + half
+        if covered >= end or anchor == latest:
+            return anchors
+
 class ResyRetriever(object):
     """Class that retrieve and randomizes restaurants based on user preferences. 
 
     Attributes:
         date (str): A string representing the date of the reservation.
-        party_size (int): A string representing the number of people in the party.
-        time (str): A string representing the time of the reservation.
+        party_size (int): A string representing the number of people in the party, or a range of them such as "2-4".
+        time (str): A string representing the time of the reservation, or a window of times such as "18:30-21:00".
+        time_window (tuple[int, int]): Start and end of the time window in minutes after midnight, None for one time.
+        party_sizes (list[int]): Every party size searched for.
+        keep_slots (bool): Whether venue searches keep each venue's bookable slots, set on window searches.
         location (dict): A dictionary representing the location of the reservation.
         cuisine_list (list[str]): A list of strings representing the cuisines the user wants to eat.
+        max_workers (int): Maximum number of cuisine searches issued to Resy concurrently.
+        request_timeout (float): Timeout in seconds for each request to the Resy api.
+        per_page (int): Number of hits requested per venue search page.
+        max_pages (int): Maximum number of pages fetched per cuisine.
+        search_cache (SearchCache): Cache of venue search results, None to always query Resy.
+        timer (StageTimer): Collects per-stage latencies and counters for the current invocation.
+        priority (int): Scheduler priority of this retriever's Resy calls, INTERACTIVE or BACKGROUND.
+        tile_meters (float): Grid cell width for tiled searches, 0 to search the location as one circle.
+        max_tiles (int): Most grid cells a tiled search is split into.
+        max_distance (float): Picks farther than this many meters from the location are excluded, None for no limit.
+        half_distance (float): Distance in meters at which a pick is half as likely as one at the location, None for uniform picks.
+        catalog (VenueCatalog): Local venue catalog searches are recorded in and candidates are drawn from, None to
+            always search Resy.
     """
 
     # Total set of cuisines, static variable
@@ -44,41 +209,60 @@ class ResyRetriever(object):
     @staticmethod
     def get_location(address:str) -> dict:
         """ Helper method to find the longitude and latitude of the location given in address form, defaults to NYC if address is not found
-        Takes address of restaurants then, parses through geopy and geonames api to get the latitude and longitude of the location to return
-        
+        Popular metros resolve from a bundled gazetteer and repeat addresses from the geocoding caches, so the
+        geopy and geonames api are only used for new addresses. See the geocode module.
+
         :param str address: String input of user location
-        :return dict: dictionary of location's latitude and longitude 
+        :return dict: dictionary of location's latitude and longitude
         """
+        return geocode.get_location(address)
 
-        logger = logging.getLogger(__name__)
-        gn = geocoders.GeoNames(username='yunjun505')
-        try:
-            location = gn.geocode(address)
-            return {"latitude":location.latitude,"longitude":location.longitude,"radius":35420}
-        except Exception as e:
-            logger.info(e)
-            logger.info("Error, defaulting to NYC")
-            return {"latitude":location['latitude'],"longitude":location['longitude'],"radius":35420}
-   
     def __init__(self,
-                 date:str=datetime.today().strftime('%Y-%m-%d'),
+                 date:str=None,
                  time:str="",
                  location:dict = None,
                  party_size:int = 2,
-                 cuisine_list:list[str] = applicable_cuisine_list):
+                 cuisine_list:list[str] = applicable_cuisine_list,
+                 max_workers:int = DEFAULT_MAX_WORKERS,
+                 request_timeout:float = DEFAULT_REQUEST_TIMEOUT,
+                 per_page:int = DEFAULT_PER_PAGE,
+                 max_pages:int = DEFAULT_MAX_PAGES,
+                 search_cache:SearchCache = None,
+                 timer = NULL_TIMER,
+                 priority:int = INTERACTIVE,
+                 tile_meters:float = DEFAULT_TILE_METERS,
+                 max_tiles:int = DEFAULT_MAX_TILES,
+                 max_distance:float = None,
+                 half_distance:float = None,
+                 catalog:VenueCatalog = None):
         """Constructor Method
 
         Args:
-            date (str): The date of the reservation.
-            time (str): The time of the reservation.
+            date (str, optional): The date of the reservation. Defaults to today.
+            time (str): The time of the reservation, HH:MM, or a window HH:MM-HH:MM to find venues with a slot in it.
             location (dict, optional): The location of the reservation, in the form {longitude: _, latitude: _, radius: _}. Defaults to that of NYC.
-            party_size (int, optional): Requested party size for the reservation. Defaults to 2.
+            party_size (int, optional): Requested party size for the reservation, or a range such as "2-4". Defaults to 2.
             cuisine_list (list[str], optional): The list of cuisines to search. Defaults to all available cuisines available in Resy.
+            max_workers (int, optional): Maximum number of concurrent cuisine searches, 1 searches serially. Defaults to 8.
+            request_timeout (float, optional): Timeout in seconds for each Resy request. Defaults to 10.
+            per_page (int, optional): Hits requested per venue search page. Defaults to 20.
+            max_pages (int, optional): Maximum pages fetched per cuisine. Defaults to 5.
+            search_cache (SearchCache, optional): Cache of venue search results. Defaults to the shared cache configured by RESY_SEARCH_CACHE.
+            timer (StageTimer, optional): Per-stage latency collector, see the timing module. Defaults to no timing.
+            priority (int, optional): Scheduler priority for Resy calls, see the scheduler module. Defaults to INTERACTIVE.
+            tile_meters (float, optional): Grid cell width for tiled searches, 0 for one circle. Defaults to RESY_TILE_METERS, off.
+            max_tiles (int, optional): Most grid cells per tiled search. Defaults to 16.
+            max_distance (float, optional): Maximum distance of a pick in meters. Defaults to no limit.
+            half_distance (float, optional): Proximity weighting of picks, see selection.SelectionEngine. Defaults to uniform picks.
+            catalog (VenueCatalog, optional): Local venue catalog. Defaults to the shared catalog configured by RESY_CATALOG.
         """
-        self.date = date
+        self.date = date or datetime.today().strftime('%Y-%m-%d')
         self.party_size = party_size
-        self.time = time
+        self.time = normalize_time(time)
         self.location = location
+        self.time_window = parse_time_window(self.time)
+        self.party_sizes = parse_party_sizes(party_size)
+        self.keep_slots = False
 
         if not self.location:
             self.location = ResyRetriever.get_location("New York City, New York")
@@ -92,112 +276,642 @@ class ResyRetriever(object):
         if not self.cuisine_list:
             self.cuisine_list = list(ResyRetriever.applicable_cuisine_list)
 
-        # Logger
+        self.max_workers = max(1, int(max_workers))
+        self.request_timeout = request_timeout
+        self.per_page = max(1, int(per_page))
+        self.max_pages = max(1, int(max_pages))
+        self.search_cache = search_cache if search_cache is not None else get_search_cache()
+        self.timer = timer
+        self.priority = priority
+        self.tile_meters = tile_meters or 0
+        self.max_tiles = max(1, int(max_tiles))
+        self.max_distance = max_distance
+        self.half_distance = half_distance
+        self.catalog = catalog if catalog is not None else get_catalog()
+        self._selection = None
+        # Whether the catalog covers the search, checked once per retriever, see catalog_ready
+        self._catalog_ready = None
+        # Restaurant list drawn from the catalog, whose picks are confirmed upstream
+        self._unconfirmed = None
+
+        # Logger, credentials and clients are set up once per process by the shared context
         self.logger = logging.getLogger(__name__)
-        logging.basicConfig(filename='myapp.log', level=logging.INFO)
+        self.credentials = get_context().credential_pool()
 
-        load_dotenv()
-        self.header = {"Authorization":os.environ["AUTHORIZATION"],
-                "X-Resy-Auth-Token":os.environ["XRESYAUTHTOKEN"],
-                "X-Resy-Universal-Auth": os.environ["XRESYUNIVERSALAUTH"]}
-        
-        # Debug: Log the headers being sent (without showing full token values)
-        self.logger.info("Headers constructed successfully")
-        self.logger.info("Authorization header present: %s", "AUTHORIZATION" in os.environ)
-        self.logger.info("XRESYAUTHTOKEN present: %s", "XRESYAUTHTOKEN" in os.environ)
-        self.logger.info("XRESYUNIVERSALAUTH present: %s", "XRESYUNIVERSALAUTH" in os.environ)
-        self.logger.info("Header keys: %s", list(self.header.keys()))
-        
-        # Log the actual header values (be careful with sensitive data)
-        for key, value in self.header.items():
-            if key == "Authorization":
-                self.logger.info("Authorization header: %s", value[:20] + "..." if len(value) > 20 else value)
-            else:
-                self.logger.info("%s header: %s", key, value[:20] + "..." if len(value) > 20 else value)
-   
-    def get_restaurants(self) -> list[dict]:
+    def get_restaurants(self) -> list[Venue]:
         """Returns a list of restaurants based on user preferences through filtering and querying Resy Api. Preferences
         already set as fields of ResyRetriever object.
 
-        :return list[dict]: list of filtered restaurants based on the user's inputs
-        """    
-        restaurant_list = []
+        Cuisines are searched concurrently, up to max_workers at a time, and merged in the order of cuisine_list so
+        the result does not depend on which search finishes first. With tile_meters set, the area is searched as a
+        grid of smaller cells instead, see _search_tiles. A time window or party size range is searched as several
+        slot filters whose results are merged, see _search_window. If the venue catalog covers the search, the
+        restaurants are looked up in it without calling Resy, and picks from them are confirmed upstream, see
+        randomize_restaurants.
+
+        :return list[Venue]: list of filtered restaurants based on the user's inputs, without duplicates
+        """
+        self.logger.debug("Searching cuisines: %s", self.cuisine_list)
+
+        if self.catalog_ready():
+            with self.timer.stage("catalog_lookup"):
+                results = self.catalog.candidates(self.location, self.cuisine_list)
+            restaurant_list = dedupe(venue for cuisine_restaurants in results for venue in cuisine_restaurants)
+            self.timer.count("restaurants", len(restaurant_list))
+            self._unconfirmed = restaurant_list
+            return restaurant_list
+
+        with self.timer.stage("search"):
+            if self.windowed:
+                results = [self._search_window()]
+            elif self.tile_meters > 0:
+                results = self._search_tiles()
+            else:
+                results = self._search_cuisines()
 
+        # Venues matching several cuisines are kept once, under the first cuisine searched
+        restaurant_list = dedupe(venue for cuisine_restaurants in results for venue in cuisine_restaurants)
+        self.timer.count("restaurants", len(restaurant_list))
+        return restaurant_list
+
+    def _search_cuisines(self) -> list[list[Venue]]:
+        """Searches every cuisine concurrently, up to max_workers at a time.
+
+        :return list[list[Venue]]: restaurants per cuisine, in cuisine_list order
+        """
+        if self.max_workers == 1 or len(self.cuisine_list) == 1:
+            return [self._search_cuisine(cuisine) for cuisine in self.cuisine_list]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.cuisine_list))) as executor:
+            return list(executor.map(self._search_cuisine, self.cuisine_list))
+
+    def catalog_ready(self) -> bool:
+        """Whether the venue catalog can stand in for this search: every cuisine was searched recently in every area
+        the search covers, for the same date and party size. Time window and party size range searches need each
+        venue's slots, so they always search Resy. The catalog is asked once, later calls return the same answer.
+
+        :return bool: True if candidates can be drawn from the catalog
+        """
+        if self.catalog is None or self.windowed:
+            return False
+        if self._catalog_ready is None:
+            if self.tile_meters > 0:
+                locations = geocode.tiles(self.location, self.tile_meters, self.max_tiles)
+            else:
+                locations = [self.location]
+            self._catalog_ready = self.catalog.covers(locations, self.cuisine_list, self.date, self.party_size)
+        return self._catalog_ready
+
+    @property
+    def windowed(self) -> bool:
+        """Whether the search covers a time window or several party sizes rather than one slot filter."""
+        return self.time_window is not None or len(self.party_sizes) > 1
+
+    def window_searches(self) -> list["ResyRetriever"]:
+        """Plans the single slot filter searches a time window or party size range is made of: every party size at
+        every time filter from slot_anchors. Each is a copy of this retriever, so it shares the search cache and
+        in-flight searches with every other spin using the same slot filter.
+
+        :return list[ResyRetriever]: one retriever per party size and time filter
+        """
+        if self.time_window is None:
+            times = [self.time]
+        else:
+            times = [_clock(anchor) for anchor in slot_anchors(*self.time_window)]
+        searches = []
+        for party_size in self.party_sizes:
+            for time in times:
+                search = copy.copy(self)
+                search.party_size = party_size
+                search.time = time
+                search.time_window = None
+                search.party_sizes = [party_size]
+                search.keep_slots = True
+                search._selection = None
+                searches.append(search)
+        return searches
+
+    def _search_window(self) -> list[Venue]:
+        """Searches a time window or party size range as the searches planned by window_searches, concurrently, and
+        merges their venues into one candidate set, see _match_slots.
+
+        :return list[Venue]: restaurants with a slot in the window for one of the party sizes, in search order
+        """
+        searches = self.window_searches()
+        self.timer.count("window_searches", len(searches))
+        if self.tile_meters > 0:
+            # Each search already spreads its cells over the workers
+            found = [(search.party_size, venues) for search in searches for venues in search._search_tiles()]
+        else:
+            entries = [(search, cuisine) for search in searches for cuisine in self.cuisine_list]
+            run = lambda entry: entry[0]._search_cuisine(entry[1])
+            if self.max_workers == 1 or len(entries) == 1:
+                results = [run(entry) for entry in entries]
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(entries))) as executor:
+                    results = list(executor.map(run, entries))
+            found = [(search.party_size, venues) for (search, _), venues in zip(entries, results)]
+        return self._match_slots(found)
+
+    def _match_slots(self, found:list) -> list[Venue]:
+        """Merges the venues of a window's searches, keeping each venue once with the slots that fall in the time
+        window, each annotated with the requested party sizes it seats. Venues without a slot in the window are
+        dropped; venues whose hits carry no availability at all are kept without slots.
+
+        :param list[tuple[int, list[Venue]]] found: party size searched for and the venues found, in search order
+        :return list[Venue]: merged venues, slots as {"time", "party_sizes"} dicts in time order
+        """
+        merged = {}
+        for party_size, venues in found:
+            for venue in venues:
+                entry = merged.setdefault(venue.key(), [venue, None])
+                if venue.slots is None:
+                    continue
+                if entry[1] is None:
+                    entry[1] = {}
+                for time, low, high in venue.slots:
+                    if self.time_window is not None and not self.time_window[0] <= _minutes(time) <= self.time_window[1]:
+                        continue
+                    # Resy offered the slot for the size searched, its size range tells which other sizes fit
+                    sizes = entry[1].setdefault(time, {party_size})
+                    sizes.update(size for size in self.party_sizes
+                                 if (low is None or low <= size) and (high is None or size <= high))
+
+        restaurants = []
+        for venue, times in merged.values():
+            if times is not None and not times:
+                continue
+            slots = None if times is None else [{"time": time, "party_sizes": sorted(times[time])}
+                                                for time in sorted(times)]
+            restaurants.append(Venue(venue.id, venue.name, venue.cuisine, venue.latitude, venue.longitude, slots))
+        self.timer.count("window_venues_dropped", len(merged) - len(restaurants))
+        return restaurants
+
+    def _slot_filter(self) -> dict:
+        """Builds the slot filter sent with every venue search.
+
+        :return dict: slot filter with day, party size and, if chosen, the time filter
+        """
         # If user didn't choose a specific time, default to current time
         if self.time == "":
-            param = {"day": self.date,"party_size":int(self.party_size)}
+            return {"day": self.date,"party_size":int(self.party_size)}
+        return {"day": self.date,"party_size":int(self.party_size),"time_filter":self.time}
+
+    def _request_page(self, cuisine:str, page:int) -> tuple[list[list], int]:
+        """Requests one page of a cuisine's venue search. The request goes through the shared upstream scheduler, which
+        rate limits it, queues it by priority and retries it if Resy throttles or fails. The response body is streamed
+        through venuesearch.parse_venuesearch, which reduces each hit to a venue row without decoding the whole page.
+
+        :param str cuisine: cuisine to search for
+        :param int page: page number, starting at 1
+        :raises UpstreamError: if the request fails or its response cannot be parsed
+        :return tuple[list[list], int | None]: venue rows on the page, and the total hit count if reported
+        """
+        query = {"availability":True,"page":page,"per_page":self.per_page,
+            "slot_filter":self._slot_filter(),"types":["venue"],
+            "order_by":"availability","geo":self.location,"query":"","venue_filter":{"cuisine":cuisine}}
+        self.timer.count("upstream_calls")
+        try:
+            with self.timer.stage("upstream_search"):
+                # Streamed, so the body is parsed as it arrives instead of being read whole first
+                response = self._execute("POST", VENUESEARCH_URL, json=query, stream=True)
+        except requests.exceptions.RequestException as e:
+            self.timer.count("upstream_errors")
+            raise UpstreamError(f"API request for {cuisine} page {page} failed: {e}") from e
+        except (QueueTimeout, NoCredentialError) as e:
+            self.timer.count("upstream_errors")
+            raise UpstreamError(f"API request for {cuisine} page {page} was not admitted: {e}") from e
+
+        # Closing the response frees its upstream scheduler slot, which is held while the body streams in
+        try:
+            if response.status_code != 200:
+                self.timer.count("upstream_errors")
+                raise UpstreamError(f"API request failed with status {response.status_code}: {response.text}")
+            with self.timer.stage("parse_hits"):
+                rows, total = parse_venuesearch(response.iter_content(CHUNK_SIZE), self.keep_slots)
+        except (ValueError, KeyError, TypeError, IndexError, requests.exceptions.RequestException) as e:
+            raise UpstreamError(f"Error parsing API response for {cuisine} page {page}: {e}") from e
+        finally:
+            response.close()
+        if self.catalog is not None:
+            with self.timer.stage("catalog_update"):
+                self.catalog.add(rows, cuisine)
+        return rows, total
+
+    def _execute(self, method:str, url:str, **options) -> requests.Response:
+        """Sends a Resy request through the shared upstream scheduler, with a credential from the pool for each
+        attempt. A credential Resy rejects with 401, 403, 419 or 429 is benched while others are healthy, and the
+        scheduler retries the request, admitting the retry on its own so it takes its own rate token and goes out with
+        another credential.
+
+        :param str method: HTTP method
+        :param str url: Resy api url
+        :param options: further arguments of requests.Session.request, e.g. json, params or stream
+        :raises NoCredentialError: if every credential is benched
+        :raises QueueTimeout: if the request could not be admitted in time
+        :return requests.Response: the last response, which must be closed if it was streamed
+        """
+        benched = [False]
+
+        def send():
+            credential = self.credentials.acquire()
+            response = resy_session.get_session().request(method,url,headers=credential.header,
+                                                          timeout=self.request_timeout,**options)
+            retry_after = retry_after_seconds(response.headers.get("Retry-After"))
+            benched[0] = self.credentials.report(credential, response.status_code, retry_after)
+            if benched[0]:
+                self.timer.count("credential_rotations")
+            return response
+
+        return get_scheduler().execute(send, self.priority, self.timer, retryable=lambda response: benched[0],
+                                       stream=options.get("stream", False))
+
+    def _search_pages(self, cuisine:str):
+        """Generator over the pages of a venue search for a single cuisine. The first response carries the total hit
+        count, so later pages are only requested while there are hits left and the page cap is not reached. Each
+        page's hits are yielded as soon as its response arrives, letting callers stop early.
+
+        :param str cuisine: cuisine to search for
+        :raises UpstreamError: if a page request fails or its response cannot be parsed
+        :return Iterator[tuple[list[list], bool]]: venue rows, one list per page, and whether the page is the last
+            one with hits, False for the last page fetched when the page cap cut the search short
+        """
+        total = None
+        page = 1
+
+        while page <= self.max_pages:
+            rows, page_total = self._request_page(cuisine, page)
+            if total is None:
+                total = page_total
+                self.logger.debug("%s: %s total hits", cuisine, total)
+
+            # Stop once the hits seen cover the reported total, or when the page came back short
+            seen = page * self.per_page
+            exhausted = len(rows) < self.per_page or (total is not None and seen >= total)
+            yield rows, exhausted
+            if exhausted:
+                return
+            page += 1
+
+    def _fetch_pages(self, cuisine:str) -> tuple[list[list[list]], bool]:
+        """Collects every page of a cuisine's venue search as compact venue rows. A failed page is logged and ends the
+        search early. A search that saw every hit marks its area as covered in the venue catalog; one cut short by
+        max_pages does not, as the catalog would miss the venues beyond the cap.
+
+        :param str cuisine: cuisine to search for
+        :return tuple[list[list[list]], bool]: pages of venue rows, and whether the search completed without errors
+        """
+        pages = []
+        exhausted = False
+        try:
+            for rows, exhausted in self._search_pages(cuisine):
+                pages.append(rows)
+                self.timer.count("hits", len(rows))
+        except UpstreamError as e:
+            self.logger.error(str(e))
+            return pages, False
+        if self.catalog is not None and exhausted:
+            self.catalog.cover(self.location, cuisine, self.date, self.party_size)
+        return pages, True
+
+    def cache_key(self, cuisine:str) -> str:
+        """Returns the search cache key of a cuisine's full search, see search_cache.search_key.
+
+        :param str cuisine: cuisine searched for
+        :return str: cache key
+        """
+        key = search_key(self.location, self._slot_filter(), cuisine, self.per_page, self.max_pages)
+        # Rows with slots are cached apart from the plain rows of the same search
+        return key + "|slots" if self.keep_slots else key
+
+    def _search_cuisine(self, cuisine:str) -> list[Venue]:
+        """Queries the Resy api for a single cuisine, or the search cache if it holds a recent result. Concurrent
+        identical searches share one upstream fetch. Failures are logged and yield the hits found so far so that one
+        cuisine cannot fail the whole search.
+
+        :param str cuisine: cuisine to search for
+        :return list[Venue]: restaurants found for the cuisine
+        """
+        self.logger.debug("Searching cuisine: %s", cuisine)
+
+        key = self.cache_key(cuisine)
+        fetch = lambda: search_flight.do(key, lambda: self._fetch_pages(cuisine))
+        if self.search_cache is None:
+            pages, _ = fetch()
         else:
-            param = {"day": self.date,"party_size":int(self.party_size),"time_filter":self.time}
-    
-        # Create a list of dictionaries of restaurants based on the cuisine with attributes of name, cuisine, and location
-        self.logger.info(self.cuisine_list)
-        for number, cuisine in enumerate(self.cuisine_list):
-            self.logger.info("Cuisine number %d: %s", number, cuisine)
-
-            # Query Resy api for the cuisine 
-            query = {"availability":True,"page":1,"per_page":20,
-                "slot_filter":param,"types":["venue"],
-                "order_by":"availability","geo":self.location,"query":"","venue_filter":{"cuisine":cuisine}}
-            url = "https://api.resy.com/3/venuesearch/search"
-            resy_request_for_total = requests.post(url,headers=self.header,json=query)
-            
-            # Debug: Log the response to see what we're actually getting
-            self.logger.info("API Response Status: %d", resy_request_for_total.status_code)
-            
-            if resy_request_for_total.status_code != 200:
-                self.logger.error("API request failed with status %d: %s", 
-                                resy_request_for_total.status_code, 
-                                resy_request_for_total.text)
-                continue
-                
-            try:
-                resy_request_object_for_total = resy_request_for_total.json()
-                self.logger.info("API Response Keys: %s", list(resy_request_object_for_total.keys()))
-                
-                # Let's see what the actual structure is
-                self.logger.info("Full API Response: %s", resy_request_object_for_total)
-                
-                # For now, let's use a fixed page size instead of trying to get total
-                total = 20  # Use the per_page value we set
-                self.logger.info("Using fixed page size: %d", total)
-                
-            except Exception as e:
-                self.logger.error("Error parsing API response: %s", str(e))
-                self.logger.error("Response text: %s", resy_request_for_total.text)
-                continue
-                
-            full_query = {"availability":True,"page":1,"per_page":total,
-                "slot_filter":param,"types":["venue"],
-                "order_by":"availability","geo":self.location,"query":"","venue_filter":{"cuisine":cuisine}}
-            resy_request = requests.post(url,headers=self.header,json=full_query)
-            resy_request_object = resy_request.json()
-        
-            # Create a list of dictionaries of restaurants with name, cuisine, and location key
-            for i in range(len(resy_request_object['search']['hits'])):
-                add_dict = {}
-                name = resy_request_object['search']['hits'][i]['_highlightResult']['name']['value']
-                parsed_name = BeautifulSoup(name, "html.parser")
-
-                cuisine = resy_request_object['search']['hits'][i]['_highlightResult']['cuisine'][0]['value']
-                restaurant_location = resy_request_object['search']['hits'][i]['_geoloc']
-                add_dict['name']= parsed_name
-                add_dict['cuisine'] = cuisine.lower().strip()
-                add_dict['location'] = restaurant_location
-                restaurant_list.append(add_dict)
-        return restaurant_list
-   
-    def randomize_restaurants(self, restaurant_list: list[dict]) -> dict:
+            refresher = self._refresher()
+            refresh = lambda: search_flight.do(key, lambda: refresher._fetch_pages(cuisine))
+            pages = self.search_cache.get_or_fetch(key, fetch, refresh=refresh)
+
+        return [Venue.from_row(row) for rows in pages for row in rows]
+
+    def _search_tiles(self) -> list[list[Venue]]:
+        """Searches the location as a grid of cells, every cuisine in every cell, concurrently. A page of hits covers
+        a small cell far better than a wide circle, where the closest venues crowd out the rest, and each cell is
+        cached on its own so overlapping searches reuse it. Venues found outside the requested circle are dropped.
+
+        :return list[list[Venue]]: restaurants per cuisine and cell, cuisines in cuisine_list order and cells
+            nearest first
+        """
+        cells = geocode.tiles(self.location, self.tile_meters, self.max_tiles)
+        self.timer.count("tiles", len(cells))
+        searches = [(cuisine, cell) for cuisine in self.cuisine_list for cell in cells]
+
+        def search(entry):
+            cuisine, cell = entry
+            tile = copy.copy(self)
+            tile.location = cell
+            return tile._search_cuisine(cuisine)
+
+        if self.max_workers == 1 or len(searches) == 1:
+            found = [search(entry) for entry in searches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(searches))) as executor:
+                found = list(executor.map(search, searches))
+
+        latitude, longitude = self.location["latitude"], self.location["longitude"]
+        radius = self.location.get("radius", geocode.DEFAULT_RADIUS)
+        return [[venue for venue in venues
+                 if venue.latitude is None
+                 or geocode.distance_meters(latitude, longitude, venue.latitude, venue.longitude) <= radius]
+                for venues in found]
+
+    def _page(self, cuisine:str, page:int) -> dict:
+        """Returns one page of a cuisine's search as venue rows, from the search cache when possible.
+
+        :param str cuisine: cuisine to search for
+        :param int page: page number, starting at 1
+        :raises UpstreamError: if the page is not cached and its request fails
+        :return dict: {"rows": venue rows on the page, "total": total hit count or None}
+        """
+        def request(retriever):
+            rows, total = retriever._request_page(cuisine, page)
+            return {"rows": rows, "total": total}, True
+
+        key = self.cache_key(cuisine) + f"|page{page}"
+        fetch = lambda: search_flight.do(key, lambda: request(self))
+        if self.search_cache is None:
+            return fetch()[0]
+        refresher = self._refresher()
+        refresh = lambda: search_flight.do(key, lambda: request(refresher))
+        return self.search_cache.get_or_fetch(key, fetch, cost=lambda entry: 1, refresh=refresh)
+
+    def _refresher(self) -> 'ResyRetriever':
+        """Returns a copy of the retriever for refreshing stale cache entries in the background. The refresh outlives
+        the request, so it is not timed by the request's timer and queues behind interactive calls.
+
+        :return ResyRetriever: copy of the retriever without the request's timer, at BACKGROUND priority
+        """
+        refresher = copy.copy(self)
+        refresher.timer = NULL_TIMER
+        refresher.priority = BACKGROUND
+        return refresher
+
+    def warm_cuisine(self, cuisine:str, refresh_within:float = 0):
+        """Fetches a cuisine's full search into the search cache ahead of demand, along with its pages for lazy
+        spins. Entries that stay fresh for longer than refresh_within seconds are left alone.
+
+        :param str cuisine: cuisine to search for
+        :param float refresh_within: seconds of freshness below which a cached entry is fetched again
+        :return bool | None: True if the search was fetched and cached, False if it failed part way, None if the
+            entry was already warm or there is no search cache
+        """
+        if self.search_cache is None:
+            return None
+        key = self.cache_key(cuisine)
+        freshness = self.search_cache.freshness(key)
+        if freshness is not None and freshness > refresh_within:
+            return None
+
+        pages, complete = search_flight.do(key, lambda: self._fetch_pages(cuisine))
+        if not complete:
+            return False
+        self.search_cache.put(key, pages)
+        # Every hit was fetched, so the row count is the total a lazy spin's count would read
+        total = sum(len(rows) for rows in pages)
+        for page, rows in enumerate(pages, 1):
+            self.search_cache.put(f"{key}|page{page}", {"rows": rows, "total": total})
+        return True
+
+    def _hit_count(self, cuisine:str) -> int:
+        """Returns the number of hits a full search of the cuisine would return, capped at max_pages pages. The
+        count comes from the cuisine's first page, which is cached so a spin landing on it needs no further request.
+
+        :param str cuisine: cuisine to count
+        :return int: number of reachable hits, 0 if the count request fails
+        """
+        try:
+            first = self._page(cuisine, 1)
+        except UpstreamError as e:
+            self.logger.error(str(e))
+            return 0
+        total = first["total"] if first["total"] is not None else len(first["rows"])
+        if len(first["rows"]) < self.per_page:
+            total = len(first["rows"])
+        return min(total, self.per_page * self.max_pages)
+
+    def lazy_randomize(self, weighting:str = "count"):
+        """Picks a random restaurant without fetching every cuisine's results. A cuisine is chosen in proportion to
+        its hit count ("count") or uniformly ("uniform"), then a position within it, and only the page holding that
+        position is fetched.
+
+        Counts are Resy's hit totals, in which a venue listed under k of the searched cuisines is counted k times.
+        With "count", a pick is therefore kept only when it was drawn from its own cuisine and drawn again otherwise,
+        so every venue is picked as often as by randomize_restaurants over the deduplicated list, see
+        _accept_unlisted for venues whose own cuisine was not searched. After LAZY_DRAWS rejected draws the spin
+        gives up and returns None, for the caller to search eagerly.
+
+        With "count", the first page of every cuisine is requested concurrently to read the counts, and later spins
+        reuse them from the search cache; with "uniform", only the chosen cuisine is counted. Time window and party
+        size range searches must see every venue's slots, so they search eagerly.
+
+        :param str weighting: "count" or "uniform"
+        :return tuple[Venue | None, int]: the picked restaurant or None if nothing was found, and the number of
+            hits counted
+        """
+        if weighting not in LAZY_WEIGHTINGS:
+            raise ValueError(f"Unknown weighting {weighting}, expected one of {LAZY_WEIGHTINGS}")
+        if self.windowed:
+            restaurants = self.get_restaurants()
+            return (self.randomize_restaurants(restaurants) if restaurants else None), len(restaurants)
+
+        with self.timer.stage("count_hits"):
+            if weighting == "uniform":
+                cuisines = list(self.cuisine_list)
+                counts = {}
+                # Count cuisines one at a time in random order until one has hits
+                random.shuffle(cuisines)
+                for cuisine in cuisines:
+                    counts[cuisine] = self._hit_count(cuisine)
+                    if counts[cuisine]:
+                        break
+            elif self.max_workers == 1 or len(self.cuisine_list) == 1:
+                counts = {cuisine: self._hit_count(cuisine) for cuisine in self.cuisine_list}
+            else:
+                with ThreadPoolExecutor(max_workers=min(self.max_workers, len(self.cuisine_list))) as executor:
+                    counts = dict(zip(self.cuisine_list, executor.map(self._hit_count, self.cuisine_list)))
+
+        total = sum(counts.values())
+        if not total:
+            return None, 0
+
+        if weighting == "uniform":
+            cuisine = next(cuisine for cuisine, count in counts.items() if count)
+            with self.timer.stage("randomize"):
+                position = random.randrange(counts[cuisine])
+            return self._venue_at(cuisine, position), total
+
+        searched = {cuisine.lower() for cuisine in self.cuisine_list}
+        for _ in range(LAZY_DRAWS):
+            with self.timer.stage("randomize"):
+                position = random.randrange(total)
+                for cuisine in self.cuisine_list:
+                    if position < counts[cuisine]:
+                        break
+                    position -= counts[cuisine]
+            venue = self._venue_at(cuisine, position)
+            if venue is None:
+                return None, total
+            if venue.cuisine == cuisine.lower():
+                return venue, total
+            if venue.cuisine not in searched:
+                venue = self._accept_unlisted(searched)
+                if venue is not None:
+                    return venue, total
+            # Otherwise the venue is also found under its own cuisine, where drawing it counts
+            self.timer.count("lazy_rejections")
+        return None, total
+
+    def _venue_at(self, cuisine:str, position:int):
+        """Returns the venue at a position of a cuisine's search, fetching only the page holding it.
+
+        :param str cuisine: cuisine searched for
+        :param int position: position in the cuisine's hits, starting at 0
+        :return Venue | None: the venue, or None if its page could not be fetched or is empty
+        """
+        page, index = divmod(position, self.per_page)
+        try:
+            rows = self._page(cuisine, page + 1)["rows"]
+        except UpstreamError as e:
+            self.logger.error(str(e))
+            return None
+        if not rows:
+            return None
+        # Results can shift between the count and the fetch, keep the pick on the page
+        return Venue.from_row(rows[min(index, len(rows) - 1)])
+
+    def _accept_unlisted(self, searched:set):
+        """Settles a lazy draw that landed on a venue whose own cuisine was not searched. Such a venue is found under
+        however many of the searched cuisines list it, which only the full searches tell. Of the m hits of such venues,
+        the draw keeps one of their n distinct venues with probability n / m, so each of them is picked with the same
+        probability, 1 / total, as a venue drawn from its own cuisine.
+
+        :param set[str] searched: lowercased cuisines searched
+        :return Venue | None: the picked venue, or None for the draw to be rejected
+        """
+        self.timer.count("lazy_unlisted")
+        unlisted = [venue for venues in self._search_cuisines() for venue in venues if venue.cuisine not in searched]
+        distinct = dedupe(unlisted)
+        if not distinct or random.random() * len(unlisted) >= len(distinct):
+            return None
+        return random.choice(distinct)
+
+    def selection(self, restaurant_list:list[Venue]) -> SelectionEngine:
+        """Returns the selection engine for a list of restaurants, applying max_distance and half_distance. The engine
+        is kept while the same list is spun again, so its distances and alias table are only computed once.
+
+        :param list[Venue] restaurant_list: restaurant list filtered to user's preferences
+        :return SelectionEngine: engine holding the restaurants eligible for a pick
+        """
+        if self._selection is None or self._selection[0] is not restaurant_list:
+            with self.timer.stage("build_selection"):
+                engine = SelectionEngine(restaurant_list, self.location, self.max_distance, self.half_distance)
+            self._selection = (restaurant_list, engine)
+        return self._selection[1]
+
+    def candidate_venues(self, restaurant_list:list[Venue]) -> list[Venue]:
+        """Returns the restaurants a candidate set token may hand out for local re-spins, see the candidates module.
+        Re-spins are not checked with Resy, so a list drawn from the venue catalog, where only picks are confirmed,
+        gives none.
+
+        :param list[Venue] restaurant_list: restaurant list filtered to user's preferences
+        :return list[Venue]: restaurants eligible for a pick, or an empty list for a catalog list
+        """
+        if restaurant_list is self._unconfirmed:
+            return []
+        return self.selection(restaurant_list).venues
+
+    def randomize_restaurants(self, restaurant_list: list[Venue]) -> Venue:
         """Returns a random restaurant in the filtered restaurant list. If no
         restaurant is provided, calls the get_restaurants method to get a list of restaurants.
+        Picks are uniform unless max_distance or half_distance is set, see selection.
+
+        Picks from a list drawn from the venue catalog are confirmed with Resy first. A pick without availability is
+        set aside and another drawn, and after CONFIRM_ATTEMPTS draws without a confirmed pick the spin searches
+        Resy instead.
 
-        :param list[dict] restaurant_list: restaurant list filtered to user's preferences
-        :return dict: returns a dictionary of one restaurant with it's name, cuisine, and location
+        :param list[Venue] restaurant_list: restaurant list filtered to user's preferences
+        :return Venue: returns one restaurant with its name, cuisine, and location, or None if none is eligible
         """    
         
         if not restaurant_list:
             restaurant_list = self.get_restaurants()
-        
-        return random.choice(restaurant_list)
+
+        engine = self.selection(restaurant_list)
+        with self.timer.stage("randomize"):
+            pick = engine.draw()
+        if pick is None or restaurant_list is not self._unconfirmed:
+            return pick
+
+        unavailable = set()
+        for _ in range(CONFIRM_ATTEMPTS):
+            if pick.key() not in unavailable:
+                if self.confirm_availability(pick) is not False:
+                    return pick
+                unavailable.add(pick.key())
+                if len(unavailable) == len(engine):
+                    break
+            with self.timer.stage("randomize"):
+                pick = engine.draw()
+
+        self.timer.count("catalog_fallbacks")
+        search = copy.copy(self)
+        search.catalog = None
+        search._catalog_ready = None
+        search._selection = None
+        return search.randomize_restaurants(search.get_restaurants())
+
+    def confirm_availability(self, venue:Venue):
+        """Checks with Resy whether a venue has a slot for the party size on the date, within half of
+        RESY_SLOT_SPAN_MINUTES of the requested time if one is set.
+
+        :param Venue venue: venue to check
+        :return bool | None: whether the venue has a matching slot, or None if it could not be checked
+        """
+        if venue.id is None:
+            return None
+        # /4/find looks the venue up around the given position, so it is sent the venue's own
+        latitude = venue.latitude if venue.latitude is not None else self.location["latitude"]
+        longitude = venue.longitude if venue.longitude is not None else self.location["longitude"]
+        params = {"lat": latitude, "long": longitude, "day": self.date, "party_size": int(self.party_size),
+                  "venue_id": venue.id}
+        self.timer.count("availability_checks")
+        try:
+            requested = _minutes(self.time) if self.time else None
+            with self.timer.stage("confirm_availability"):
+                response = self._execute("GET", FIND_URL, params=params)
+                if response.status_code != 200:
+                    raise UpstreamError(f"status {response.status_code}")
+                venues = response.json()["results"]["venues"]
+        except (requests.exceptions.RequestException, QueueTimeout, NoCredentialError, UpstreamError,
+                ValueError, KeyError, TypeError) as e:
+            self.timer.count("upstream_errors")
+            self.logger.error("Availability check of %s failed: %s", venue.name, str(e))
+            return None
+
+        slots = parse_slots(venues[0].get("slots")) if venues else []
+        if requested is not None:
+            slots = [slot for slot in slots if abs(_minutes(slot[0]) - requested) <= DEFAULT_SLOT_SPAN / 2]
+        return bool(slots)
 
 def user_input_json()-> ResyRetriever:
     """(Deprecated Method) - Currently used for testing purposes. Actual user input takes place within the Flask application.
@@ -0,0 +1,304 @@
+"""Rate-limit-aware scheduler for calls to the Resy api. Every venue search goes through the process-wide scheduler,
+which combines:
+
+- a token bucket capping the request rate (RESY_RATE_LIMIT per second and healthy credential set, bursts of
+  RESY_RATE_BURST),
+- an adaptive concurrency limit that grows additively while calls succeed and halves on 429 or 5xx responses,
+- a global pause honouring Retry-After on 429s, with exponential backoff when the header is missing,
+- a priority queue, so interactive spins are admitted before background work such as cache warming.
+
+Throttled and failed calls are retried a few times before the response is handed back, and counters for throttle
+events, retries and queue wait times are kept for the health endpoint."""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+import logging
+from email.utils import parsedate_to_datetime
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+DEFAULT_RATE = float(os.environ.get("RESY_RATE_LIMIT", 10))
+DEFAULT_BURST = float(os.environ.get("RESY_RATE_BURST", 20))
+DEFAULT_INITIAL_CONCURRENCY = int(os.environ.get("RESY_INITIAL_CONCURRENCY", 8))
+DEFAULT_MAX_CONCURRENCY = int(os.environ.get("RESY_MAX_CONCURRENCY", 32))
+DEFAULT_MAX_RETRIES = int(os.environ.get("RESY_THROTTLE_RETRIES", 2))
+DEFAULT_MAX_WAIT = float(os.environ.get("RESY_MAX_QUEUE_WAIT", 20))
+
+# Backoff after a 429 without Retry-After, and the longest pause honoured from the header
+BACKOFF_BASE = 0.5
+MAX_PAUSE = 30.0
+
+class QueueTimeout(Exception):
+    """Raised when a call waits longer than the scheduler's max_wait to be admitted."""
+
+class TokenBucket(object):
+    """Token bucket refilled at rate tokens per second, holding at most burst tokens. Not thread-safe on its own;
+    the scheduler calls it under its lock."""
+
+    def __init__(self, rate:float, burst:float):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now:float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def resize(self, rate:float, burst:float, now:float):
+        """Changes the rate and capacity, keeping the tokens earned at the old rate."""
+        self._refill(now)
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = min(self.tokens, self.burst)
+
+    def wait_time(self, now:float) -> float:
+        """Returns the seconds until a token is available, 0 if one is available now."""
+        if self.rate <= 0:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now:float):
+        """Takes a token, which the caller has checked is available."""
+        if self.rate > 0:
+            self._refill(now)
+            self.tokens -= 1
+
+def retry_after_seconds(value) -> float:
+    """Parses a Retry-After header given in seconds or as an HTTP date.
+
+    :param str value: header value
+    :return float | None: seconds to wait, or None if the header is missing or malformed
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class UpstreamScheduler(object):
+    """Admits upstream calls under a rate limit and an adaptive concurrency limit, highest priority first.
+
+    Attributes:
+        max_retries (int): Retries for a throttled (429) or failed (5xx) call.
+        max_wait (float): Seconds a call may wait for admission before QueueTimeout is raised.
+    """
+
+    def __init__(self,
+                 rate:float = DEFAULT_RATE,
+                 burst:float = DEFAULT_BURST,
+                 initial_concurrency:int = DEFAULT_INITIAL_CONCURRENCY,
+                 max_concurrency:int = DEFAULT_MAX_CONCURRENCY,
+                 max_retries:int = DEFAULT_MAX_RETRIES,
+                 max_wait:float = DEFAULT_MAX_WAIT,
+                 capacity = None):
+        """Constructor Method
+
+        Args:
+            rate (float, optional): Requests per second allowed, 0 for no rate limit. Defaults to RESY_RATE_LIMIT.
+            burst (float, optional): Requests allowed in a burst. Defaults to RESY_RATE_BURST.
+            initial_concurrency (int, optional): Starting concurrency limit. Defaults to 8.
+            max_concurrency (int, optional): Highest concurrency limit reached by additive increase. Defaults to 32.
+            max_retries (int, optional): Retries for a 429 or 5xx response. Defaults to 2.
+            max_wait (float, optional): Seconds a call may wait to be admitted. Defaults to 20.
+            capacity (Callable[[], int], optional): Number of credential sets currently usable. When given, rate and
+                burst are per credential set and follow it. Defaults to a fixed rate.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.max_wait = max_wait
+        self.logger = logging.getLogger(__name__)
+
+        self.rate = rate
+        self.burst = burst
+        self.capacity = capacity
+        self._bucket = TokenBucket(rate, burst)
+        self._limit = float(min(initial_concurrency, max_concurrency))
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._queue = []
+        self._sequence = itertools.count()
+        self._condition = threading.Condition()
+        self._counters = {"calls": 0, "throttled": 0, "server_errors": 0, "retries": 0, "queue_timeouts": 0,
+                          "queue_wait_ms": 0.0, "max_queue_wait_ms": 0.0}
+
+    def _admit(self, priority:int) -> float:
+        """Waits until the call is first in the queue and a concurrency slot and a token are free.
+
+        :param int priority: INTERACTIVE or BACKGROUND
+        :raises QueueTimeout: if the call waited longer than max_wait
+        :return float: seconds spent waiting
+        """
+        started = time.monotonic()
+        entry = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._queue, entry)
+            while True:
+                now = time.monotonic()
+                timeout = None
+                if now < self._paused_until:
+                    timeout = self._paused_until - now
+                elif self._queue[0] == entry and self._in_flight < int(self._limit):
+                    if self.capacity is not None:
+                        sets = max(1, self.capacity())
+                        self._bucket.resize(self.rate * sets, self.burst * sets, now)
+                    token_wait = self._bucket.wait_time(now)
+                    if token_wait <= 0:
+                        self._bucket.take(now)
+                        heapq.heappop(self._queue)
+                        self._in_flight += 1
+                        # The next call in line may be admissible as well
+                        self._condition.notify_all()
+                        break
+                    timeout = token_wait
+
+                remaining = self.max_wait - (now - started)
+                if remaining <= 0:
+                    self._queue.remove(entry)
+                    heapq.heapify(self._queue)
+                    self._counters["queue_timeouts"] += 1
+                    self._condition.notify_all()
+                    raise QueueTimeout(f"Waited more than {self.max_wait}s for an upstream slot")
+                self._condition.wait(remaining if timeout is None else min(timeout, remaining))
+
+            waited = time.monotonic() - started
+            self._counters["calls"] += 1
+            self._counters["queue_wait_ms"] += waited * 1000
+            self._counters["max_queue_wait_ms"] = max(self._counters["max_queue_wait_ms"], waited * 1000)
+        return waited
+
+    def _release(self, status:int = None, retry_after:float = None, attempt:int = 0):
+        """Frees the call's slot and adapts the limits to its outcome.
+
+        :param int status: response status, None if the request raised
+        :param float retry_after: Retry-After of a 429 response, in seconds
+        :param int attempt: retries already made for the call, for backoff
+        """
+        with self._condition:
+            self._in_flight -= 1
+            if status == 429:
+                self._counters["throttled"] += 1
+                self._limit = max(1.0, self._limit / 2)
+                pause = retry_after if retry_after is not None else BACKOFF_BASE * (2 ** attempt)
+                self._paused_until = max(self._paused_until, time.monotonic() + min(pause, MAX_PAUSE))
+                self.logger.warning("Resy throttled, pausing %.2fs, concurrency limit %d", pause, int(self._limit))
+            elif status is not None and status >= 500:
+                self._counters["server_errors"] += 1
+                self._limit = max(1.0, self._limit / 2)
+            elif status is not None:
+                self._limit = min(float(self.max_concurrency), self._limit + 1 / self._limit)
+            self._condition.notify_all()
+
+    def _release_on_close(self, response, status:int):
+        """Holds a streamed response's slot until the response is closed, as its body is still being read from Resy
+        after the headers arrive. Closing it again does not free the slot twice.
+
+        :param requests.Response response: the streamed response handed back to the caller
+        :param int status: response status
+        """
+        close = response.close
+        released = [False]
+        def close_and_release():
+            try:
+                close()
+            finally:
+                with self._condition:
+                    if released[0]:
+                        return
+                    released[0] = True
+                    self._release(status)
+        response.close = close_and_release
+
+    def execute(self, send, priority:int = INTERACTIVE, timer = None, retryable = None, stream:bool = False):
+        """Runs send once admitted, retrying 429 and 5xx responses up to max_retries times. Every attempt is admitted
+        on its own, taking its own token.
+
+        :param Callable[[], requests.Response] send: performs the request
+        :param int priority: INTERACTIVE or BACKGROUND
+        :param StageTimer timer: optional per-invocation timer, records queue waits and throttles
+        :param Callable[[requests.Response], bool] retryable: further responses to retry, e.g. ones whose credential
+            was benched so the retry goes out with another
+        :param bool stream: whether send streams the response body. A returned response that was not throttled or
+            failed then keeps its slot until the caller closes it, so calls in flight count bodies still being read.
+        :raises QueueTimeout: if the call could not be admitted in time
+        :return requests.Response: the last response
+        """
+        attempt = 0
+        while True:
+            waited = self._admit(priority)
+            if timer is not None:
+                timer.add("upstream_queue", waited)
+            try:
+                response = send()
+            except Exception:
+                self._release()
+                raise
+
+            status = response.status_code
+            retry_after = retry_after_seconds(response.headers.get("Retry-After")) if status == 429 else None
+            if status != 429 and status < 500:
+                last = retryable is None or not retryable(response) or attempt >= self.max_retries
+            else:
+                last = attempt >= self.max_retries
+                if timer is not None:
+                    timer.count("throttled" if status == 429 else "upstream_retries")
+            if last and stream and status != 429 and status < 500:
+                # Throttled and failed calls still free their slot now, so their backoff applies at once
+                self._release_on_close(response, status)
+                return response
+            self._release(status, retry_after, attempt)
+            if last:
+                return response
+            # Release the connection of a streamed response that is being retried
+            response.close()
+            attempt += 1
+            with self._condition:
+                self._counters["retries"] += 1
+            if status >= 500:
+                time.sleep(BACKOFF_BASE * (2 ** (attempt - 1)))
+
+    def stats(self) -> dict:
+        """Reports throttling and queueing.
+
+        :return dict: call, throttle, server error, retry and queue timeout counts, total and max queue wait,
+            current concurrency limit, calls in flight, queue length and remaining pause
+        """
+        with self._condition:
+            stats = dict(self._counters)
+            stats["queue_wait_ms"] = round(stats["queue_wait_ms"], 2)
+            stats["max_queue_wait_ms"] = round(stats["max_queue_wait_ms"], 2)
+            stats["concurrency_limit"] = int(self._limit)
+            stats["in_flight"] = self._in_flight
+            stats["queued"] = len(self._queue)
+            stats["paused_for_ms"] = round(max(0.0, self._paused_until - time.monotonic()) * 1000, 2)
+        return stats
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> UpstreamScheduler:
+    """Returns the process-wide scheduler, creating it with the environment's settings on first use. Each healthy
+    credential set in the pool brings its own RESY_RATE_LIMIT, so the rate grows with the credentials provisioned and
+    shrinks while some are benched.
+
+    :return UpstreamScheduler: the shared scheduler
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                from context import get_context
+                _scheduler = UpstreamScheduler(capacity=get_context().credentials.healthy)
+    return _scheduler
@@ -0,0 +1,287 @@
+"""TTL cache for Resy venue search results. Searches are keyed on quantized query parameters, so nearby locations and
+times in the same slot bucket share an entry. Entries past their TTL are still served for a grace period while a
+background refresh fetches new results (stale-while-revalidate).
+
+Two backends are provided: MemoryBackend for a single process and SQLiteBackend for a file shared by several
+workers on one machine. The shared cache is configured through RESY_SEARCH_CACHE, e.g. "memory", "off" or
+"sqlite:/tmp/resy_search_cache.db"."""
+
+import os
+import math
+import json
+import time
+import sqlite3
+import threading
+import logging
+from collections import OrderedDict
+
+DEFAULT_BACKEND = os.environ.get("RESY_SEARCH_CACHE", "memory")
+DEFAULT_TTL = float(os.environ.get("RESY_SEARCH_CACHE_TTL", 300))
+DEFAULT_STALE_TTL = float(os.environ.get("RESY_SEARCH_CACHE_STALE_TTL", 600))
+DEFAULT_MAX_ENTRIES = int(os.environ.get("RESY_SEARCH_CACHE_MAX_ENTRIES", 2048))
+
+# Quantization of cache keys: grid cell size in degrees (about 1.1 km of latitude) and time slot bucket in minutes
+GRID_DEGREES = float(os.environ.get("RESY_CACHE_GRID_DEGREES", 0.01))
+SLOT_MINUTES = int(os.environ.get("RESY_CACHE_SLOT_MINUTES", 30))
+RADIUS_METERS = 1000
+
+def quantize_geo(location:dict) -> str:
+    """Snaps a search location to its grid cell and rounds the radius, so nearby searches share a key.
+
+    :param dict location: location with latitude, longitude and radius
+    :return str: grid cell and radius bucket
+    """
+    lat_cell = math.floor(location["latitude"] / GRID_DEGREES)
+    lng_cell = math.floor(location["longitude"] / GRID_DEGREES)
+    radius = int(round(location.get("radius", 0) / RADIUS_METERS))
+    return f"{lat_cell}:{lng_cell}:{radius}"
+
+def quantize_time(time_filter:str) -> str:
+    """Snaps an HH:MM time filter down to the start of its slot bucket. Empty or malformed times are kept as is.
+
+    :param str time_filter: time filter in HH:MM format
+    :return str: start of the slot bucket in HH:MM format
+    """
+    try:
+        hours, minutes = (int(part) for part in time_filter.split(":")[:2])
+    except ValueError:
+        return time_filter
+    minutes = (hours * 60 + minutes) // SLOT_MINUTES * SLOT_MINUTES
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+def search_key(location:dict, slot_filter:dict, cuisine:str, per_page:int, max_pages:int) -> str:
+    """Builds the cache key for one cuisine's venue search.
+
+    :param dict location: search location with latitude, longitude and radius
+    :param dict slot_filter: slot filter with day, party size and optional time filter
+    :param str cuisine: cuisine searched for
+    :param int per_page: hits requested per page
+    :param int max_pages: maximum pages fetched
+    :return str: cache key
+    """
+    return "|".join((quantize_geo(location),
+                     str(slot_filter.get("day", "")),
+                     str(slot_filter.get("party_size", "")),
+                     quantize_time(slot_filter.get("time_filter", "")),
+                     cuisine.lower(),
+                     f"{per_page}x{max_pages}"))
+
+class MemoryBackend(object):
+    """In-process backend, evicting the least recently used entries beyond max_entries."""
+
+    def __init__(self, max_entries:int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key:str):
+        """Returns (value, stored_at) for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key:str, value, stored_at:float):
+        """Stores a value, evicting the least recently used entries if the cache is full."""
+        with self._lock:
+            self._entries[key] = (value, stored_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class SQLiteBackend(object):
+    """File backed store shared by the workers on one machine. Values are stored as JSON, and the oldest entries
+    are evicted beyond max_entries."""
+
+    def __init__(self, path:str, max_entries:int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("CREATE TABLE IF NOT EXISTS search_cache "
+                                 "(key TEXT PRIMARY KEY, value TEXT NOT NULL, stored_at REAL NOT NULL)")
+        self._connection.execute("CREATE INDEX IF NOT EXISTS search_cache_stored_at ON search_cache (stored_at)")
+
+    def get(self, key:str):
+        """Returns (value, stored_at) for a key, or None."""
+        with self._lock:
+            row = self._connection.execute("SELECT value, stored_at FROM search_cache WHERE key = ?",
+                                           (key,)).fetchone()
+        if row is None:
+            return None
+        return (json.loads(row[0]), row[1])
+
+    def set(self, key:str, value, stored_at:float):
+        """Stores a value, evicting the oldest entries if the cache is full."""
+        with self._lock:
+            self._connection.execute("INSERT OR REPLACE INTO search_cache VALUES (?, ?, ?)",
+                                     (key, json.dumps(value), stored_at))
+            self._connection.execute("DELETE FROM search_cache WHERE key IN (SELECT key FROM search_cache "
+                                     "ORDER BY stored_at DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM search_cache").fetchone()[0]
+
+class SearchCache(object):
+    """Venue search cache with TTL expiry and stale-while-revalidate on top of a pluggable backend.
+
+    Cached values are lists of result pages, so each hit saves one upstream call per cached page.
+
+    Attributes:
+        backend (MemoryBackend | SQLiteBackend): Store holding the cached pages.
+        ttl (float): Seconds an entry is served as fresh.
+        stale_ttl (float): Seconds past the TTL an entry is still served while it is refreshed in the background.
+    """
+
+    def __init__(self, backend = None, ttl:float = DEFAULT_TTL, stale_ttl:float = DEFAULT_STALE_TTL):
+        """Constructor Method
+
+        Args:
+            backend (MemoryBackend | SQLiteBackend, optional): Store for cached pages. Defaults to a MemoryBackend.
+            ttl (float, optional): Seconds an entry is served as fresh. Defaults to 300.
+            stale_ttl (float, optional): Seconds past the TTL an entry is served while refreshing. Defaults to 600.
+        """
+        self.backend = backend if backend is not None else MemoryBackend()
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._counters = {"hits": 0, "stale_hits": 0, "misses": 0, "refreshes": 0, "upstream_calls_saved": 0}
+
+    def _count(self, name:str, amount:int = 1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def get(self, key:str):
+        """Returns the cached pages for a key if they are fresh, without counting a lookup.
+
+        :param str key: cache key from search_key
+        :return list | None: cached pages, or None if missing or expired
+        """
+        entry = self.backend.get(key)
+        if entry is None or time.time() - entry[1] > self.ttl:
+            return None
+        return entry[0]
+
+    def freshness(self, key:str):
+        """Returns how long a key's entry stays fresh, without counting a lookup.
+
+        :param str key: cache key from search_key
+        :return float | None: seconds until the entry expires, negative if it already has, or None if missing
+        """
+        entry = self.backend.get(key)
+        if entry is None:
+            return None
+        return self.ttl - (time.time() - entry[1])
+
+    def put(self, key:str, pages:list):
+        """Stores the pages of a completed search.
+
+        :param str key: cache key from search_key
+        :param list pages: pages of hits to cache
+        """
+        self.backend.set(key, pages, time.time())
+
+    def get_or_fetch(self, key:str, fetch, cost = len, refresh = None):
+        """Returns cached pages for a key, calling fetch on a miss. Stale entries are returned immediately and
+        refreshed on a background thread. fetch returns (pages, complete); incomplete results are not cached.
+
+        :param str key: cache key from search_key
+        :param Callable[[], tuple[list, bool]] fetch: performs the upstream search
+        :param Callable cost: number of upstream calls a cached value saves, defaults to one per page
+        :param Callable[[], tuple[list, bool]] refresh: performs the background refresh of a stale entry, which
+            outlives the request, so it should not hold on to the request's state. Defaults to fetch.
+        :return list: pages of hits
+        """
+        entry = self.backend.get(key)
+        if entry is not None:
+            pages, stored_at = entry
+            age = time.time() - stored_at
+            if age <= self.ttl:
+                self._count("hits")
+                self._count("upstream_calls_saved", cost(pages))
+                return pages
+            if age <= self.ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._count("upstream_calls_saved", cost(pages))
+                self._refresh(key, refresh if refresh is not None else fetch)
+                return pages
+
+        self._count("misses")
+        pages, complete = fetch()
+        if complete:
+            self.put(key, pages)
+        return pages
+
+    def _refresh(self, key:str, fetch):
+        """Refreshes a stale entry on a daemon thread, at most once per key at a time."""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+            self._counters["refreshes"] += 1
+
+        def refresh():
+            try:
+                pages, complete = fetch()
+                if complete:
+                    self.put(key, pages)
+            except Exception as e:
+                self.logger.error("Background refresh of %s failed: %s", key, str(e))
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, name="search-cache-refresh", daemon=True).start()
+
+    def stats(self) -> dict:
+        """Reports cache effectiveness for sizing.
+
+        :return dict: hit, stale hit and miss counts, hit ratio, upstream calls saved and current entry count
+        """
+        with self._lock:
+            stats = dict(self._counters)
+        lookups = stats["hits"] + stats["stale_hits"] + stats["misses"]
+        stats["hit_ratio"] = round((stats["hits"] + stats["stale_hits"]) / lookups, 4) if lookups else 0.0
+        stats["entries"] = len(self.backend)
+        return stats
+
+def from_spec(spec:str):
+    """Builds a cache from a backend spec: "memory", "sqlite:<path>", or "off"/"" for no cache.
+
+    :param str spec: backend spec
+    :return SearchCache | None: the cache, or None if caching is disabled
+    """
+    spec = spec.strip()
+    if spec.lower() in ("", "off", "none", "0"):
+        return None
+    if spec.lower() == "memory":
+        return SearchCache(MemoryBackend())
+    if spec.lower().startswith("sqlite:"):
+        return SearchCache(SQLiteBackend(spec[len("sqlite:"):]))
+    raise ValueError(f"Unknown search cache backend: {spec}")
+
+_cache = None
+_cache_lock = threading.Lock()
+_configured = False
+
+def get_search_cache():
+    """Returns the process-wide search cache configured by RESY_SEARCH_CACHE, or None if caching is disabled.
+
+    :return SearchCache | None: the shared cache
+    """
+    global _cache, _configured
+    if not _configured:
+        with _cache_lock:
+            if not _configured:
+                _cache = from_spec(DEFAULT_BACKEND)
+                _configured = True
+    return _cache
@@ -0,0 +1,154 @@
+"""Selection engine for spins. Computes every candidate's distance to the search location in one vectorized pass,
+drops candidates beyond a maximum distance, and weights the rest by proximity, so nearby restaurants come up more
+often. Weighted picks use an alias table: building it is O(n) once per candidate set, and every draw after that is
+O(1), so repeated spins on the same set stay cheap with thousands of candidates.
+
+NumPy is used for the distance pass when it is installed (requirements-extras.txt); without it the same results are
+computed in pure Python. It is imported on the first spin that filters or weights by distance, so cold starts of spins
+that never do skip loading it."""
+
+import math
+import random
+from geocode import EARTH_RADIUS_METERS, distance_meters
+
+# NumPy once imported, False if it is not installed, None until first needed
+_numpy = None
+
+def _load_numpy():
+    """Imports NumPy on first use.
+
+    :return module | None: numpy, or None if it is not installed
+    """
+    global _numpy
+    if _numpy is None:
+        try:
+            import numpy
+            _numpy = numpy
+        except ImportError:
+            _numpy = False
+    return _numpy or None
+
+def distances(latitude:float, longitude:float, venues:list) -> list[float]:
+    """Great-circle distances from a point to every venue.
+
+    :param float latitude: latitude of the point
+    :param float longitude: longitude of the point
+    :param list[Venue] venues: venues to measure
+    :return numpy.ndarray | list[float]: distances in meters, NaN for venues without coordinates
+    """
+    numpy = _load_numpy()
+    if numpy is not None:
+        count = len(venues)
+        latitudes = numpy.fromiter((math.nan if venue.latitude is None else venue.latitude for venue in venues),
+                                   dtype=float, count=count)
+        longitudes = numpy.fromiter((math.nan if venue.longitude is None else venue.longitude for venue in venues),
+                                    dtype=float, count=count)
+        phi1 = math.radians(latitude)
+        phi2 = numpy.radians(latitudes)
+        a = (numpy.sin((phi2 - phi1) / 2) ** 2
+             + math.cos(phi1) * numpy.cos(phi2) * numpy.sin(numpy.radians(longitudes - longitude) / 2) ** 2)
+        return 2 * EARTH_RADIUS_METERS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1.0)))
+    return [math.nan if venue.latitude is None or venue.longitude is None
+            else distance_meters(latitude, longitude, venue.latitude, venue.longitude)
+            for venue in venues]
+
+class AliasTable(object):
+    """Walker's alias table (Vose's construction) for O(1) draws from a fixed discrete distribution."""
+
+    __slots__ = ("size", "_probability", "_alias")
+
+    def __init__(self, weights):
+        """Constructor Method
+
+        Args:
+            weights (Sequence[float]): Non-negative weight per outcome, not all zero.
+        """
+        weights = [float(weight) for weight in weights]
+        self.size = len(weights)
+        total = sum(weights)
+        if self.size == 0 or total <= 0:
+            raise ValueError("An alias table needs at least one positive weight")
+
+        scaled = [weight * self.size / total for weight in weights]
+        self._probability = [1.0] * self.size
+        self._alias = list(range(self.size))
+        small = [index for index, weight in enumerate(scaled) if weight < 1]
+        large = [index for index, weight in enumerate(scaled) if weight >= 1]
+        while small and large:
+            less, more = small.pop(), large.pop()
+            self._probability[less] = scaled[less]
+            self._alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+        # Whatever is left has probability 1, up to rounding
+
+    def draw(self, rng = random) -> int:
+        """Draws an outcome.
+
+        :param random.Random rng: source of randomness
+        :return int: index of the outcome
+        """
+        index = int(rng.random() * self.size)
+        return index if rng.random() < self._probability[index] else self._alias[index]
+
+class SelectionEngine(object):
+    """Picks venues from one candidate set, filtered by distance and weighted by proximity. Build it once per set
+    and call draw for every spin.
+
+    Attributes:
+        venues (list[Venue]): Candidates left after the distance filter.
+        distances (list[float]): Distance of each remaining candidate in meters, empty if no distances were needed.
+    """
+
+    def __init__(self, venues:list, origin:dict = None, max_distance:float = None, half_distance:float = None):
+        """Constructor Method
+
+        Args:
+            venues (list[Venue]): Candidate venues.
+            origin (dict, optional): Location distances are measured from, with latitude and longitude.
+            max_distance (float, optional): Candidates farther than this many meters are dropped, as are those
+                without coordinates. Defaults to no limit.
+            half_distance (float, optional): Distance in meters at which a candidate is half as likely as one at the
+                origin, weighting picks by proximity. Defaults to uniform picks.
+        """
+        self.venues = list(venues)
+        self.distances = []
+        self._table = None
+        if origin is None or not (max_distance or half_distance) or not self.venues:
+            return
+
+        numpy = _load_numpy()
+        measured = distances(origin["latitude"], origin["longitude"], self.venues)
+        if numpy is not None:
+            keep = numpy.flatnonzero(measured <= max_distance) if max_distance else numpy.arange(len(self.venues))
+            self.venues = [self.venues[index] for index in keep.tolist()]
+            kept = measured[keep]
+            self.distances = kept.tolist()
+            weights = numpy.power(0.5, numpy.nan_to_num(kept, nan=math.inf) / half_distance).tolist() if half_distance else None
+        else:
+            if max_distance:
+                kept = [(venue, distance) for venue, distance in zip(self.venues, measured) if distance <= max_distance]
+                self.venues = [venue for venue, _ in kept]
+                measured = [distance for _, distance in kept]
+            self.distances = measured
+            weights = [0.0 if math.isnan(distance) else 0.5 ** (distance / half_distance)
+                       for distance in measured] if half_distance else None
+
+        # All weights can underflow to zero when every candidate is far beyond half_distance, then picks stay uniform
+        if weights and sum(weights) > 0:
+            self._table = AliasTable(weights)
+
+    def __len__(self) -> int:
+        return len(self.venues)
+
+    def draw(self, rng = random):
+        """Picks a candidate.
+
+        :param random.Random rng: source of randomness
+        :return Venue | None: the pick, or None if no candidate is left
+        """
+        if not self.venues:
+            return None
+        if self._table is None:
+            return rng.choice(self.venues)
+        return self.venues[self._table.draw(rng)]
@@ -0,0 +1,199 @@
+"""Compares the serving modes of the web tier under the same load: the Flask app under waitress (main.py) and the ASGI
+app under uvicorn (asgi_app.py). Both are started as real servers in front of a fake Lambda API with a fixed latency
+(fake_resy.FakeLambda), and driven over HTTP with the same seeded /retrieve workload at the same concurrency. Reports
+throughput, latency percentiles, failures, /health latency while loaded and the server's peak memory.
+
+    python serve_benchmark.py --concurrency 1000 --requests 5000 --latency-ms 200 --output serving.json
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import platform
+import argparse
+import subprocess
+import aiohttp
+from benchmark import build_workload, percentile, _commit
+
+MODES = ("waitress", "asgi")
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def _server_command(mode:str, port:int, args) -> list[str]:
+    if mode == "waitress":
+        return [sys.executable, "-m", "waitress", "--host=127.0.0.1", f"--port={port}", f"--threads={args.waitress_threads}",
+                f"--connection-limit={args.waitress_connection_limit}", "main:app"]
+    return [sys.executable, "-m", "uvicorn", "asgi_app:app", "--host", "127.0.0.1", "--port", str(port),
+            "--log-level", "warning", "--no-access-log"]
+
+def _peak_memory_kib(pid:int) -> dict:
+    """Reads the resident and peak resident memory of a process, on Linux only."""
+    memory = {}
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("VmRSS", "VmHWM"):
+                    memory[name] = int(value.split()[0])
+    except OSError:
+        return {}
+    return {"rss_kib": memory.get("VmRSS"), "peak_rss_kib": memory.get("VmHWM")}
+
+async def _wait_ready(url:str, timeout:float = 30):
+    deadline = time.monotonic() + timeout
+    async with aiohttp.ClientSession() as client:
+        while time.monotonic() < deadline:
+            try:
+                async with client.get(url + "/health") as response:
+                    if response.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {url} did not become ready")
+
+async def drive(url:str, spins:list, concurrency:int, timeout:float) -> dict:
+    """Posts the spins to /retrieve with the given number in flight, probing /health alongside.
+
+    :param str url: base url of the server
+    :param list[dict] spins: spin requests, posted as forms
+    :param int concurrency: spins in flight at once
+    :param float timeout: seconds before a spin counts as failed
+    :return dict: throughput, latency percentiles, failures and /health latency
+    """
+    outcomes = []
+    health = []
+    queue = asyncio.Queue()
+    for spin in spins:
+        queue.put_nowait(spin)
+
+    # Cookies are not kept, every spin is a new visitor and goes to the backend
+    async with aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=concurrency),
+                                     timeout=aiohttp.ClientTimeout(total=timeout),
+                                     cookie_jar=aiohttp.DummyCookieJar()) as client:
+        async def worker():
+            while not queue.empty():
+                spin = queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    async with client.post(url + "/retrieve", data={key: str(value) for key, value in spin.items()}) as response:
+                        text = await response.text()
+                    ok = response.status == 200 and "An error occurred" not in text and "Failed to connect" not in text
+                except (aiohttp.ClientError, asyncio.TimeoutError):
+                    ok = False
+                outcomes.append((time.perf_counter() - started, ok))
+
+        async def probe():
+            # A separate session, so the probe measures the server and not the load client's pool
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as prober:
+                while True:
+                    started = time.perf_counter()
+                    try:
+                        async with prober.get(url + "/health") as response:
+                            await response.read()
+                        health.append(time.perf_counter() - started)
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        pass
+                    await asyncio.sleep(0.25)
+
+        started = time.perf_counter()
+        prober = asyncio.ensure_future(probe())
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+        prober.cancel()
+
+    latencies = sorted(latency * 1000 for latency, _ in outcomes)
+    health = sorted(latency * 1000 for latency in health)
+    return {
+        "requests": len(spins),
+        "failures": sum(1 for _, ok in outcomes if not ok),
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(spins) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50), 2),
+        "p95_ms": round(percentile(latencies, 0.95), 2),
+        "p99_ms": round(percentile(latencies, 0.99), 2),
+        "max_ms": round(latencies[-1], 2) if latencies else 0.0,
+        "health_p50_ms": round(percentile(health, 0.50), 2),
+        "health_max_ms": round(health[-1], 2) if health else None,
+    }
+
+def run_mode(mode:str, lambda_url:str, spins:list, args) -> dict:
+    """Starts one serving mode, measures it and stops it."""
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, RESY_BACKEND="lambda", LAMBDA_API_URL=lambda_url, LOCAL_RESPINS="false",
+               COALESCE_PICKS=str(args.coalesce_picks), ASGI_MAX_INFLIGHT=str(args.max_inflight))
+    server = subprocess.Popen(_server_command(mode, port, args), cwd=os.path.dirname(os.path.abspath(__file__)),
+                              env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        asyncio.run(_wait_ready(url))
+        asyncio.run(drive(url, spins[:args.warmup], min(args.concurrency, max(1, args.warmup)), args.timeout))
+        result = asyncio.run(drive(url, spins[args.warmup:], args.concurrency, args.timeout))
+        result.update(_peak_memory_kib(server.pid))
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            server.kill()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the waitress and ASGI serving modes under the same load")
+    parser.add_argument("--modes", default=",".join(MODES), help="comma separated subset of " + ", ".join(MODES))
+    parser.add_argument("--requests", type=int, default=2000, help="spins measured per mode")
+    parser.add_argument("--concurrency", type=int, default=500, help="spins in flight at once")
+    parser.add_argument("--warmup", type=int, default=50, help="spins run before measuring")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the workload and the fake Lambda's picks")
+    parser.add_argument("--latency-ms", type=float, default=200, help="latency of each fake Lambda response")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds before a spin counts as failed")
+    parser.add_argument("--coalesce-picks", type=int, default=0, help="COALESCE_PICKS of both servers, 0 disables coalescing")
+    parser.add_argument("--max-inflight", type=int, default=4096, help="ASGI_MAX_INFLIGHT of the ASGI server")
+    parser.add_argument("--waitress-threads", type=int, default=4, help="waitress worker threads, 4 as in main.py")
+    parser.add_argument("--waitress-connection-limit", type=int, default=100, help="waitress connection limit")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    modes = [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+    for mode in modes:
+        if mode not in MODES:
+            parser.error(f"unknown mode {mode}")
+
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import threading
+    import fake_resy
+    from retrieve import ResyRetriever
+
+    fixtures = fake_resy.synthetic_fixtures(ResyRetriever.applicable_cuisine_list, args.seed)
+    fake_lambda = fake_resy.FakeLambda(("127.0.0.1", 0), fixtures, args.latency_ms, args.seed)
+    threading.Thread(target=fake_lambda.serve_forever, daemon=True).start()
+    lambda_url = f"http://127.0.0.1:{fake_lambda.server_address[1]}"
+
+    spins = build_workload(args.warmup + args.requests, args.seed, fixtures["cuisines"])
+    config = {key: value for key, value in vars(args).items() if key not in ("modes", "output")}
+    report = {"commit": _commit(), "python": platform.python_version(), "platform": platform.platform(),
+              "config": config, "results": {}}
+    try:
+        for mode in modes:
+            result = run_mode(mode, lambda_url, spins, args)
+            report["results"][mode] = result
+            print(f"{mode:>9}: {result['throughput_rps']:>8.1f} req/s  p50 {result['p50_ms']:.1f}ms  "
+                  f"p99 {result['p99_ms']:.1f}ms  failures {result['failures']}  "
+                  f"health p50 {result['health_p50_ms']:.1f}ms"
+                  + (f"  peak rss {result['peak_rss_kib'] // 1024}MiB" if result.get("peak_rss_kib") else ""))
+    finally:
+        fake_lambda.shutdown()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+if __name__ == "__main__":
+    main()
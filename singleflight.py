@@ -0,0 +1,71 @@
+"""Request coalescing for identical concurrent work. The first caller for a key runs the work; callers arriving with the
+same key while it is in flight wait for it and share its result (or its exception) instead of repeating it."""
+
+import threading
+
+class _Call(object):
+    """One in-flight call and the outcome its waiters share."""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight(object):
+    """Coalesces concurrent calls that share a key.
+
+    Attributes:
+        calls (int): Calls that ran the work.
+        shared (int): Calls that waited for another caller's work instead.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.shared = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, function):
+        """Runs function for the key, or waits for the call already in flight for it.
+
+        :param Hashable key: identifies identical work
+        :param Callable function: performs the work
+        :raises Exception: whatever function raised, in every caller that shared the call
+        :return Any: the result of function
+        """
+        with self._lock:
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+                self.calls += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            call.done.set()
+        return call.result
+
+    def stats(self) -> dict:
+        """Reports how many calls ran and how many were coalesced.
+
+        :return dict: calls, shared and in-flight counts
+        """
+        with self._lock:
+            return {"calls": self.calls, "shared": self.shared, "inflight": len(self._inflight)}
@@ -0,0 +1,81 @@
+"""Offline tests for candidate set tokens and the per-session candidate store."""
+
+import base64
+import json
+import zlib
+import pytest
+import candidates
+from candidates import CandidateStore, batch_results, decode_candidates, encode_candidates, query_key
+
+ROWS = [[1000 + i, f"Venue {i} & Café", "korean", 40.7 + i / 1000, -74.0, None] for i in range(50)]
+
+def _token(document) -> str:
+    return base64.urlsafe_b64encode(zlib.compress(json.dumps(document).encode())).decode("ascii")
+
+def test_round_trip():
+    rows, expires_at = decode_candidates(encode_candidates(ROWS, ttl=60))
+    assert rows == ROWS
+    assert expires_at > candidates.time.time() + 55
+
+def test_tampered_tokens_never_decode_to_other_rows():
+    token = encode_candidates(ROWS[:5])
+    # A changed character is caught by base64, zlib's checksum or the JSON, except in padding bits base64 ignores
+    for position in range(len(token)):
+        replacement = "A" if token[position] != "A" else "B"
+        tampered = token[:position] + replacement + token[position + 1:]
+        try:
+            assert decode_candidates(tampered)[0] == ROWS[:5]
+        except ValueError:
+            pass
+
+@pytest.mark.parametrize("token", ["", "not a token", "ü", _token({"v": 1, "rows": []}), _token([1, 2]),
+                                   _token({"v": 1, "exp": 2e9, "rows": {"a": 1}}), encode_candidates(ROWS)[:-8]])
+def test_malformed_tokens_are_rejected(token):
+    with pytest.raises(ValueError):
+        decode_candidates(token)
+
+def test_oversized_tokens_are_rejected(monkeypatch):
+    monkeypatch.setattr(candidates, "MAX_TOKEN_BYTES", 1000)
+    # Compresses to a few hundred bytes, but inflates past the limit
+    with pytest.raises(ValueError, match="too large"):
+        decode_candidates(_token({"v": 1, "exp": 2e9, "rows": [["x" * 100]] * 100}))
+    with pytest.raises(ValueError, match="too large"):
+        decode_candidates("A" * 1001)
+    assert decode_candidates(encode_candidates(ROWS[:2]))[0] == ROWS[:2]
+
+def test_expired_and_other_version_tokens_are_rejected():
+    with pytest.raises(ValueError, match="expired"):
+        decode_candidates(encode_candidates(ROWS, ttl=-1))
+    with pytest.raises(ValueError, match="version"):
+        decode_candidates(_token({"v": 2, "exp": 2e9, "rows": ROWS}))
+
+def test_store_draws_without_repeats_and_skips_the_shown_pick():
+    store = CandidateStore()
+    key = query_key("2030-01-01", " 2 ", "19:00", "New York ", "Korean, Thai")
+    assert store.draw("session", key) is None
+    assert store.put("session", key, encode_candidates(ROWS), shown=0)
+    drawn = [store.draw("session", key)[0] for _ in range(len(ROWS) - 1)]
+    assert sorted(drawn) == [row[0] for row in ROWS[1:]]
+    # Once used up, the set starts over
+    assert store.draw("session", key) is not None
+    assert store.draw("other session", key) is None
+
+def test_store_rejects_bad_tokens_and_drops_expired_sets(monkeypatch):
+    store = CandidateStore(max_sets=1)
+    assert not store.put("session", ("a",), "garbage")
+    assert store.put("session", ("a",), encode_candidates(ROWS, ttl=1))
+    monkeypatch.setattr(candidates.time, "time", lambda: 4e9)
+    assert store.draw("session", ("a",)) is None
+    stats = store.stats()
+    assert (stats["rejected_tokens"], stats["expired"], stats["sets"]) == (1, 1, 0)
+
+def test_store_keeps_at_most_max_sets():
+    store = CandidateStore(max_sets=2)
+    for name in ("a", "b", "c"):
+        store.put("session", (name,), encode_candidates(ROWS))
+    assert store.draw("session", ("a",)) is None
+    assert store.draw("session", ("c",)) is not None
+
+def test_batch_results_put_tokens_in_place():
+    body = {"results": [{"success": True, "candidate_set": 0}, {"success": True}], "candidate_sets": ["token"]}
+    assert batch_results(body) == [{"success": True, "candidates": "token"}, {"success": True}]
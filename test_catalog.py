@@ -0,0 +1,98 @@
+"""Offline tests for the venue catalog and spins drawn from it."""
+
+import time
+import pytest
+import fake_resy
+import retrieve
+from catalog import VenueCatalog
+from retrieve import ResyRetriever
+from timing import StageTimer
+
+LOCATION = {"latitude": 40.71427, "longitude": -74.00597, "radius": 30000}
+
+def _rows(cuisine:str, count:int, start:int = 0, spacing:float = 0.01) -> list:
+    """Rows of venues due north of LOCATION, spacing degrees apart, the first spacing away."""
+    return [[start + i, f"{cuisine} {i}", cuisine.lower(), LOCATION["latitude"] + spacing * (i + 1),
+             LOCATION["longitude"]] for i in range(count)]
+
+def _retriever(catalog:VenueCatalog, **options) -> ResyRetriever:
+    return ResyRetriever(date="2030-01-01", time="19:00", location=LOCATION, cuisine_list=["Korean", "Thai"],
+                         per_page=5, catalog=catalog, **options)
+
+def test_candidates_are_looked_up_by_cuisine_within_the_circle():
+    catalog = VenueCatalog()
+    catalog.add(_rows("Korean", 3, spacing=0.1), "Korean")
+    catalog.add(_rows("Thai", 2, start=100), "Thai")
+    # A Thai venue also found by a Korean search
+    catalog.add(_rows("Thai", 1, start=100), "Korean")
+
+    location = dict(LOCATION, radius=25000)
+    korean, thai = catalog.candidates(location, ["Korean", "Thai"])
+    # 0.3 degrees north is about 33 km, outside the circle; results are nearest first
+    assert [venue.id for venue in korean] == [100, 0, 1]
+    assert [venue.id for venue in thai] == [100, 101]
+    assert thai[0].cuisine == "thai"
+    assert catalog.candidates(location, ["Mexican"]) == [[]]
+
+def test_stale_venues_are_not_served():
+    catalog = VenueCatalog(max_age=60)
+    catalog.add(_rows("Korean", 2), "Korean", seen_at=time.time() - 120)
+    catalog.add(_rows("Korean", 1, start=50), "Korean")
+    assert [venue.id for venue in catalog.candidates(LOCATION, ["Korean"])[0]] == [50]
+    assert catalog.prune() == 2
+
+def test_coverage_is_kept_per_area_cuisine_date_and_party_size():
+    catalog = VenueCatalog(coverage_ttl=60)
+    catalog.cover(LOCATION, "Korean", "2030-01-01", 2)
+    catalog.cover(LOCATION, "Thai", "2030-01-01", 2, searched_at=time.time() - 120)
+
+    assert catalog.covers([LOCATION], ["korean"], "2030-01-01", 2)
+    assert not catalog.covers([LOCATION], ["Korean"], "2030-01-02", 2)
+    assert not catalog.covers([LOCATION], ["Korean"], "2030-01-01", 4)
+    # Thai's coverage expired
+    assert not catalog.covers([LOCATION], ["Korean", "Thai"], "2030-01-01", 2)
+    elsewhere = dict(LOCATION, latitude=41.0)
+    assert not catalog.covers([LOCATION, elsewhere], ["Korean"], "2030-01-01", 2)
+
+@pytest.mark.parametrize("max_pages, covered", [(2, False), (10, True)])
+def test_search_covers_only_areas_it_searched_fully(resy, max_pages, covered):
+    resy(fake_resy.synthetic_fixtures(["Korean", "Thai"], min_hits=12, max_hits=12))
+    catalog = VenueCatalog()
+    found = _retriever(catalog, max_pages=max_pages).get_restaurants()
+
+    assert len(found) == 2 * min(12, 5 * max_pages)
+    assert catalog.covers([LOCATION], ["Korean", "Thai"], "2030-01-01", 2) is covered
+    assert _retriever(catalog).catalog_ready() is covered
+
+def _catalog_spin(resy, fixtures:dict, monkeypatch) -> tuple:
+    """Searches once to fill the catalog, then spins again from it, returning the pick and the second spin's
+    counters."""
+    resy(fixtures)
+    monkeypatch.setattr(retrieve, "CONFIRM_ATTEMPTS", 3)
+    catalog = VenueCatalog()
+    _retriever(catalog).get_restaurants()
+
+    timer = StageTimer()
+    retriever = _retriever(catalog, timer=timer)
+    restaurants = retriever.get_restaurants()
+    assert len(restaurants) == 24
+    return retriever.randomize_restaurants(restaurants), timer.report()["counters"]
+
+def test_catalog_pick_is_confirmed_with_resy(resy, monkeypatch):
+    pick, counters = _catalog_spin(resy, fake_resy.synthetic_fixtures(["Korean", "Thai"], min_hits=12, max_hits=12),
+                                   monkeypatch)
+    assert pick is not None
+    assert counters["availability_checks"] == 1
+    assert "catalog_fallbacks" not in counters and "upstream_calls" not in counters
+
+def test_unconfirmed_catalog_picks_fall_back_to_a_search(resy, monkeypatch):
+    fixtures = fake_resy.synthetic_fixtures(["Korean", "Thai"], min_hits=12, max_hits=12)
+    for hits in fixtures["cuisines"].values():
+        for hit in hits:
+            hit["availability"] = {"slots": []}
+    pick, counters = _catalog_spin(resy, fixtures, monkeypatch)
+
+    # Three draws without a confirmed slot, then a search of Resy, served from the search cache here
+    assert 1 <= counters["availability_checks"] <= 3
+    assert counters["catalog_fallbacks"] == 1
+    assert pick is not None
@@ -0,0 +1,108 @@
+"""Offline tests for coalescing identical concurrent spins into shared batch requests."""
+
+import math
+import time
+import asyncio
+import threading
+import pytest
+from coalescing_client import CoalescingClient
+
+SPIN = {"date": "2030-01-01", "party_size": 2, "time": "19:00", "location": "nyc", "cuisines": "Korean"}
+
+class FakeClient:
+    """Backend that answers after a delay and numbers every pick it hands out"""
+
+    def __init__(self, delay: float = 0.2):
+        self.delay = delay
+        self.singles = 0
+        self.batches = []
+        self._picks = 0
+        self._lock = threading.Lock()
+
+    def _pick(self):
+        with self._lock:
+            self._picks += 1
+            return {"success": True, "restaurant": {"name": f"Venue {self._picks}"}}
+
+    def get_restaurant(self, **payload):
+        with self._lock:
+            self.singles += 1
+        time.sleep(self.delay)
+        return self._pick()
+
+    def get_restaurants_batch(self, spins):
+        with self._lock:
+            self.batches.append(len(spins))
+        time.sleep(self.delay)
+        return [self._pick() for _ in spins]
+
+    def stats(self):
+        return {}
+
+def _burst(client, callers: int) -> list:
+    """Sends one spin, then a burst of identical spins while it is in flight, returning every caller's result"""
+    results = [None] * (callers + 1)
+    def spin(index):
+        results[index] = client.get_restaurant(**SPIN)
+    threads = [threading.Thread(target=spin, args=(0,))]
+    threads[0].start()
+    time.sleep(0.05)
+    threads += [threading.Thread(target=spin, args=(index,)) for index in range(1, callers + 1)]
+    for thread in threads[1:]:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    return results
+
+def test_lone_spin_is_sent_alone():
+    backend = FakeClient(delay=0)
+    result = CoalescingClient(backend, picks=8).get_restaurant(**SPIN)
+    assert result["success"]
+    assert (backend.singles, backend.batches) == (1, [])
+
+@pytest.mark.parametrize("callers", [1, 7, 8, 9, 20, 33])
+def test_burst_makes_one_batch_per_picks_callers(callers):
+    backend = FakeClient()
+    client = CoalescingClient(backend, picks=8)
+    results = _burst(client, callers)
+
+    assert backend.singles == 1
+    assert len(backend.batches) == math.ceil(callers / 8)
+    assert all(size == 8 for size in backend.batches)
+    # Every caller gets its own pick
+    names = [result["restaurant"]["name"] for result in results]
+    assert len(set(names)) == len(names)
+    assert client.stats()["coalescing"]["inflight"] == 0
+
+def test_failed_batch_fails_its_callers():
+    backend = FakeClient()
+    backend.get_restaurants_batch = lambda spins: time.sleep(0.2)
+    results = _burst(CoalescingClient(backend, picks=4), 6)
+    assert results[0]["success"]
+    assert results[1:] == [None] * 6
+
+def test_async_burst_makes_one_batch_per_picks_callers():
+    pytest.importorskip("aiohttp")
+    from async_client import AsyncCoalescingClient
+
+    class AsyncFakeClient(FakeClient):
+        async def get_restaurant(self, **payload):
+            self.singles += 1
+            await asyncio.sleep(self.delay)
+            return self._pick()
+
+        async def get_restaurants_batch(self, spins):
+            self.batches.append(len(spins))
+            await asyncio.sleep(self.delay)
+            return [self._pick() for _ in spins]
+
+    async def burst(client, callers):
+        first = asyncio.ensure_future(client.get_restaurant(**SPIN))
+        await asyncio.sleep(0.05)
+        return await asyncio.gather(first, *[client.get_restaurant(**SPIN) for _ in range(callers)])
+
+    backend = AsyncFakeClient()
+    results = asyncio.run(burst(AsyncCoalescingClient(backend, picks=8), 20))
+    assert backend.singles == 1
+    assert backend.batches == [8, 8, 8]
+    assert len({result["restaurant"]["name"] for result in results}) == 21
@@ -0,0 +1,79 @@
+"""Offline tests for the Resy credential pool: rotation, benching and the last usable credential."""
+
+import time
+import pytest
+import credentials
+from credentials import Credential, CredentialPool, NoCredentialError, load_credentials
+
+def _pool(count:int, rate:float = 0) -> CredentialPool:
+    return CredentialPool([Credential(f"set{index}", {"Authorization": str(index)}, rate=rate, burst=1)
+                           for index in range(count)])
+
+def test_calls_rotate_across_credentials():
+    pool = _pool(3, rate=1)
+    names = [pool.acquire().name for _ in range(3)]
+    # Each set has one token, so three calls go out with three different sets
+    assert sorted(names) == ["set0", "set1", "set2"]
+
+@pytest.mark.parametrize("status, reason", [(401, "unauthorized"), (403, "unauthorized"), (419, "unauthorized"),
+                                            (429, "throttled")])
+def test_rejected_credential_is_benched(status, reason):
+    pool = _pool(2)
+    rejected = pool.acquire()
+    assert pool.report(rejected, status, retry_after=None)
+    assert rejected.bench_reason == reason
+    assert pool.healthy() == 1
+    assert {pool.acquire().name for _ in range(5)} == {"set1" if rejected.name == "set0" else "set0"}
+    stats = pool.stats()["pool"][rejected.name]
+    assert (stats["state"], stats[reason], stats["benched"]) == ("benched", 1, 1)
+
+def test_bench_lengths():
+    pool = _pool(2)
+    first, second = pool.credentials
+    now = time.monotonic()
+    pool.report(first, 429, retry_after=2)
+    pool.report(second, 401)
+    assert first.benched_until == pytest.approx(now + 2, abs=0.5)
+    # The other credential is throttled, which still counts as usable, so an unauthorized one is benched
+    assert second.benched_until == pytest.approx(now + credentials.UNAUTHORIZED_BENCH, abs=0.5)
+
+@pytest.mark.parametrize("status", [200, 404, 500])
+def test_other_statuses_do_not_bench(status):
+    pool = _pool(2)
+    assert not pool.report(pool.credentials[0], status)
+    assert pool.healthy() == 2
+
+def test_last_usable_credential_is_never_benched():
+    pool = _pool(1)
+    assert not pool.report(pool.credentials[0], 401)
+    assert not pool.report(pool.credentials[0], 429)
+    assert pool.healthy() == 1
+
+    pool = _pool(2)
+    assert pool.report(pool.credentials[0], 403)
+    assert not pool.report(pool.credentials[1], 401)
+    assert pool.acquire().name == "set1"
+
+def test_throttled_credential_is_used_when_every_other_is_benched():
+    pool = _pool(2)
+    pool.report(pool.credentials[0], 429, retry_after=60)
+    # set0 is throttled and so still usable, which lets set1 be benched
+    assert pool.report(pool.credentials[1], 401)
+    assert pool.acquire().name == "set0"
+
+def test_empty_pool_raises():
+    with pytest.raises(NoCredentialError):
+        _pool(0).acquire()
+
+def test_load_credentials():
+    environ = {"AUTHORIZATION": "a", "XRESYAUTHTOKEN": "b", "XRESYUNIVERSALAUTH": "c",
+               "AUTHORIZATION_2": "d", "XRESYAUTHTOKEN_2": "e", "XRESYUNIVERSALAUTH_2": "f",
+               "AUTHORIZATION_3": "g",
+               "RESY_CREDENTIALS": '[{"name": "spare", "AUTHORIZATION": "h", "XRESYAUTHTOKEN": "i", '
+                                   '"XRESYUNIVERSALAUTH": "j"}, {"AUTHORIZATION": "a", "XRESYAUTHTOKEN": "b", '
+                                   '"XRESYUNIVERSALAUTH": "c"}]'}
+    loaded, missing = load_credentials(environ)
+    # Incomplete and repeated sets are left out
+    assert [credential.name for credential in loaded] == ["default", "2", "spare"]
+    assert missing == []
+    assert load_credentials({"AUTHORIZATION": "a"}) == ([], ["XRESYAUTHTOKEN", "XRESYUNIVERSALAUTH"])
@@ -0,0 +1,139 @@
+"""Offline tests for the layered geocoder and the grid cells of tiled searches."""
+
+import json
+import math
+import random
+import threading
+import time
+import pytest
+import geocode
+from fake_resy import FakeGeoNames, SYNTHETIC_GEOCODES
+from geocode import GAZETTEER, Geocoder, normalize
+
+def _geocoder(tmp_path = None, **options) -> Geocoder:
+    """Returns a geocoder whose web service lookups are answered from the synthetic fixture geocodes."""
+    path = str(tmp_path / "geocodes.json") if tmp_path is not None else ""
+    geocoder = Geocoder(disk_cache_path=path, **options)
+    geocoder._client = FakeGeoNames(SYNTHETIC_GEOCODES)
+    return geocoder
+
+def test_normalize():
+    assert normalize("  New York City,  New York!! ") == "new york city, new york"
+    assert normalize("St. Louis,,MO") == "st louis, mo"
+
+@pytest.mark.parametrize("address", ["NYC", "new york, ny", "New York City, New York, USA", "Manhattan",
+                                     "Portland, OR", "washington dc"])
+def test_gazetteer_resolves_metros_without_a_network_call(address):
+    geocoder = _geocoder()
+    assert geocoder.lookup(address) == GAZETTEER[normalize(address)]
+    assert geocoder._client.calls == 0
+    assert geocoder.stats["gazetteer"] == 1
+
+def test_ambiguous_metros_need_their_state():
+    assert "portland" not in GAZETTEER
+    assert GAZETTEER["portland, me"] != GAZETTEER["portland, or"]
+
+def test_lru_serves_repeats_and_evicts_the_least_recently_used():
+    geocoder = _geocoder(lru_size=2)
+    for address in ("Hoboken, NJ", "Jersey City, NJ", "Hoboken, NJ", "Evanston, IL"):
+        assert geocoder.lookup(address) == SYNTHETIC_GEOCODES[normalize(address)]
+    assert (geocoder.stats["network"], geocoder.stats["lru"]) == (3, 1)
+    assert list(geocoder._lru) == ["hoboken, nj", "evanston, il"]
+    # Jersey City was evicted, so it is looked up again
+    geocoder.lookup("jersey city, nj")
+    assert geocoder.stats["network"] == 4
+
+def test_unresolved_address_is_not_cached():
+    geocoder = _geocoder()
+    assert geocoder.lookup("Atlantis") is None
+    assert geocoder.lookup("Atlantis") is None
+    assert (geocoder._client.calls, geocoder.stats["failed"]) == (2, 2)
+
+def test_disk_cache_survives_a_new_geocoder(tmp_path):
+    _geocoder(tmp_path).lookup("Pasadena, CA")
+    geocoder = _geocoder(tmp_path)
+    assert geocoder.lookup("pasadena,  ca") == SYNTHETIC_GEOCODES["pasadena, ca"]
+    assert (geocoder._client.calls, geocoder.stats["disk"]) == (0, 1)
+
+def test_expired_disk_entries_are_looked_up_again(tmp_path):
+    path = tmp_path / "geocodes.json"
+    path.write_text(json.dumps({"pasadena, ca": [1.0, 2.0, time.time() - 120]}))
+    geocoder = _geocoder(tmp_path, disk_ttl=60)
+    assert geocoder.lookup("Pasadena, CA") == SYNTHETIC_GEOCODES["pasadena, ca"]
+    assert geocoder._client.calls == 1
+    assert json.loads(path.read_text())["pasadena, ca"][:2] == list(SYNTHETIC_GEOCODES["pasadena, ca"])
+
+def test_corrupt_disk_cache_is_ignored(tmp_path):
+    (tmp_path / "geocodes.json").write_text("{not json")
+    assert _geocoder(tmp_path).lookup("Evanston, IL") == SYNTHETIC_GEOCODES["evanston, il"]
+
+def test_concurrent_lookups_share_one_network_call():
+    geocoder = _geocoder()
+    geocoder._client.latency_ms = 100
+    threads = [threading.Thread(target=geocoder.lookup, args=("Long Island City, NY",)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert geocoder._client.calls == 1
+
+def test_get_geocoder_creates_one_geocoder(monkeypatch):
+    monkeypatch.setattr(geocode, "_geocoder", None)
+    created = []
+    monkeypatch.setattr(geocode, "Geocoder", lambda: created.append(1) or time.sleep(0.05) or object())
+    threads = [threading.Thread(target=geocode.get_geocoder) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(5)
+    assert len(created) == 1
+
+def test_get_location_defaults_to_nyc(monkeypatch):
+    monkeypatch.setattr(geocode, "_geocoder", _geocoder())
+    location = geocode.get_location("Atlantis")
+    assert (location["latitude"], location["longitude"]) == GAZETTEER["new york city, new york"]
+    assert location["radius"] == geocode.DEFAULT_RADIUS
+
+def _circle_points(location:dict, count:int = 2000, seed:int = 0) -> list:
+    """Points spread over the location's circle, its edge included."""
+    rng = random.Random(seed)
+    points = []
+    radius = location["radius"] / geocode.METERS_PER_DEGREE
+    while len(points) < count:
+        lat, lng = rng.uniform(-1, 1), rng.uniform(-1, 1)
+        if lat * lat + lng * lng <= 1:
+            points.append((location["latitude"] + lat * radius * 0.999,
+                           location["longitude"] + lng * radius * 0.999 / math.cos(math.radians(location["latitude"]))))
+    return points
+
+@pytest.mark.parametrize("latitude, longitude", [(40.71427, -74.00597), (47.60621, -122.33207), (-33.87, 151.21)])
+def test_tiles_cover_the_circle(latitude, longitude):
+    location = {"latitude": latitude, "longitude": longitude, "radius": 5000}
+    cells = geocode.tiles(location, 2000, 64)
+    assert 1 < len(cells) <= 64
+    for point in _circle_points(location):
+        assert any(geocode.distance_meters(*point, cell["latitude"], cell["longitude"]) <= cell["radius"]
+                   for cell in cells)
+    distances = [geocode.distance_meters(latitude, longitude, cell["latitude"], cell["longitude"]) for cell in cells]
+    assert distances == sorted(distances)
+
+@pytest.mark.parametrize("max_tiles", [1, 4, 9, 16])
+def test_tiles_respect_max_tiles(max_tiles):
+    location = {"latitude": 40.71427, "longitude": -74.00597, "radius": 20000}
+    cells = geocode.tiles(location, 500, max_tiles)
+    assert 1 <= len(cells) <= max_tiles
+    # Cells were widened to fit, and still cover the circle
+    assert cells[0]["radius"] > math.ceil(500 * math.sqrt(2) / 2)
+    for point in _circle_points(location, 500):
+        assert any(geocode.distance_meters(*point, cell["latitude"], cell["longitude"]) <= cell["radius"]
+                   for cell in cells)
+
+def test_tiles_share_a_global_grid():
+    near = geocode.tiles({"latitude": 40.71427, "longitude": -74.00597, "radius": 3000}, 1000, 64)
+    shifted = geocode.tiles({"latitude": 40.71527, "longitude": -74.00497, "radius": 3000}, 1000, 64)
+    centers = lambda cells: {(cell["latitude"], cell["longitude"]) for cell in cells}
+    assert len(centers(near) & centers(shifted)) > len(near) / 2
+
+def test_no_tiles_without_a_tile_size():
+    location = {"latitude": 40.71427, "longitude": -74.00597, "radius": 3000}
+    assert geocode.tiles(location, 0, 16) == [location]
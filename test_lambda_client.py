@@ -0,0 +1,76 @@
+"""Offline tests for the Lambda client's circuit breaker."""
+
+import time
+import pytest
+from lambda_client import CircuitBreaker, CircuitOpenError, LambdaClient
+
+def _half_open_client(send) -> LambdaClient:
+    """Returns a client whose breaker is ready for its half-open trial, sending through send"""
+    client = LambdaClient("http://lambda.invalid", breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0.05))
+    client._send = send
+    client.breaker.record_failure()
+    time.sleep(0.06)
+    return client
+
+@pytest.mark.parametrize("error", (ValueError("bad body"), KeyboardInterrupt()))
+def test_any_error_during_trial_reopens_breaker(error):
+    def send(path, payload):
+        raise error
+    client = _half_open_client(send)
+
+    with pytest.raises(type(error)):
+        client._post("/spin", {})
+
+    assert client.breaker.state == CircuitBreaker.OPEN
+    assert not client.breaker._trial_in_flight
+    assert client.stats()["failures"] == 1
+    # After the next reset timeout another trial is let through
+    time.sleep(0.06)
+    assert client.breaker.allow()
+
+def test_successful_trial_closes_breaker():
+    class Response:
+        status_code = 200
+    client = _half_open_client(lambda path, payload: Response())
+    assert client._post("/spin", {}).status_code == 200
+    assert client.breaker.state == CircuitBreaker.CLOSED
+
+def test_open_breaker_rejects_calls():
+    client = _half_open_client(lambda path, payload: None)
+    client.breaker.record_failure()
+    with pytest.raises(CircuitOpenError):
+        client._post("/spin", {})
+
+@pytest.mark.parametrize("cancel", (False, True))
+def test_async_trial_never_stays_in_flight(cancel):
+    pytest.importorskip("aiohttp")
+    import asyncio
+    from async_client import AsyncLambdaClient
+
+    class Session:
+        def post(self, url, json):
+            return self
+        async def __aenter__(self):
+            await asyncio.sleep(10 if cancel else 0)
+            raise ValueError("bad body")
+        async def __aexit__(self, *exc):
+            return False
+
+    async def trial():
+        client = AsyncLambdaClient("http://lambda.invalid", breaker=CircuitBreaker(failure_threshold=1, reset_timeout=0))
+        client._session()
+        await client.session.close()
+        client.session = Session()
+        client.breaker.record_failure()
+        post = asyncio.ensure_future(client._post("/spin", {}))
+        await asyncio.sleep(0.05)
+        post.cancel()
+        with pytest.raises(asyncio.CancelledError if cancel else ValueError):
+            await post
+        return client
+
+    client = asyncio.run(trial())
+    assert not client.breaker._trial_in_flight
+    # A cancelled trial leaves the breaker half-open without counting a failure
+    assert client.stats()["failures"] == (0 if cancel else 1)
+    assert client.breaker.allow()
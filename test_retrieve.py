@@ -0,0 +1,113 @@
+"""Offline tests for venue searches and picks against the fake Resy api."""
+
+import copy
+import random
+from collections import Counter
+import pytest
+import fake_resy
+import geocode
+import retrieve
+from retrieve import ResyRetriever
+from timing import StageTimer
+
+LOCATION = {"latitude": 40.71427, "longitude": -74.00597, "radius": 30000}
+
+def _list_under(hit:dict, *cuisines:str) -> dict:
+    """Returns a copy of a hit listing the given cuisines, the first being its own."""
+    hit = copy.deepcopy(hit)
+    hit["cuisine"] = list(cuisines)
+    hit["_highlightResult"]["cuisine"] = [{"value": cuisine, "matchLevel": "none"} for cuisine in cuisines]
+    return hit
+
+def overlapping_fixtures() -> dict:
+    """Korean and Thai searches sharing venues: Korean venues also listed as Thai, and Bar venues, whose own cuisine
+    is not searched, found under one or both."""
+    fixtures = fake_resy.synthetic_fixtures(["Korean", "Thai", "Bar"], min_hits=6, max_hits=6)
+    korean, thai, bar = (fixtures["cuisines"][cuisine] for cuisine in ("Korean", "Thai", "Bar"))
+    thai.extend(_list_under(hit, "Korean", "Thai") for hit in korean[:3])
+    korean.extend(_list_under(hit, "Bar", "Korean", "Thai") for hit in bar[:4])
+    thai.extend(_list_under(hit, "Bar", "Korean", "Thai") for hit in bar[:2])
+    thai.append(_list_under(bar[4], "Bar", "Thai"))
+    random.Random(0).shuffle(thai)
+    del fixtures["cuisines"]["Bar"]
+    return fixtures
+
+def _retriever(**options) -> ResyRetriever:
+    options.setdefault("cuisine_list", ["Korean", "Thai"])
+    return ResyRetriever(date="2030-01-01", time="19:00", location=LOCATION, per_page=4, **options)
+
+def test_lazy_count_picks_match_eager_picks(resy):
+    resy(overlapping_fixtures())
+    retriever = _retriever()
+    restaurants = retriever.get_restaurants()
+    # 6 Korean, 6 Thai and 5 Bar venues, counted 6 + 4 times under Korean and 6 + 3 + 2 + 1 times under Thai
+    assert len(restaurants) == 17
+    random.seed(1)
+    spins = 6800
+
+    lazy = Counter()
+    for _ in range(spins):
+        venue, total = retriever.lazy_randomize("count")
+        # Draws rejected LAZY_DRAWS times leave the pick to the eager fallback, as in run_spin
+        lazy[(venue or retriever.randomize_restaurants(restaurants)).key()] += 1
+    eager = Counter(retriever.randomize_restaurants(restaurants).key() for _ in range(spins))
+
+    assert total == 22
+    assert set(lazy) == set(eager) == {venue.key() for venue in restaurants}
+    # 400 picks of each venue expected, with a standard deviation of about 20
+    for counts in (lazy, eager):
+        assert max(counts.values()) < 480 and min(counts.values()) > 320
+
+def test_lazy_count_draws_once_without_shared_venues(resy):
+    resy(fake_resy.synthetic_fixtures(["Korean", "Thai"], min_hits=10, max_hits=10))
+    timer = StageTimer()
+    retriever = _retriever(timer=timer)
+    for _ in range(50):
+        venue, total = retriever.lazy_randomize("count")
+        assert venue is not None and total == 20
+    counters = timer.report()["counters"]
+    assert "lazy_rejections" not in counters and "lazy_unlisted" not in counters
+    # Only the pages holding picks are requested, never the full searches
+    assert counters["upstream_calls"] <= 6
+
+def test_lazy_count_rejects_a_venue_drawn_from_another_cuisine(resy, monkeypatch):
+    resy(overlapping_fixtures())
+    retriever = _retriever()
+    thai = retriever._search_cuisine("Thai")
+    position = next(index for index, venue in enumerate(thai) if venue.cuisine == "korean")
+    # Every draw lands on that Korean venue's Thai listing, after the 10 Korean hits
+    monkeypatch.setattr(retrieve.random, "randrange", lambda total: 10 + position)
+    assert retriever.lazy_randomize("count") == (None, 22)
+
+def test_tiled_search_merges_and_dedupes_cells(resy):
+    fixtures = fake_resy.synthetic_fixtures(["Korean", "Thai"], min_hits=300, max_hits=300)
+    # Venues listed under both cuisines, found by both searches of every cell they are in
+    korean, thai = fixtures["cuisines"]["Korean"], fixtures["cuisines"]["Thai"]
+    thai.extend(_list_under(hit, "Korean", "Thai") for hit in korean[:40])
+    adapter = resy(fixtures, geo_filter=True)
+    location = dict(LOCATION, radius=6000)
+    expected = {(hit.get("id") or {}).get("resy") for hits in fixtures["cuisines"].values() for hit in hits
+                if geocode.distance_meters(location["latitude"], location["longitude"],
+                                           hit["_geoloc"]["lat"], hit["_geoloc"]["lng"]) <= location["radius"]}
+
+    timer = StageTimer()
+    retriever = ResyRetriever(date="2030-01-01", time="19:00", location=location, cuisine_list=["Korean", "Thai"],
+                              per_page=20, max_pages=10, tile_meters=3000, max_tiles=16, timer=timer)
+    restaurants = retriever.get_restaurants()
+
+    cells = timer.report()["counters"]["tiles"]
+    assert 4 <= cells <= 16
+    # Cells overlap, so venues near their edges are found more than once, but kept once
+    assert len(restaurants) == len({venue.key() for venue in restaurants})
+    assert {venue.key() for venue in restaurants} == expected
+    assert adapter.stats["requests"] >= 2 * cells
+
+def test_tiled_search_drops_venues_outside_the_circle(resy):
+    fixtures = fake_resy.synthetic_fixtures(["Korean"], min_hits=300, max_hits=300)
+    resy(fixtures, geo_filter=True)
+    location = dict(LOCATION, radius=2500)
+    restaurants = ResyRetriever(date="2030-01-01", time="19:00", location=location, cuisine_list=["Korean"],
+                                per_page=50, tile_meters=2000).get_restaurants()
+    assert restaurants
+    assert all(geocode.distance_meters(location["latitude"], location["longitude"], venue.latitude, venue.longitude)
+               <= location["radius"] for venue in restaurants)
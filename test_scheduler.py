@@ -0,0 +1,165 @@
+"""Offline tests for the upstream scheduler's handling of throttled (429) and failed responses."""
+
+import time
+import threading
+from email.utils import formatdate
+import pytest
+import scheduler
+from scheduler import UpstreamScheduler, retry_after_seconds
+
+class FakeResponse(object):
+    def __init__(self, status_code:int, retry_after:str = None):
+        self.status_code = status_code
+        self.headers = {"Retry-After": retry_after} if retry_after is not None else {}
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+def _sender(*responses):
+    """Returns a send callable answering with the given responses in turn, and the list of those sent."""
+    sent = []
+    def send():
+        response = responses[min(len(sent), len(responses) - 1)]
+        sent.append(response)
+        return response
+    return send, sent
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(scheduler, "BACKOFF_BASE", 0.01)
+
+def test_retry_after_seconds():
+    assert retry_after_seconds("2") == 2.0
+    assert retry_after_seconds("-1") == 0.0
+    assert retry_after_seconds(None) is None
+    assert retry_after_seconds("soon") is None
+    assert retry_after_seconds(formatdate(time.time() + 60, usegmt=True)) == pytest.approx(60, abs=2)
+
+def test_throttled_call_is_retried_after_retry_after():
+    upstream = UpstreamScheduler(rate=0, initial_concurrency=8)
+    send, sent = _sender(FakeResponse(429, "0.2"), FakeResponse(200))
+    started = time.monotonic()
+    response = upstream.execute(send)
+
+    assert response.status_code == 200
+    assert time.monotonic() - started >= 0.2
+    assert sent[0].closed
+    stats = upstream.stats()
+    assert (stats["calls"], stats["throttled"], stats["retries"]) == (2, 1, 1)
+    # Halved on the 429, then raised additively by the success
+    assert stats["concurrency_limit"] == 4
+
+def test_throttled_call_gives_up_after_max_retries():
+    upstream = UpstreamScheduler(rate=0, max_retries=2)
+    send, sent = _sender(FakeResponse(429))
+    assert upstream.execute(send).status_code == 429
+    assert len(sent) == 3
+    assert upstream.stats()["throttled"] == 3
+
+def test_missing_retry_after_backs_off_exponentially():
+    upstream = UpstreamScheduler(rate=0, max_retries=2)
+    send, sent = _sender(FakeResponse(429), FakeResponse(429), FakeResponse(200))
+    started = time.monotonic()
+    assert upstream.execute(send).status_code == 200
+    # Pauses of BACKOFF_BASE, then twice that
+    assert time.monotonic() - started >= 0.03
+
+def test_pause_holds_back_other_calls():
+    upstream = UpstreamScheduler(rate=0, max_retries=0)
+    upstream.execute(_sender(FakeResponse(429, "0.3"))[0])
+    started = time.monotonic()
+    assert upstream.execute(_sender(FakeResponse(200))[0]).status_code == 200
+    assert time.monotonic() - started >= 0.25
+
+def test_pause_is_capped():
+    upstream = UpstreamScheduler(rate=0, max_retries=0)
+    upstream.execute(_sender(FakeResponse(429, "3600"))[0])
+    assert upstream.stats()["paused_for_ms"] <= scheduler.MAX_PAUSE * 1000
+
+def test_server_errors_are_retried_without_pausing():
+    upstream = UpstreamScheduler(rate=0, max_retries=1)
+    assert upstream.execute(_sender(FakeResponse(503), FakeResponse(200))[0]).status_code == 200
+    stats = upstream.stats()
+    assert (stats["server_errors"], stats["throttled"], stats["paused_for_ms"]) == (1, 0, 0)
+
+def test_retryable_responses_are_sent_again():
+    upstream = UpstreamScheduler(rate=0, max_retries=2)
+    send, sent = _sender(FakeResponse(401), FakeResponse(200))
+    response = upstream.execute(send, retryable=lambda response: response.status_code == 401)
+    assert response.status_code == 200
+    assert len(sent) == 2
+
+def test_every_attempt_takes_a_token():
+    # One token up front, then one every 0.1s: the two retries of a throttled call wait for theirs
+    upstream = UpstreamScheduler(rate=10, burst=1, max_retries=2)
+    send, sent = _sender(FakeResponse(429, "0"), FakeResponse(429, "0"), FakeResponse(200))
+    started = time.monotonic()
+    assert upstream.execute(send).status_code == 200
+    assert time.monotonic() - started >= 0.18
+
+def test_rate_follows_capacity():
+    healthy = [2]
+    upstream = UpstreamScheduler(rate=10, burst=1, capacity=lambda: healthy[0])
+    send = _sender(FakeResponse(200))[0]
+    for _ in range(2):
+        upstream.execute(send)
+    started = time.monotonic()
+    upstream.execute(send)
+    # Two credential sets refill at 20 tokens per second
+    assert time.monotonic() - started < 0.09
+    healthy[0] = 0
+    started = time.monotonic()
+    upstream.execute(send)
+    upstream.execute(send)
+    # With none healthy the rate stays at one credential set's, rather than dropping to 0, which means unlimited
+    assert 0.15 <= time.monotonic() - started < 0.3
+
+def test_interactive_calls_are_admitted_first():
+    upstream = UpstreamScheduler(rate=0, initial_concurrency=1, max_retries=0)
+    release = threading.Event()
+    order = []
+    def blocking():
+        release.wait(5)
+        return FakeResponse(200)
+    def call(priority, name):
+        upstream.execute(lambda: order.append(name) or FakeResponse(200), priority)
+
+    first = threading.Thread(target=upstream.execute, args=(blocking,))
+    first.start()
+    time.sleep(0.05)
+    waiting = [threading.Thread(target=call, args=(scheduler.BACKGROUND, "background")),
+               threading.Thread(target=call, args=(scheduler.INTERACTIVE, "interactive"))]
+    for thread in waiting:
+        thread.start()
+        time.sleep(0.05)
+    release.set()
+    for thread in [first] + waiting:
+        thread.join(5)
+    assert order == ["interactive", "background"]
+
+def test_queue_timeout():
+    upstream = UpstreamScheduler(rate=0, max_wait=0.1, max_retries=0)
+    upstream.execute(_sender(FakeResponse(429, "5"))[0])
+    with pytest.raises(scheduler.QueueTimeout):
+        upstream.execute(_sender(FakeResponse(200))[0])
+    assert upstream.stats()["queue_timeouts"] == 1
+
+def test_streamed_response_holds_its_slot_until_closed():
+    upstream = UpstreamScheduler(rate=0, max_retries=0)
+    response = upstream.execute(_sender(FakeResponse(200))[0], stream=True)
+    assert upstream.stats()["in_flight"] == 1
+    response.close()
+    response.close()
+    assert response.closed
+    assert upstream.stats()["in_flight"] == 0
+
+def test_throttled_streamed_response_frees_its_slot_at_once():
+    upstream = UpstreamScheduler(rate=0, max_retries=0)
+    assert upstream.execute(_sender(FakeResponse(429, "0"))[0], stream=True).status_code == 429
+    assert upstream.stats()["in_flight"] == 0
+
+def test_unstreamed_response_frees_its_slot_at_once():
+    upstream = UpstreamScheduler(rate=0)
+    upstream.execute(_sender(FakeResponse(200))[0])
+    assert upstream.stats()["in_flight"] == 0
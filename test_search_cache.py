@@ -0,0 +1,102 @@
+"""Offline tests for the venue search cache's fresh, stale-while-revalidate and expired lookups."""
+
+import time
+import threading
+import pytest
+from search_cache import MemoryBackend, SQLiteBackend, SearchCache, from_spec, quantize_time
+
+class Fetcher(object):
+    """Counts its calls and answers with the given pages"""
+
+    def __init__(self, pages:list, complete:bool = True):
+        self.pages = pages
+        self.complete = complete
+        self.calls = 0
+        self.done = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        self.done.set()
+        return self.pages, self.complete
+
+def _cache(age:float, backend = None) -> SearchCache:
+    """Returns a cache with ttl 10 and stale_ttl 10 holding ["old"] under "key", stored age seconds ago"""
+    cache = SearchCache(backend or MemoryBackend(), ttl=10, stale_ttl=10)
+    cache.backend.set("key", ["old"], time.time() - age)
+    return cache
+
+@pytest.fixture(params=("memory", "sqlite"))
+def backend(request, tmp_path):
+    return MemoryBackend() if request.param == "memory" else SQLiteBackend(str(tmp_path / "cache.db"))
+
+def test_fresh_entry_is_served_without_fetching(backend):
+    cache = _cache(1, backend)
+    fetch = Fetcher(["new"])
+    assert cache.get_or_fetch("key", fetch) == ["old"]
+    assert fetch.calls == 0
+    stats = cache.stats()
+    assert (stats["hits"], stats["upstream_calls_saved"], stats["refreshes"]) == (1, 1, 0)
+
+def test_stale_entry_is_served_and_refreshed_in_the_background(backend):
+    cache = _cache(15, backend)
+    fetch, refresh = Fetcher(["new"]), Fetcher(["refreshed"])
+    assert cache.get_or_fetch("key", fetch, refresh=refresh) == ["old"]
+    assert refresh.done.wait(5)
+    for _ in range(100):
+        if cache.get("key") is not None:
+            break
+        time.sleep(0.01)
+    # The refresh has its own fetch, so the request's fetch is left alone
+    assert (fetch.calls, refresh.calls) == (0, 1)
+    assert cache.get("key") == ["refreshed"]
+    assert (cache.stats()["stale_hits"], cache.stats()["refreshes"]) == (1, 1)
+
+def test_stale_entry_refreshes_with_fetch_by_default():
+    cache = _cache(15)
+    fetch = Fetcher(["new"])
+    assert cache.get_or_fetch("key", fetch) == ["old"]
+    assert fetch.done.wait(5)
+
+def test_refresh_runs_once_per_key():
+    cache = _cache(15)
+    release = threading.Event()
+    calls = []
+    def refresh():
+        calls.append(1)
+        release.wait(5)
+        return ["new"], True
+    for _ in range(3):
+        cache.get_or_fetch("key", Fetcher(["new"]), refresh=refresh)
+    release.set()
+    assert len(calls) == 1
+
+def test_expired_entry_is_fetched_again(backend):
+    cache = _cache(25, backend)
+    fetch = Fetcher(["new"])
+    assert cache.get_or_fetch("key", fetch) == ["new"]
+    assert fetch.calls == 1
+    assert cache.get("key") == ["new"]
+    assert cache.stats()["misses"] == 1
+
+def test_incomplete_results_are_not_cached():
+    cache = SearchCache(MemoryBackend(), ttl=10, stale_ttl=10)
+    assert cache.get_or_fetch("key", Fetcher(["partial"], complete=False)) == ["partial"]
+    assert cache.get("key") is None
+
+def test_memory_backend_evicts_least_recently_used():
+    backend = MemoryBackend(max_entries=2)
+    for key in ("a", "b"):
+        backend.set(key, [key], time.time())
+    backend.get("a")
+    backend.set("c", ["c"], time.time())
+    assert backend.get("b") is None and backend.get("a") is not None
+
+def test_quantize_time():
+    assert quantize_time("19:44") == "19:30"
+    assert quantize_time("") == ""
+
+def test_from_spec():
+    assert from_spec("off") is None
+    assert isinstance(from_spec("memory").backend, MemoryBackend)
+    with pytest.raises(ValueError):
+        from_spec("redis://localhost")
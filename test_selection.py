@@ -0,0 +1,100 @@
+"""Offline tests for the selection engine: alias table frequencies, distance filtering and proximity weighting."""
+
+import math
+import random
+import pytest
+import selection
+from selection import AliasTable, SelectionEngine
+from venue import Venue
+
+ORIGIN = {"latitude": 40.71427, "longitude": -74.00597}
+METERS_PER_DEGREE = 111195
+
+def _probabilities(table:AliasTable) -> list[float]:
+    """Exact probability of each outcome implied by the table's columns."""
+    found = [0.0] * table.size
+    for index in range(table.size):
+        found[index] += table._probability[index] / table.size
+        found[table._alias[index]] += (1 - table._probability[index]) / table.size
+    return found
+
+@pytest.mark.parametrize("weights", [[1], [1, 1, 1, 1], [1, 2, 3, 4], [0, 5, 0, 1], [1e-9, 1, 1e6],
+                                     [random.Random(seed).random() for seed in range(50)]])
+def test_alias_table_probabilities(weights):
+    total = sum(weights)
+    expected = [weight / total for weight in weights]
+    assert _probabilities(AliasTable(weights)) == pytest.approx(expected, abs=1e-12)
+
+def test_alias_table_frequencies():
+    weights = [1, 2, 3, 4, 0, 10]
+    table = AliasTable(weights)
+    rng = random.Random(7)
+    draws = 200000
+    counts = [0] * len(weights)
+    for _ in range(draws):
+        counts[table.draw(rng)] += 1
+    assert counts[4] == 0
+    for count, weight in zip(counts, weights):
+        expected = draws * weight / sum(weights)
+        # Well within five standard deviations of the binomial count
+        assert abs(count - expected) <= 5 * math.sqrt(expected + 1)
+
+@pytest.mark.parametrize("weights", [[], [0, 0], [0.0]])
+def test_alias_table_needs_a_positive_weight(weights):
+    with pytest.raises(ValueError):
+        AliasTable(weights)
+
+def _venues() -> list[Venue]:
+    # One venue at the origin, then 1, 2 and 4 km north, and one without coordinates
+    rows = [[index, f"Venue {index}", "korean", ORIGIN["latitude"] + km * 1000 / METERS_PER_DEGREE, ORIGIN["longitude"]]
+            for index, km in enumerate((0, 1, 2, 4))]
+    rows.append([9, "Nowhere", "korean", None, None])
+    return [Venue.from_row(row) for row in rows]
+
+@pytest.fixture(params=["numpy", "python"])
+def backend(request, monkeypatch):
+    """Runs a test with NumPy distances, where installed, and with the pure Python fallback."""
+    if request.param == "numpy":
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(selection, "_numpy", False)
+    return request.param
+
+def test_numpy_is_not_loaded_without_distances(monkeypatch):
+    monkeypatch.setattr(selection, "_numpy", None)
+    SelectionEngine(_venues(), ORIGIN).draw()
+    assert selection._numpy is None
+
+def test_unweighted_engine_keeps_every_venue(backend):
+    engine = SelectionEngine(_venues(), ORIGIN)
+    assert len(engine) == 5
+    assert engine.distances == []
+
+def test_max_distance_drops_far_and_unplaced_venues(backend):
+    engine = SelectionEngine(_venues(), ORIGIN, max_distance=2500)
+    assert [venue.id for venue in engine.venues] == [0, 1, 2]
+    assert engine.distances == pytest.approx([0, 1000, 2000], abs=5)
+
+def test_half_distance_weights_by_proximity(backend):
+    engine = SelectionEngine(_venues(), ORIGIN, half_distance=1000)
+    rng = random.Random(3)
+    draws = 100000
+    counts = {}
+    for _ in range(draws):
+        venue = engine.draw(rng)
+        counts[venue.id] = counts.get(venue.id, 0) + 1
+    # Weights 1, 1/2, 1/4 and 1/16, and none for the venue without coordinates
+    weights = {0: 1, 1: 0.5, 2: 0.25, 3: 1 / 16}
+    assert 9 not in counts
+    for venue_id, weight in weights.items():
+        expected = draws * weight / sum(weights.values())
+        assert abs(counts.get(venue_id, 0) - expected) <= 5 * math.sqrt(expected)
+
+def test_underflowing_weights_pick_uniformly(backend):
+    engine = SelectionEngine(_venues()[1:4], ORIGIN, half_distance=1e-3)
+    assert engine._table is None
+    assert engine.draw(random.Random(1)) in engine.venues
+
+def test_empty_engine_draws_nothing(backend):
+    assert SelectionEngine([], ORIGIN, max_distance=100).draw() is None
+    assert SelectionEngine(_venues(), ORIGIN, max_distance=1).venues[0].id == 0
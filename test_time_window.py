@@ -0,0 +1,68 @@
+"""Offline tests for spin times, time windows and party size ranges."""
+
+import json
+import pytest
+import retrieve
+from lambda_function import lambda_handler, _parse_spin, InvalidSpin
+
+@pytest.mark.parametrize("time, expected", [
+    ("19:00", "19:00"),
+    ("19:00:00", "19:00"),
+    (" 7:05 ", "07:05"),
+    ("", ""),
+    (None, ""),
+    ("18:30-21:00", "18:30-21:00"),
+    ("18:30:00 - 21:00:00", "18:30-21:00"),
+])
+def test_normalize_time(time, expected):
+    assert retrieve.normalize_time(time) == expected
+
+@pytest.mark.parametrize("time", ["7pm", "24:00", "19:60", "19", "19:00:75", "21:00-18:00", "18:00-"])
+def test_normalize_time_rejects(time):
+    with pytest.raises(ValueError):
+        retrieve.normalize_time(time)
+
+def test_parse_time_window():
+    assert retrieve.parse_time_window("") is None
+    assert retrieve.parse_time_window("19:00") is None
+    assert retrieve.parse_time_window("18:30-21:00") == (18 * 60 + 30, 21 * 60)
+
+def test_parse_spin_normalizes_time():
+    assert _parse_spin({"time": "19:00:00"})["time"] == "19:00"
+    assert _parse_spin({})["time"] == ""
+    with pytest.raises(InvalidSpin):
+        _parse_spin({"time": "7pm"})
+
+@pytest.mark.parametrize("event", [
+    {"time": "7pm"},
+    {"time": "19:00", "party_size": "4-2"},
+    {"httpMethod": "POST", "path": "/restaurant", "body": json.dumps({"time": "25:00"})},
+])
+def test_malformed_spin_is_a_bad_request(event):
+    response = lambda_handler(event, None)
+    assert response["statusCode"] == 400
+    assert json.loads(response["body"])["success"] is False
+
+def test_party_sizes():
+    assert retrieve.parse_party_sizes(2) == [2]
+    assert retrieve.parse_party_sizes(" 2 - 4 ") == [2, 3, 4]
+    assert retrieve.normalize_party_size("3") == 3
+    assert retrieve.normalize_party_size("2-4") == "2-4"
+    for party_size in ("0", "4-2", "1-20", "two"):
+        with pytest.raises(ValueError):
+            retrieve.parse_party_sizes(party_size)
+
+@pytest.mark.parametrize("start, end", [(18 * 60, 18 * 60), (18 * 60, 21 * 60), (19 * 60 + 30, 20 * 60 + 30),
+                                        (11 * 60 + 15, 22 * 60 + 45), (0, 24 * 60 - 1), (23 * 60, 24 * 60 - 1)])
+def test_slot_anchors_cover_the_window(start, end):
+    span, grid = 120, 30
+    anchors = retrieve.slot_anchors(start, end, span, grid)
+    assert anchors == sorted(anchors)
+    assert all(anchor % grid == 0 for anchor in anchors)
+    assert all(any(abs(minute - anchor) <= span / 2 for anchor in anchors) for minute in range(start, end + 1))
+    assert len(anchors) <= (end - start) // span + 1
+
+def test_overlapping_windows_share_a_search():
+    # 19:00-20:00 and 19:30-20:30 both fit the search at 20:00
+    assert retrieve.slot_anchors(19 * 60, 20 * 60, 120, 30) == [20 * 60]
+    assert retrieve.slot_anchors(19 * 60 + 30, 20 * 60 + 30, 120, 30) == [20 * 60]
@@ -0,0 +1,60 @@
+"""Offline tests for the streaming venue search decoder: rows must match decoding the whole page with json.loads,
+however the body is split into chunks."""
+
+import json
+import pytest
+import fake_resy
+from venue import venue_row
+from venuesearch import parse_venuesearch
+
+CHUNK_SIZES = (3, 7, 64, 1000, 4096, 1 << 20)
+
+def _page(hits:int = 4, detail:bool = True) -> dict:
+    fixtures = fake_resy.synthetic_fixtures(["Korean"], min_hits=hits, max_hits=hits, detail=detail)
+    page_hits = fixtures["cuisines"]["Korean"]
+    # Multibyte characters split across chunks must be decoded whole
+    page_hits[0]["_highlightResult"]["name"]["value"] = "Café <em>Seoul</em> 東京 ☕"
+    return {"search": {"hits": page_hits, "nbHits": 42}, "meta": {"total": 40}}
+
+def _chunks(body:bytes, size:int) -> list[bytes]:
+    return [body[start:start + size] for start in range(0, len(body), size)]
+
+@pytest.mark.parametrize("size", CHUNK_SIZES)
+@pytest.mark.parametrize("indent", (None, 2))
+@pytest.mark.parametrize("slots", (False, True))
+def test_rows_match_json_loads(size, indent, slots):
+    body = json.dumps(_page(), indent=indent, ensure_ascii=False).encode()
+    expected = [venue_row(hit, slots) for hit in json.loads(body)["search"]["hits"]]
+
+    rows, total = parse_venuesearch(_chunks(body, size), slots)
+
+    assert rows == expected
+    assert total == 42
+
+def test_single_byte_chunks():
+    # Hits without their details, since a value is decoded again after every chunk until it is complete
+    body = json.dumps(_page(detail=False), ensure_ascii=False).encode()
+    rows, total = parse_venuesearch(_chunks(body, 1), True)
+    assert rows == [venue_row(hit, True) for hit in json.loads(body)["search"]["hits"]]
+
+def test_text_chunks():
+    body = json.dumps(_page())
+    rows, total = parse_venuesearch(body[start:start + 5] for start in range(0, len(body), 5))
+    assert rows == [venue_row(hit) for hit in json.loads(body)["search"]["hits"]]
+
+def test_total_falls_back_to_meta():
+    page = _page(2)
+    del page["search"]["nbHits"]
+    # meta before search, as the order of keys is not guaranteed
+    body = json.dumps({"meta": page["meta"], "search": page["search"]}).encode()
+    assert parse_venuesearch(_chunks(body, 3))[1] == 40
+
+def test_empty_hits():
+    body = b'{"search": {"hits": [], "nbHits": 0}}'
+    for size in CHUNK_SIZES:
+        assert parse_venuesearch(_chunks(body, size)) == ([], 0)
+
+@pytest.mark.parametrize("body", (b'{"meta": {"total": 3}}', b'{"search": {"hits": [', b"", b"[]"))
+def test_malformed_bodies_raise(body):
+    with pytest.raises(ValueError):
+        parse_venuesearch(_chunks(body, 4))
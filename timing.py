@@ -0,0 +1,139 @@
+"""Lightweight per-stage latency instrumentation for the retrieval pipeline. A StageTimer accumulates the duration
+and call count of each named stage plus free-form counters, and renders them as a JSON report, a Server-Timing header,
+or a CloudWatch Embedded Metric Format record. Timing costs two perf_counter calls per stage, so it is cheap enough to
+leave on in production; RESY_TIMING_SAMPLE_RATE limits it to a fraction of invocations."""
+
+import os
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+SAMPLE_RATE = float(os.environ.get("RESY_TIMING_SAMPLE_RATE", 1.0))
+METRICS_NAMESPACE = os.environ.get("RESY_METRICS_NAMESPACE", "ResyRoulette")
+
+class StageTimer(object):
+    """Collects per-stage durations and counters for one invocation. Safe to use from the worker threads that run
+    concurrent searches."""
+
+    enabled = True
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._stages = {}
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name:str):
+        """Times the enclosed block under the given stage name.
+
+        :param str name: stage name, e.g. "get_location"
+        """
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def add(self, name:str, seconds:float):
+        """Records one call of a stage.
+
+        :param str name: stage name
+        :param float seconds: duration of the call
+        """
+        with self._lock:
+            stage = self._stages.get(name)
+            if stage is None:
+                self._stages[name] = [seconds, 1, seconds]
+            else:
+                stage[0] += seconds
+                stage[1] += 1
+                if seconds > stage[2]:
+                    stage[2] = seconds
+
+    def count(self, name:str, amount:int = 1):
+        """Increments a counter.
+
+        :param str name: counter name, e.g. "upstream_calls"
+        :param int amount: amount to add
+        """
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def report(self) -> dict:
+        """Returns the timings collected so far. Durations of concurrent stages overlap, so stage totals can exceed
+        the total.
+
+        :return dict: total milliseconds, per-stage total/max milliseconds and call counts, and counters
+        """
+        with self._lock:
+            stages = {name: {"ms": round(total * 1000, 2), "count": calls, "max_ms": round(longest * 1000, 2)}
+                      for name, (total, calls, longest) in self._stages.items()}
+            counters = dict(self._counters)
+        return {"total_ms": round((time.perf_counter() - self.started) * 1000, 2),
+                "stages": stages,
+                "counters": counters}
+
+    def server_timing(self) -> str:
+        """Renders the stage totals as a Server-Timing header value.
+
+        :return str: header value, e.g. "get_location;dur=0.4, upstream_search;dur=312.9"
+        """
+        report = self.report()
+        entries = [f"{name};dur={stage['ms']}" for name, stage in report["stages"].items()]
+        entries.append(f"total;dur={report['total_ms']}")
+        return ", ".join(entries)
+
+    def emf(self, dimensions:dict = None) -> dict:
+        """Renders the report as a CloudWatch Embedded Metric Format record. Logging the record as a single JSON line
+        from Lambda publishes the stage durations and counters as metrics.
+
+        :param dict dimensions: metric dimensions, e.g. {"Endpoint": "/restaurant"}
+        :return dict: EMF record
+        """
+        dimensions = dimensions or {}
+        report = self.report()
+        record = dict(dimensions)
+        metrics = [{"Name": "total", "Unit": "Milliseconds"}]
+        record["total"] = report["total_ms"]
+        for name, stage in report["stages"].items():
+            record[name] = stage["ms"]
+            metrics.append({"Name": name, "Unit": "Milliseconds"})
+        for name, value in report["counters"].items():
+            record[name] = value
+            metrics.append({"Name": name, "Unit": "Count"})
+        record["_aws"] = {"Timestamp": int(time.time() * 1000),
+                          "CloudWatchMetrics": [{"Namespace": METRICS_NAMESPACE,
+                                                 "Dimensions": [list(dimensions.keys())],
+                                                 "Metrics": metrics}]}
+        return record
+
+class NullTimer(object):
+    """Timer used for invocations that are not sampled. Every method is a no-op."""
+
+    enabled = False
+
+    @contextmanager
+    def stage(self, name:str):
+        yield
+
+    def add(self, name:str, seconds:float):
+        pass
+
+    def count(self, name:str, amount:int = 1):
+        pass
+
+NULL_TIMER = NullTimer()
+
+def start_timer(sample_rate:float = None):
+    """Returns a new StageTimer for a sampled invocation, or the shared NullTimer otherwise.
+
+    :param float sample_rate: fraction of invocations to time, defaults to RESY_TIMING_SAMPLE_RATE
+    :return StageTimer | NullTimer: timer for the invocation
+    """
+    if sample_rate is None:
+        sample_rate = SAMPLE_RATE
+    if sample_rate >= 1 or random.random() < sample_rate:
+        return StageTimer()
+    return NULL_TIMER
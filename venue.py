@@ -0,0 +1,148 @@
+"""Compact venue records for search results. Each Resy hit is reduced to a row of [id, name, cuisine, latitude,
+longitude] as soon as it is parsed, with its bookable slots appended for time window searches; rows are what the
+search cache stores, and Venue objects built from them are what ResyRetriever returns. Cuisine strings are interned
+so a spin holds one copy of each, and venues are deduplicated by their Resy id across cuisines."""
+
+import re
+import sys
+import html
+
+# Markup Resy wraps around matched terms in _highlightResult values, e.g. <em>Sushi</em> Nakazawa
+_HIGHLIGHT_TAG = re.compile(r"<[^>]*>")
+
+def decode_highlight(value:str) -> str:
+    """Decodes a highlighted Resy field to plain text by dropping the highlight tags and unescaping HTML entities.
+
+    :param str value: highlighted value, e.g. "<em>Joe</em>&#x27;s Pizza"
+    :return str: plain text, e.g. "Joe's Pizza"
+    """
+    if "<" in value:
+        value = _HIGHLIGHT_TAG.sub("", value)
+    if "&" in value:
+        value = html.unescape(value)
+    return value
+
+def hit_slots(hit:dict) -> list:
+    """Reads the bookable slots of a raw venue search hit.
+
+    :param dict hit: hit from a venue search response
+    :return list[list] | None: [time, min party size, max party size] per slot, see parse_slots, or None if the hit
+        carries no availability
+    """
+    availability = hit.get('availability')
+    if not isinstance(availability, dict):
+        return None
+    return parse_slots(availability.get('slots'))
+
+def parse_slots(raw_slots:list) -> list:
+    """Reduces Resy slots, as found in venue search hits and availability responses, to their time and party sizes.
+
+    :param list[dict] raw_slots: slots with date.start and size
+    :return list[list]: [time, min party size, max party size] per slot, time as HH:MM and sizes None if not reported
+    """
+    slots = []
+    for slot in raw_slots or ():
+        start = (slot.get('date') or {}).get('start') or ''
+        # Slot starts look like "2025-06-01 19:30:00"
+        time = start.split(' ')[-1][:5]
+        if len(time) == 5:
+            size = slot.get('size') or {}
+            slots.append([time, size.get('min'), size.get('max')])
+    return slots
+
+def venue_row(hit:dict, slots:bool = False) -> list:
+    """Reduces a raw venue search hit to the fields a spin uses.
+
+    :param dict hit: hit from a venue search response
+    :param bool slots: also keep the hit's bookable slots, see hit_slots
+    :return list: [id, name, cuisine, latitude, longitude], and the slots if asked for
+    """
+    highlight = hit['_highlightResult']
+    venue_id = (hit.get('id') or {}).get('resy')
+    geoloc = hit['_geoloc']
+    row = [venue_id,
+           decode_highlight(highlight['name']['value']),
+           highlight['cuisine'][0]['value'].lower().strip(),
+           geoloc['lat'],
+           geoloc['lng']]
+    if slots:
+        row.append(hit_slots(hit))
+    return row
+
+class Venue(object):
+    """A restaurant found by a venue search.
+
+    Attributes:
+        id (int): Resy venue id, or None if the hit did not carry one.
+        name (str): Venue name with highlight markup removed.
+        cuisine (str): Lowercased, interned cuisine.
+        latitude (float): Venue latitude.
+        longitude (float): Venue longitude.
+        slots (list): Bookable slots as found by a time window search, [time, min party size, max party size] each,
+            and once matched against the window, {"time", "party_sizes"} dicts. None outside window searches.
+    """
+
+    __slots__ = ("id", "name", "cuisine", "latitude", "longitude", "slots")
+
+    def __init__(self, id, name:str, cuisine:str, latitude:float, longitude:float, slots:list = None):
+        self.id = id
+        self.name = name
+        self.cuisine = sys.intern(cuisine)
+        self.latitude = latitude
+        self.longitude = longitude
+        self.slots = slots
+
+    @classmethod
+    def from_row(cls, row:list) -> "Venue":
+        """Builds a venue from a row produced by venue_row."""
+        return cls(*row)
+
+    def to_row(self) -> list:
+        """Returns the venue as a [id, name, cuisine, latitude, longitude] row, with its slots if it has any."""
+        row = [self.id, self.name, self.cuisine, self.latitude, self.longitude]
+        if self.slots is not None:
+            row.append(self.slots)
+        return row
+
+    def key(self):
+        """Returns the identity used for deduplication: the Resy id, or the name and position without one."""
+        if self.id is not None:
+            return self.id
+        return (self.name, self.latitude, self.longitude)
+
+    def to_dict(self) -> dict:
+        """Returns the venue in the JSON shape of the restaurant in lambda_handler responses.
+
+        :return dict: name, cuisine, location with lat and lng, and the matched slots of a time window search
+        """
+        venue = {'name': self.name,
+                 'cuisine': self.cuisine,
+                 'location': {'lat': self.latitude, 'lng': self.longitude}}
+        if self.slots is not None:
+            venue['slots'] = self.slots
+        return venue
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Venue) and self.key() == other.key()
+
+    def __hash__(self) -> int:
+        return hash(self.key())
+
+    def __repr__(self) -> str:
+        return f"Venue({self.id!r}, {self.name!r}, {self.cuisine!r})"
+
+def dedupe(venues) -> list:
+    """Removes repeated venues, keeping the first occurrence, so a venue matching several cuisines is not more likely
+    to be picked.
+
+    :param Iterable[Venue] venues: venues in search order
+    :return list[Venue]: unique venues in search order
+    """
+    seen = set()
+    unique = []
+    for venue in venues:
+        key = venue.key()
+        if key not in seen:
+            seen.add(key)
+            unique.append(venue)
+    return unique
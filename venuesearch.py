@@ -0,0 +1,154 @@
+"""Lean decoder for venue search responses. A Resy venue search page is a large JSON document, and each hit carries
+many fields (images, copy, collections, bookable slots) of which a spin uses only the id, name, cuisine and position.
+Decoding the whole page with json.loads builds every one of those objects at once, about five times the size of the
+body, before any of them is dropped.
+
+The decoder here reads the body in chunks and walks the page envelope with a small pull parser. Each hit is decoded on
+its own with json's raw_decode and reduced to a venue row at once, so only one hit's objects are alive at a time and
+peak memory is a chunk of text plus one hit, whatever the page size. Walking each hit field by field in Python to
+decode fewer fields measured several times slower than letting the C decoder build and drop the one hit."""
+
+import re
+import json
+import codecs
+from venue import venue_row
+
+CHUNK_SIZE = 64 * 1024
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Characters that can follow a complete value
+_DELIMITERS = frozenset(",:]} \t\n\r")
+_decoder = json.JSONDecoder()
+
+class _Reader(object):
+    """Pull parser over a JSON document arriving in chunks. The consumed prefix of the buffer is dropped as more text
+    is read, so only the part being parsed is held."""
+
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._utf8 = codecs.getincrementaldecoder("utf-8")()
+        self._eof = False
+        self.buffer = ""
+        self.pos = 0
+
+    def _fill(self) -> bool:
+        """Appends the next chunk to the buffer, dropping what has been consumed.
+
+        :return bool: False once the body is exhausted
+        """
+        if self._eof:
+            return False
+        text = ""
+        while not text:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                self._eof = True
+                text = self._utf8.decode(b"", final=True)
+                if not text:
+                    return False
+                break
+            text = self._utf8.decode(chunk) if isinstance(chunk, bytes) else chunk
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self) -> str:
+        """Skips whitespace and returns the next character without consuming it, "" at the end of the body."""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, character:str):
+        found = self.peek()
+        if found != character:
+            raise ValueError(f"Expected {character!r} but found {found or 'end of body'!r} in venue search response")
+        self.pos += 1
+
+    def value(self):
+        """Decodes the next value. A value not followed by a delimiter may be cut off, e.g. a number split across
+        chunks, so it is decoded again once more of the body has been read."""
+        self.peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            if (end < len(self.buffer) and self.buffer[end] in _DELIMITERS) or not self._fill():
+                self.pos = end
+                return value
+
+    def skip(self):
+        """Consumes the next value, keeping nothing of it."""
+        self.value()
+
+    def members(self):
+        """Iterates over the keys of the next object. The caller consumes each member's value before the next key."""
+        self.expect("{")
+        if self.peek() == "}":
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(":")
+            yield key
+            separator = self.peek()
+            self.pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' but found {separator!r} in venue search response")
+
+    def elements(self):
+        """Iterates over the next array. The caller consumes each element before the next one."""
+        self.expect("[")
+        if self.peek() == "]":
+            self.pos += 1
+            return
+        while True:
+            yield
+            separator = self.peek()
+            self.pos += 1
+            if separator == "]":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or ']' but found {separator!r} in venue search response")
+
+def parse_venuesearch(chunks, slots:bool = False) -> tuple[list[list], int]:
+    """Decodes a venue search response into venue rows without building the full document.
+
+    :param Iterable[bytes | str] chunks: the response body in chunks, e.g. Response.iter_content()
+    :param bool slots: keep each hit's bookable slots in its row, see venue.venue_row
+    :raises ValueError: if the body is not valid JSON or has no search.hits
+    :raises KeyError: if a hit lacks a field venue_row needs
+    :return tuple[list[list], int | None]: venue rows, see venue.venue_row, and the total hit count if reported
+    """
+    reader = _Reader(chunks)
+    rows = None
+    total = None
+    meta_total = None
+    for key in reader.members():
+        if key == "search":
+            for field in reader.members():
+                if field == "hits":
+                    rows = []
+                    for _ in reader.elements():
+                        rows.append(venue_row(reader.value(), slots))
+                elif field == "nbHits":
+                    total = reader.value()
+                else:
+                    reader.skip()
+        elif key == "meta":
+            meta = reader.value()
+            meta_total = meta.get("total") if isinstance(meta, dict) else None
+        else:
+            reader.skip()
+    if rows is None:
+        raise ValueError("Venue search response has no search.hits")
+    if total is None:
+        total = meta_total
+    return rows, int(total) if total is not None else None
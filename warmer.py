@@ -0,0 +1,246 @@
+"""Background cache warmer. Fetches the venue searches of the most requested combinations of location, date, party
+size and cuisine into the search cache ahead of demand, so interactive spins for them are served from warm data.
+Searches run at background priority on the upstream scheduler, and each run stops at a budget of upstream calls.
+
+The matrix is configured through RESY_WARM_MATRIX, a JSON object or the path of a JSON file, with any of the keys
+of DEFAULT_MATRIX. Dates are "today", "tomorrow", a weekday name for its next occurrence, "+N" for N days ahead,
+or YYYY-MM-DD. Times are HH:MM and should be the starts of the slot buckets spins fall in (RESY_CACHE_SLOT_MINUTES),
+since the time is part of the cache key. Runs are triggered by a scheduled event to the Lambda handler, or from the
+command line:
+
+    python warmer.py --budget 300
+
+The warmer fills the process's RESY_SEARCH_CACHE, so it only helps other processes when that cache is shared, e.g.
+"sqlite:/var/cache/resy_search.db" for the Flask workers on one machine. A memory cache never is, and on Lambda
+neither is a SQLite file under /tmp, which belongs to a single container; there the cache must live on shared storage
+such as an EFS mount. Runs against a cache that is not shared are refused, see shared_cache."""
+
+import os
+import json
+import time
+import argparse
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+import geocode
+from retrieve import ResyRetriever
+from scheduler import BACKGROUND
+from search_cache import get_search_cache, SQLiteBackend
+from timing import StageTimer
+
+DEFAULT_MATRIX = {
+    "locations": ["New York City, New York", "Brooklyn, New York", "Los Angeles, California",
+                  "San Francisco, California", "Chicago, Illinois"],
+    "dates": ["today", "tomorrow", "friday", "saturday"],
+    "party_sizes": [2, 3, 4],
+    # Dinner slot buckets, as spins typed into the web form fall in
+    "times": ["18:00", "18:30", "19:00", "19:30", "20:00", "20:30"],
+    "cuisines": list(ResyRetriever.applicable_cuisine_list),
+}
+
+DEFAULT_BUDGET = int(os.environ.get("RESY_WARM_BUDGET", 300))
+DEFAULT_WORKERS = int(os.environ.get("RESY_WARM_WORKERS", 4))
+# Cached searches with less freshness left than this are fetched again
+DEFAULT_REFRESH_WITHIN = float(os.environ.get("RESY_WARM_REFRESH_WITHIN", 60))
+
+WEEKDAYS = ("monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday")
+
+def shared_cache(search_cache) -> bool:
+    """Whether warming a search cache helps other processes: the cache is a SQLite file, and on Lambda one outside
+    /tmp, which is private to each container.
+
+    :param SearchCache search_cache: cache to warm, or None
+    :return bool: True if other processes read the cache
+    """
+    backend = getattr(search_cache, "backend", None)
+    if not isinstance(backend, SQLiteBackend):
+        return False
+    if os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+        return not os.path.abspath(backend.path).startswith("/tmp/")
+    return True
+
+def load_matrix(spec:str = None) -> dict:
+    """Returns the warm matrix, DEFAULT_MATRIX overridden by the keys given in spec.
+
+    :param str spec: JSON object or path to a JSON file, defaults to RESY_WARM_MATRIX
+    :return dict: matrix with locations, dates, party_sizes, times and cuisines
+    """
+    spec = os.environ.get("RESY_WARM_MATRIX", "") if spec is None else spec
+    overrides = {}
+    if spec.strip().startswith("{"):
+        overrides = json.loads(spec)
+    elif spec.strip():
+        with open(spec.strip()) as f:
+            overrides = json.load(f)
+    return _merge(DEFAULT_MATRIX, overrides)
+
+def _merge(matrix:dict, overrides:dict) -> dict:
+    unknown = set(overrides) - set(DEFAULT_MATRIX)
+    if unknown:
+        raise ValueError(f"Unknown warm matrix keys: {', '.join(sorted(unknown))}")
+    merged = dict(matrix)
+    merged.update(overrides)
+    return merged
+
+def resolve_dates(specs:list, today:date = None) -> list[str]:
+    """Resolves relative date specs to YYYY-MM-DD dates, in order and without repeats.
+
+    :param list[str] specs: "today", "tomorrow", weekday names, "+N" or YYYY-MM-DD dates
+    :param date today: date the specs are relative to, defaults to today
+    :raises ValueError: if a spec is not recognised
+    :return list[str]: dates in YYYY-MM-DD format
+    """
+    today = today or datetime.today().date()
+    dates = []
+    for spec in specs:
+        name = str(spec).strip().lower()
+        if name == "today":
+            day = today
+        elif name == "tomorrow":
+            day = today + timedelta(days=1)
+        elif name in WEEKDAYS:
+            day = today + timedelta(days=(WEEKDAYS.index(name) - today.weekday()) % 7)
+        elif name.startswith("+"):
+            day = today + timedelta(days=int(name[1:]))
+        else:
+            day = datetime.strptime(name, "%Y-%m-%d").date()
+        if day.isoformat() not in dates:
+            dates.append(day.isoformat())
+    return dates
+
+class CacheWarmer(object):
+    """Warms the search cache for every combination in a matrix, most urgent dates first, within a budget.
+
+    Attributes:
+        matrix (dict): Locations, dates, party sizes, times and cuisines to warm.
+        budget (int): Most upstream calls made per run.
+        refresh_within (float): Seconds of freshness below which a cached search is fetched again.
+        workers (int): Searches run concurrently.
+    """
+
+    def __init__(self,
+                 matrix:dict = None,
+                 budget:int = DEFAULT_BUDGET,
+                 refresh_within:float = DEFAULT_REFRESH_WITHIN,
+                 workers:int = DEFAULT_WORKERS,
+                 search_cache = None):
+        """Constructor Method
+
+        Args:
+            matrix (dict, optional): Warm matrix. Defaults to the one configured by RESY_WARM_MATRIX.
+            budget (int, optional): Most upstream calls made per run. Defaults to RESY_WARM_BUDGET.
+            refresh_within (float, optional): Freshness below which cached searches are refetched. Defaults to 60.
+            workers (int, optional): Searches run concurrently. Defaults to 4.
+            search_cache (SearchCache, optional): Cache to warm. Defaults to the shared search cache.
+        """
+        self.matrix = matrix if matrix is not None else load_matrix()
+        self.budget = budget
+        self.refresh_within = refresh_within
+        self.workers = max(1, int(workers))
+        self.search_cache = search_cache if search_cache is not None else get_search_cache()
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._used = 0
+        self._reserved = 0
+
+    def _reserve(self, calls:int) -> bool:
+        """Sets aside the most calls a search can make, refusing once the budget cannot cover it."""
+        with self._lock:
+            if self._used + self._reserved + calls > self.budget:
+                return False
+            self._reserved += calls
+            return True
+
+    def _settle(self, reserved:int, used:int):
+        with self._lock:
+            self._reserved -= reserved
+            self._used += used
+
+    def _searches(self):
+        """Yields (date, location, party size, time, cuisine) in warming order: the nearest dates first, then the
+        matrix order of the other dimensions."""
+        for day in resolve_dates(self.matrix["dates"]):
+            for location in self.matrix["locations"]:
+                for party_size in self.matrix["party_sizes"]:
+                    for time_filter in self.matrix["times"]:
+                        for cuisine in self.matrix["cuisines"]:
+                            yield day, location, int(party_size), time_filter, cuisine
+
+    def _warm(self, search:tuple) -> str:
+        """Warms one search, returning "warmed", "skipped", "failed" or "over_budget"."""
+        day, location, party_size, time_filter, cuisine = search
+        timer = StageTimer()
+        retriever = ResyRetriever(date=day, time=time_filter, location=geocode.get_location(location),
+                                  party_size=party_size, cuisine_list=[cuisine], search_cache=self.search_cache,
+                                  timer=timer, priority=BACKGROUND)
+        freshness = self.search_cache.freshness(retriever.cache_key(cuisine))
+        if freshness is not None and freshness > self.refresh_within:
+            return "skipped"
+        if not self._reserve(retriever.max_pages):
+            return "over_budget"
+        try:
+            warmed = retriever.warm_cuisine(cuisine, self.refresh_within)
+        except Exception as e:
+            self.logger.error("Warming %s failed: %s", search, str(e))
+            warmed = False
+        finally:
+            self._settle(retriever.max_pages, timer.report()["counters"].get("upstream_calls", 0))
+        if warmed is None:
+            return "skipped"
+        return "warmed" if warmed else "failed"
+
+    def run(self) -> dict:
+        """Warms the matrix until every search is warm or the budget is spent.
+
+        :raises ValueError: if there is no search cache to warm
+        :return dict: searches warmed, already warm, failed and left over budget, upstream calls used and run time
+        """
+        if self.search_cache is None:
+            raise ValueError("The search cache is disabled, set RESY_SEARCH_CACHE to warm it")
+
+        started = time.perf_counter()
+        outcomes = {"warmed": 0, "skipped": 0, "failed": 0, "over_budget": 0}
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="cache-warmer") as executor:
+            for outcome in executor.map(self._warm, self._searches()):
+                outcomes[outcome] += 1
+
+        report = dict(outcomes)
+        report.update({"upstream_calls": self._used, "budget": self.budget,
+                       "budget_exhausted": outcomes["over_budget"] > 0,
+                       "seconds": round(time.perf_counter() - started, 3)})
+        self.logger.info("Cache warm run: %s", report)
+        return report
+
+def warm(overrides:dict = None) -> dict:
+    """Runs the warmer for a scheduled event, with optional overrides of the configured matrix and budget.
+
+    :param dict overrides: matrix keys to override, plus optional "budget" and "refresh_within"
+    :return dict: payload with success and the run's report, or an error if the search cache is not shared
+    """
+    if not shared_cache(get_search_cache()):
+        # Each container would warm its own cache, spending Resy calls that no spin benefits from
+        logging.getLogger(__name__).warning("Skipping cache warm run, RESY_SEARCH_CACHE is not shared")
+        return {"success": False,
+                "error": "RESY_SEARCH_CACHE must be a sqlite:<path> cache on shared storage to warm it"}
+    overrides = dict(overrides or {})
+    budget = int(overrides.pop("budget", DEFAULT_BUDGET))
+    refresh_within = float(overrides.pop("refresh_within", DEFAULT_REFRESH_WITHIN))
+    warmer = CacheWarmer(_merge(load_matrix(), overrides), budget=budget, refresh_within=refresh_within)
+    return {"success": True, "warm": warmer.run()}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Warm the Resy search cache for popular searches")
+    parser.add_argument("--matrix", help="JSON object or file overriding the warm matrix, defaults to RESY_WARM_MATRIX")
+    parser.add_argument("--budget", type=int, default=DEFAULT_BUDGET, help="most upstream calls made this run")
+    parser.add_argument("--refresh-within", type=float, default=DEFAULT_REFRESH_WITHIN,
+                        help="refetch cached searches with less than this many seconds of freshness left")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="searches run concurrently")
+    args = parser.parse_args()
+
+    if not shared_cache(get_search_cache()):
+        parser.error("RESY_SEARCH_CACHE is not shared with other processes, set it to a shared sqlite:<path> cache")
+    warmer = CacheWarmer(load_matrix(args.matrix), budget=args.budget, refresh_within=args.refresh_within,
+                         workers=args.workers)
+    print(json.dumps(warmer.run(), indent=2))